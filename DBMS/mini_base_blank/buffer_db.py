@@ -0,0 +1,397 @@
+# ------------------------------------------------
+# buffer_db.py
+# ------------------------------------------------
+# Buffer management module
+# All the 4KB blocks of .dat/.ind/.hash files are read and written through
+# one process-wide buffer pool, so hot blocks are served from memory
+# ------------------------------------------------
+# every frame caches one block and is identified by (file path, block_id)
+# a pinned frame is never evicted, the victim is chosen by the CLOCK algorithm
+# dirty frames are written back when evicted or when the file is flushed
+# read only scans can use view_block(), which serves blocks that are not cached
+# in the pool straight from a read only memory map of the file, without copies
+# ------------------------------------------------
+
+import os
+import mmap
+import atexit
+from common_db import BLOCK_SIZE
+
+DEFAULT_FRAME_NUM = 256  # default frame budget, 256 * 4KB = 1MB
+USE_MMAP = True          # serve clean blocks of view_block() from a memory map
+
+# ------------------------------------------------
+# one frame of the buffer pool
+# ------------------------------------------------
+class Frame(object):
+    def __init__(self):
+        self.key = None                  # (file path, block_id) of the cached block
+        self.data = bytearray(BLOCK_SIZE)
+        self.pin_count = 0
+        self.dirty = False
+        self.referenced = False          # reference bit of the CLOCK algorithm
+
+# ------------------------------------------------
+# Buffer manager class
+# Functionality:
+#   - pin/unpin blocks of any file
+#   - dirty tracking and write back
+#   - CLOCK eviction under a frame budget
+#   - hit/miss/eviction statistics
+# ------------------------------------------------
+class BufferManager(object):
+
+    # ------------------------------------------------
+    # Constructor
+    # Input:
+    #       frame_num: the maximum number of frames held in memory
+    #       use_mmap: whether view_block() may read from memory maps
+    # ------------------------------------------------
+    def __init__(self, frame_num=DEFAULT_FRAME_NUM, use_mmap=USE_MMAP):
+        self.frame_num = frame_num
+        self.use_mmap = use_mmap
+        self.frames = []        # all the allocated frames, in clock order
+        self.page_table = {}    # (path, block_id) -> Frame
+        self.files = {}         # path -> file handle
+        self.maps = {}          # path -> read only mmap of the file
+        self.clock_hand = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self.mmap_reads = 0
+
+    # ------------------------------------------------
+    # the key of a file, the same file reached through different relative paths shares frames
+    # ------------------------------------------------
+    @staticmethod
+    def _path(file_name):
+        if isinstance(file_name, bytes):
+            file_name = file_name.decode('utf-8')
+        return os.path.abspath(file_name.strip())
+
+    # ------------------------------------------------
+    # return the handle of a file, the file is created if it does not exist
+    # ------------------------------------------------
+    def _file(self, path):
+        f_handle = self.files.get(path)
+        if f_handle is None or f_handle.closed:
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            f_handle = open(path, 'rb+')
+            self.files[path] = f_handle
+        return f_handle
+
+    # ------------------------------------------------
+    # number of blocks in a file, counting blocks that only exist in the pool
+    # ------------------------------------------------
+    def block_num(self, file_name):
+        path = self._path(file_name)
+        f_handle = self._file(path)
+        f_handle.seek(0, os.SEEK_END)
+        num = (f_handle.tell() + BLOCK_SIZE - 1) // BLOCK_SIZE
+        for key in self.page_table:
+            if key[0] == path and key[1] >= num:
+                num = key[1] + 1
+        return num
+
+    # ------------------------------------------------
+    # write a dirty frame to its file
+    # the bytes are flushed out of the file object unless the caller flushes
+    # them itself, so that readers not going through this handle (memory maps,
+    # other handles of the file) see them once the frame is evicted
+    # ------------------------------------------------
+    def _write_back(self, frame, flush=True):
+        f_handle = self._file(frame.key[0])
+        f_handle.seek(frame.key[1] * BLOCK_SIZE)
+        f_handle.write(frame.data)
+        if flush:
+            f_handle.flush()
+        frame.dirty = False
+        self.writes += 1
+
+    # ------------------------------------------------
+    # find a frame for a new block, either a new one or a victim chosen by CLOCK
+    # ------------------------------------------------
+    def _get_free_frame(self):
+        if len(self.frames) < self.frame_num:
+            frame = Frame()
+            self.frames.append(frame)
+            return frame
+        # every frame is visited at most twice: once to clear its reference bit, once to evict it
+        for _ in range(2 * len(self.frames)):
+            frame = self.frames[self.clock_hand]
+            self.clock_hand = (self.clock_hand + 1) % len(self.frames)
+            if frame.pin_count > 0:
+                continue
+            if frame.referenced:
+                frame.referenced = False
+                continue
+            if frame.key is None:
+                return frame  # freed by drop_file or truncate_file
+            if frame.dirty:
+                self._write_back(frame)
+            del self.page_table[frame.key]
+            frame.key = None
+            self.evictions += 1
+            return frame
+        raise RuntimeError('buffer pool exhausted: all %d frames are pinned' % len(self.frames))
+
+    # ------------------------------------------------
+    # pin a block in the pool and return its buffer
+    # the buffer can be modified in place, call unpin(..., dirty=True) afterwards
+    # Input:
+    #       file_name: the file the block belongs to
+    #       block_id: the id of the block in the file
+    # Output:
+    #       bytearray of BLOCK_SIZE bytes, zero-filled beyond the end of the file
+    # ------------------------------------------------
+    def pin(self, file_name, block_id):
+        key = (self._path(file_name), block_id)
+        frame = self.page_table.get(key)
+        if frame is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            frame = self._get_free_frame()
+            f_handle = self._file(key[0])
+            f_handle.seek(block_id * BLOCK_SIZE)
+            read_len = f_handle.readinto(frame.data)
+            if read_len < BLOCK_SIZE:
+                frame.data[read_len:] = bytes(BLOCK_SIZE - read_len)
+            frame.key = key
+            frame.dirty = False
+            self.page_table[key] = frame
+        frame.pin_count += 1
+        frame.referenced = True
+        return frame.data
+
+    # ------------------------------------------------
+    # release a block pinned by pin()
+    # Input:
+    #       file_name, block_id: the pinned block
+    #       dirty: whether the caller modified the buffer
+    # ------------------------------------------------
+    def unpin(self, file_name, block_id, dirty=False):
+        frame = self.page_table.get((self._path(file_name), block_id))
+        if frame is None:
+            return
+        if frame.pin_count > 0:
+            frame.pin_count -= 1
+        if dirty:
+            frame.dirty = True
+
+    # ------------------------------------------------
+    # mark a cached block as modified
+    # ------------------------------------------------
+    def mark_dirty(self, file_name, block_id):
+        frame = self.page_table.get((self._path(file_name), block_id))
+        if frame is not None:
+            frame.dirty = True
+
+    # ------------------------------------------------
+    # read a copy of a block
+    # Output:
+    #       bytes of BLOCK_SIZE
+    # ------------------------------------------------
+    def read_block(self, file_name, block_id):
+        data = bytes(self.pin(file_name, block_id))
+        self.unpin(file_name, block_id)
+        return data
+
+    # ------------------------------------------------
+    # read only view of a block, for scans that decode with struct.unpack_from
+    # a block cached in the pool is copied, since the pool may hold unflushed changes,
+    # other blocks are sliced from the memory map of the file
+    # the view must not be kept after the file is modified, truncated or dropped
+    # Output:
+    #       memoryview of BLOCK_SIZE bytes
+    # ------------------------------------------------
+    def view_block(self, file_name, block_id):
+        path = self._path(file_name)
+        if self.use_mmap and (path, block_id) not in self.page_table:
+            mapping = self._mapping(path, (block_id + 1) * BLOCK_SIZE)
+            if mapping is not None:
+                self.mmap_reads += 1
+                return memoryview(mapping)[block_id * BLOCK_SIZE:(block_id + 1) * BLOCK_SIZE]
+        return memoryview(self.read_block(file_name, block_id))
+
+    # ------------------------------------------------
+    # the memory map of a file covering at least size bytes
+    # the file is mapped again when it has grown since it was mapped
+    # Output:
+    #       mmap object, or None if the bytes are not on disk yet
+    # ------------------------------------------------
+    def _mapping(self, path, size):
+        mapping = self.maps.get(path)
+        if mapping is not None and len(mapping) >= size:
+            return mapping
+        self._unmap(path)
+        f_handle = self._file(path)
+        f_handle.flush()
+        if os.fstat(f_handle.fileno()).st_size < size:
+            return None  # empty file, or block only in the pool
+        try:
+            mapping = mmap.mmap(f_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        self.maps[path] = mapping
+        return mapping
+
+    # ------------------------------------------------
+    # forget the memory map of a file
+    # a map with views still in use is closed when the last view is released
+    # ------------------------------------------------
+    def _unmap(self, path):
+        mapping = self.maps.pop(path, None)
+        if mapping is not None:
+            try:
+                mapping.close()
+            except BufferError:
+                pass
+
+    # ------------------------------------------------
+    # overwrite part of a block, starting from offset
+    # ------------------------------------------------
+    def write_block(self, file_name, block_id, data, offset=0):
+        buf = self.pin(file_name, block_id)
+        buf[offset:offset + len(data)] = data
+        self.unpin(file_name, block_id, dirty=True)
+
+    # ------------------------------------------------
+    # read bytes at any position of a file, the range may span several blocks
+    # ------------------------------------------------
+    def read_bytes(self, file_name, pos, length):
+        result = bytearray()
+        while length > 0:
+            block_id, offset = divmod(pos, BLOCK_SIZE)
+            size = min(length, BLOCK_SIZE - offset)
+            buf = self.pin(file_name, block_id)
+            result += buf[offset:offset + size]
+            self.unpin(file_name, block_id)
+            pos += size
+            length -= size
+        return bytes(result)
+
+    # ------------------------------------------------
+    # write bytes at any position of a file, the range may span several blocks
+    # ------------------------------------------------
+    def write_bytes(self, file_name, pos, data):
+        data = memoryview(data)
+        while len(data) > 0:
+            block_id, offset = divmod(pos, BLOCK_SIZE)
+            size = min(len(data), BLOCK_SIZE - offset)
+            self.write_block(file_name, block_id, data[:size], offset)
+            pos += size
+            data = data[size:]
+
+    # ------------------------------------------------
+    # write all the dirty blocks of a file back to disk
+    # the file object is flushed even without dirty blocks, so that no write
+    # stays hidden from the memory map of the file
+    # ------------------------------------------------
+    def flush_file(self, file_name):
+        path = self._path(file_name)
+        dirty_frames = [f for f in self.frames if f.key is not None and f.key[0] == path and f.dirty]
+        for frame in sorted(dirty_frames, key=lambda f: f.key[1]):  # sequential write
+            self._write_back(frame, flush=False)
+        f_handle = self.files.get(path)
+        if f_handle is not None and not f_handle.closed:
+            f_handle.flush()
+
+    # ------------------------------------------------
+    # write all the dirty blocks of all files back to disk
+    # ------------------------------------------------
+    def flush_all(self):
+        for path in list(self.files.keys()):
+            self.flush_file(path)
+
+    # ------------------------------------------------
+    # forget all the blocks of a file and close it, used before the file is removed
+    # the dirty blocks are discarded
+    # ------------------------------------------------
+    def drop_file(self, file_name):
+        path = self._path(file_name)
+        self._unmap(path)
+        for frame in self.frames:
+            if frame.key is not None and frame.key[0] == path:
+                del self.page_table[frame.key]
+                frame.key = None
+                frame.dirty = False
+                frame.pin_count = 0
+                frame.referenced = False
+        f_handle = self.files.pop(path, None)
+        if f_handle is not None:
+            f_handle.close()
+
+    # ------------------------------------------------
+    # cut a file down to block_num blocks
+    # ------------------------------------------------
+    def truncate_file(self, file_name, block_num):
+        path = self._path(file_name)
+        self._unmap(path)
+        for frame in self.frames:
+            if frame.key is not None and frame.key[0] == path and frame.key[1] >= block_num:
+                del self.page_table[frame.key]
+                frame.key = None
+                frame.dirty = False
+                frame.pin_count = 0
+                frame.referenced = False
+        f_handle = self._file(path)
+        f_handle.truncate(block_num * BLOCK_SIZE)
+        f_handle.flush()
+
+    # ------------------------------------------------
+    # change the frame budget, extra frames are evicted
+    # ------------------------------------------------
+    def resize(self, frame_num):
+        self.frame_num = max(1, frame_num)
+        while len(self.frames) > self.frame_num:
+            victims = [f for f in self.frames if f.pin_count == 0]
+            if not victims:
+                break
+            frame = victims[0]
+            if frame.key is not None:
+                if frame.dirty:
+                    self._write_back(frame, flush=False)
+                del self.page_table[frame.key]
+                self.evictions += 1
+            self.frames.remove(frame)
+        self.clock_hand = 0
+        for f_handle in self.files.values():
+            f_handle.flush()
+
+    # ------------------------------------------------
+    # statistics of the buffer pool
+    # Output:
+    #       dict of counters
+    # ------------------------------------------------
+    def get_statistics(self):
+        accesses = self.hits + self.misses
+        return {
+            'frame_num': self.frame_num,
+            'frames_used': len(self.page_table),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'writes': self.writes,
+            'mmap_reads': self.mmap_reads,
+            'hit_ratio': self.hits / accesses if accesses else 0.0,
+        }
+
+    def reset_statistics(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self.mmap_reads = 0
+
+    def show_statistics(self):
+        stats = self.get_statistics()
+        print(f"Buffer pool: {stats['frames_used']}/{stats['frame_num']} frames used, "
+              f"hits {stats['hits']}, misses {stats['misses']}, evictions {stats['evictions']}, "
+              f"writes {stats['writes']}, mmap reads {stats['mmap_reads']}, hit ratio {stats['hit_ratio']:.2%}")
+
+# the process-wide buffer pool shared by all the modules
+global_buffer_manager = BufferManager()
+atexit.register(global_buffer_manager.flush_all)
@@ -0,0 +1,191 @@
+# ------------------------------------------------
+# codec_db.py
+# ------------------------------------------------
+# Record codec module
+# A TableCodec is built once from the field list of a table and holds the
+# compiled struct.Struct layouts used to decode and encode its records
+# ------------------------------------------------
+# a record is stored as
+# schema_address|content_len|update_time   # record head, '!ii10s'
+# field_1|field_2|...|field_n              # record content, every field padded to its length
+# ------------------------------------------------
+# decoding a projection only materializes the requested fields, the other
+# fields are skipped with 'x' pad bytes in the layout
+# ------------------------------------------------
+# the field encoding depends on the format version of the data file
+# version 1: every field is ASCII text left padded with spaces to its declared length
+# version 2: INTEGER is an 8 byte big endian signed integer ('q'), BOOLEAN is 1 byte ('?'),
+#            strings are stored as in version 1
+# ------------------------------------------------
+
+import struct
+
+TOMBSTONE = -1  # record offset of a deleted slot in a data block
+
+FORMAT_V1 = 1
+FORMAT_V2 = 2
+CURRENT_FORMAT = FORMAT_V2  # the format of newly created data files
+INT_MIN = -2 ** 63          # the range of the INTEGER values of version 2
+INT_MAX = 2 ** 63 - 1
+
+RECORD_HEAD = struct.Struct('!ii10s')   # schema address, content length, update time
+BLOCK_HEAD = struct.Struct('!ii')       # block_id, number_of_records
+SLOT = struct.Struct('!i')              # record offset of a slot
+
+# ------------------------------------------------
+# converters from the stored bytes of a field to its value, by field type
+# 0 -> str, 1 -> varstr, 2 -> int, 3 -> boolean
+# ------------------------------------------------
+def _decode_str(raw):
+    return raw.strip()
+
+def _decode_int(raw):
+    return int(raw.strip())
+
+# ------------------------------------------------
+# convert an input value into a boolean, 'false', '0', 'no' and '' are False
+# ------------------------------------------------
+def to_bool(val):
+    if isinstance(val, bytes):
+        val = val.decode('utf-8', 'ignore')
+    if isinstance(val, str):
+        return val.strip().lower() not in ('', '0', 'false', 'f', 'no', 'n')
+    return bool(val)
+
+def _decode_binary(raw):
+    return raw
+
+FIELD_DECODERS = {0: _decode_str, 1: _decode_str, 2: _decode_int, 3: to_bool}
+
+# ------------------------------------------------
+# Table codec class
+# Functionality:
+#   - decode one record, or only some of its fields
+#   - decode all the live records of a data block
+#   - encode a record tuple into the record content
+# ------------------------------------------------
+class TableCodec(object):
+
+    # ------------------------------------------------
+    # Constructor
+    # Input:
+    #       field_list: list of (field_name, field_type, field_length)
+    #       version: the format version of the data file
+    # ------------------------------------------------
+    def __init__(self, field_list, version=FORMAT_V1):
+        self.version = version
+        self.field_types = [field[1] for field in field_list]
+        self.field_lengths = []  # stored length of every field
+        self.field_formats = []  # struct format of every field
+        self.decoders = []
+        for field_type, declared_length in zip(self.field_types, [field[2] for field in field_list]):
+            if version >= FORMAT_V2 and field_type == 2:
+                self.field_lengths.append(8)
+                self.field_formats.append('q')
+                self.decoders.append(_decode_binary)
+            elif version >= FORMAT_V2 and field_type == 3:
+                self.field_lengths.append(1)
+                self.field_formats.append('?')
+                self.decoders.append(_decode_binary)
+            else:
+                self.field_lengths.append(declared_length)
+                self.field_formats.append('%ds' % declared_length)
+                self.decoders.append(FIELD_DECODERS.get(field_type, _decode_str))
+        self.field_offsets = []  # offset of every field inside the record content
+        offset = 0
+        for length in self.field_lengths:
+            self.field_offsets.append(offset)
+            offset += length
+        self.content_len = offset
+        self.record_len = RECORD_HEAD.size + self.content_len
+        self.content_struct = struct.Struct('!' + ''.join(self.field_formats))
+        self._layouts = {}  # tuple of field indexes -> (Struct, order, decoders)
+        self.all_columns = tuple(range(len(field_list)))
+
+    # ------------------------------------------------
+    # whether an INTEGER value can be stored, version 2 holds 8 byte signed integers
+    # ------------------------------------------------
+    def int_fits(self, value):
+        return self.version < FORMAT_V2 or INT_MIN <= value <= INT_MAX
+
+    # ------------------------------------------------
+    # the compiled layout for a projection, built on first use
+    # Input:
+    #       columns: tuple of field indexes, in the order they are returned
+    # Output:
+    #       (Struct over the record content, order of the unpacked fields, decoders)
+    # ------------------------------------------------
+    def _layout(self, columns):
+        layout = self._layouts.get(columns)
+        if layout is None:
+            wanted = sorted(set(columns))
+            fmt = '!'
+            position = 0
+            for idx in wanted:
+                if self.field_offsets[idx] > position:
+                    fmt += '%dx' % (self.field_offsets[idx] - position)
+                fmt += self.field_formats[idx]
+                position = self.field_offsets[idx] + self.field_lengths[idx]
+            order = [wanted.index(idx) for idx in columns]
+            decoders = [self.decoders[idx] for idx in columns]
+            layout = (struct.Struct(fmt), order, decoders)
+            self._layouts[columns] = layout
+        return layout
+
+    # ------------------------------------------------
+    # decode the record stored at offset of a data block
+    # Input:
+    #       buf: the data block, bytes, bytearray or memoryview
+    #       offset: where the record head begins in the block
+    #       columns: optional sequence of field indexes, all the fields by default
+    # Output:
+    #       tuple of field values, in the order of columns
+    # ------------------------------------------------
+    def decode(self, buf, offset, columns=None):
+        layout, order, decoders = self._layout(self.all_columns if columns is None else tuple(columns))
+        raw = layout.unpack_from(buf, offset + RECORD_HEAD.size)
+        return tuple([decode(raw[i]) for i, decode in zip(order, decoders)])
+
+    # ------------------------------------------------
+    # decode all the live records of a data block
+    # Input:
+    #       buf: the data block
+    #       columns: optional sequence of field indexes, all the fields by default
+    # Output:
+    #       list of (slot, record), deleted slots are skipped
+    # ------------------------------------------------
+    def decode_block(self, buf, columns=None):
+        layout, order, decoders = self._layout(self.all_columns if columns is None else tuple(columns))
+        number_of_records = BLOCK_HEAD.unpack_from(buf, 0)[1]
+        records = []
+        for slot in range(number_of_records):
+            offset = SLOT.unpack_from(buf, BLOCK_HEAD.size + slot * SLOT.size)[0]
+            if offset == TOMBSTONE:
+                continue
+            raw = layout.unpack_from(buf, offset + RECORD_HEAD.size)
+            records.append((slot, tuple([decode(raw[i]) for i, decode in zip(order, decoders)])))
+        return records
+
+    # ------------------------------------------------
+    # encode a record tuple into the record content
+    # Input:
+    #       record: tuple of field values
+    # Output:
+    #       bytes, text fields are left padded with spaces or truncated to their length
+    # ------------------------------------------------
+    def encode(self, record):
+        values = []
+        for val, fmt, length in zip(record, self.field_formats, self.field_lengths):
+            if fmt == 'q':
+                if isinstance(val, bytes):
+                    val = val.decode('utf-8')
+                values.append(int(val))
+            elif fmt == '?':
+                values.append(to_bool(val))
+            else:
+                if isinstance(val, str):
+                    val = val.encode('utf-8')
+                elif not isinstance(val, bytes):
+                    val = str(val).encode('utf-8')
+                values.append(val.rjust(length)[:length])
+        return self.content_struct.pack(*values)
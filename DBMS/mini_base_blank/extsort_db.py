@@ -0,0 +1,153 @@
+# ------------------------------------------------
+# extsort_db.py
+# ------------------------------------------------
+# External merge sort module
+# Sorts more entries than fit in memory: the entries are gathered in memory
+# up to a byte budget, sorted and written as a run to a temporary file, and
+# the runs are read back sequentially and merged. Used by the index builds
+# and the sort-merge join, whose entries are tuples of bytes, strings and integers
+# ------------------------------------------------
+# a run file holds its sorted entries one after the other:
+# length|entry                  # '!I' + the entry in marshal format
+# the runs only live while the sort does, so the marshal format of the
+# running Python is enough for them
+# ------------------------------------------------
+
+import os
+import heapq
+import marshal
+import operator
+import struct
+import tempfile
+
+SORT_MEMORY = 16 * 1024 * 1024  # bytes of entries kept in memory before a run is written
+MERGE_FAN_IN = 64               # runs merged at once, more runs are merged in several passes
+ENTRY_OVERHEAD = 64             # estimated bytes of a tuple and its integers besides the bytes and string fields
+RUN_BUFFER_SIZE = 64 * 1024     # read and write buffer of a run file
+
+ENTRY_LENGTH = struct.Struct('!I')
+
+# ------------------------------------------------
+# External sorter class
+# Functionality:
+#   - gather entries under a memory budget, spilling sorted runs to temporary files
+#   - merge the runs k at a time, reading every run sequentially
+#   - report its progress
+# ------------------------------------------------
+class ExternalSorter(object):
+
+    # ------------------------------------------------
+    # Constructor
+    # Input:
+    #       memory: bytes of entries kept in memory, SORT_MEMORY by default
+    #       temp_dir: directory of the run files, the current directory by default
+    #       progress: optional callable progress(stage, done, total), called with
+    #                 'sort' and the number of runs written, then 'merge' and
+    #                 the number of entries merged out of all of them
+    # ------------------------------------------------
+    def __init__(self, memory=None, temp_dir=None, progress=None):
+        self.memory = memory if memory else SORT_MEMORY
+        self.temp_dir = temp_dir if temp_dir is not None else os.getcwd()
+        self.progress = progress
+        self.entries = []        # entries gathered since the last run
+        self.entries_size = 0    # their estimated bytes
+        self.runs = []           # run files, (file, number of entries)
+        self.count = 0           # entries added
+        self.bytes_fields = None # positions of the bytes and string fields of the entries
+
+    # ------------------------------------------------
+    # add one entry, a run is written when the memory budget is used up
+    # ------------------------------------------------
+    def add(self, entry):
+        self.extend([entry])
+
+    # ------------------------------------------------
+    # add a batch of entries, such as those of one data block
+    # the budget is checked after the batch, which it may exceed by the batch
+    # ------------------------------------------------
+    def extend(self, entries):
+        entries = list(entries)
+        if not entries:
+            return
+        if self.bytes_fields is None:
+            # the entries of a sort have the same fields
+            self.bytes_fields = [i for i, field in enumerate(entries[0]) if isinstance(field, (bytes, str))]
+        self.entries.extend(entries)
+        self.entries_size += ENTRY_OVERHEAD * len(entries) + sum([sum(map(len, map(operator.itemgetter(i), entries)))
+                                                                  for i in self.bytes_fields])
+        self.count += len(entries)
+        if self.entries_size >= self.memory:
+            self._spill()
+
+    # ------------------------------------------------
+    # write the gathered entries, sorted, as a new run
+    # ------------------------------------------------
+    def _spill(self):
+        self.entries.sort()
+        self.runs.append(self._write_run(self.entries, len(self.entries)))
+        self.entries = []
+        self.entries_size = 0
+        if self.progress:
+            self.progress('sort', len(self.runs), None)
+
+    def _write_run(self, entries, count):
+        run_file = tempfile.TemporaryFile(prefix='sort_', suffix='.run', dir=self.temp_dir, buffering=RUN_BUFFER_SIZE)
+        for entry in entries:
+            data = marshal.dumps(entry)
+            run_file.write(ENTRY_LENGTH.pack(len(data)))
+            run_file.write(data)
+        run_file.flush()
+        return run_file, count
+
+    # ------------------------------------------------
+    # the entries of a run, read sequentially from its beginning
+    # ------------------------------------------------
+    def _read_run(self, run_file):
+        run_file.seek(0)
+        while True:
+            head = run_file.read(ENTRY_LENGTH.size)
+            if len(head) < ENTRY_LENGTH.size:
+                return
+            yield marshal.loads(run_file.read(ENTRY_LENGTH.unpack(head)[0]))
+
+    # ------------------------------------------------
+    # all the added entries in ascending order
+    # when no run was written the entries are sorted in memory only;
+    # the run files are closed, and so removed, once they are read
+    # Output:
+    #       generator of the entries
+    # ------------------------------------------------
+    def sorted(self):
+        try:
+            if not self.runs:
+                self.entries.sort()
+                merged = self.entries
+            else:
+                if self.entries:
+                    self._spill()
+                # merge the runs MERGE_FAN_IN at a time until one pass merges them all
+                while len(self.runs) > MERGE_FAN_IN:
+                    group, self.runs = self.runs[:MERGE_FAN_IN], self.runs[MERGE_FAN_IN:]
+                    count = sum([run_count for _, run_count in group])
+                    self.runs.append(self._write_run(heapq.merge(*[self._read_run(run_file) for run_file, _ in group]), count))
+                    for run_file, _ in group:
+                        run_file.close()
+                merged = heapq.merge(*[self._read_run(run_file) for run_file, _ in self.runs])
+            for done, entry in enumerate(merged, 1):
+                if self.progress and done % 65536 == 0:
+                    self.progress('merge', done, self.count)
+                yield entry
+            if self.progress:
+                self.progress('merge', self.count, self.count)
+        finally:
+            self.close()
+
+    # ------------------------------------------------
+    # forget the entries and remove the run files
+    # ------------------------------------------------
+    def close(self):
+        for run_file, _ in self.runs:
+            run_file.close()
+        self.runs = []
+        self.entries = []
+        self.entries_size = 0
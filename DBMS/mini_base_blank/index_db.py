@@ -6,22 +6,558 @@
 # Index management module
 # Implements B-tree and Hash index creation, deletion and search functionality
 # ------------------------------------------------
+# structure of a B-tree index file (t.ind), each block is BLOCK_SIZE
+# block 0: number_of_nodes|has_root|levels|root_node|index_type|version|field_index|free_list
+# block 1..n: one node per block
+# node_type|number_of_entries|next_node|prev_node    # '!iiii'
+# prefix_length|prefix                               # '!B' + the bytes shared by the keys of the node
+# suffix_length_1|...|suffix_length_n                # one byte per entry
+# suffix_1|...|suffix_n                              # the keys without the prefix
+# block_id_1|...|block_id_n|offset_1|...|offset_n    # '!i' each, the record ids of the entries
+# child_1|...|child_n                                # '!i' each, internal nodes only
+# payload_1|...|payload_n                            # leaves of an index with INCLUDE fields only
+# a leaf entry is a key and a record id, an internal entry is a key and a record id, a lower
+# bound of its child (the bound of the first entry of a node is not used by the descent,
+# its key is not stored and reads back as the prefix)
+# the keys have a variable length, a node is full when its entries do not fit in the block.
+# The bounds of the internal nodes are cut to the shortest key separating two leaves
+# the leaves are chained both ways in key order through next_node and prev_node, removed nodes are
+# chained on the free list and reused. Entries are ordered by key, then by record id
+# the keys are normalized so that they compare with memcmp in the order of the values:
+# integers are sign flipped big endian, strings are kept whole up to MAX_KEY_LENGTH (see make_key)
+# index files written before version 4 have fixed 8 byte keys (signed integers before version 3,
+# zeros after index_type before version 2) and are not maintained until the index is created again,
+# or built again by VACUUM or the format upgrade of its table (see query_plan_db.rebuild_old_indexes)
+# the payload of a leaf entry holds the INCLUDE fields of its record, encoded as in a data file of
+# version 2 (see codec_db), so that queries on the indexed and included fields are answered from
+# the leaves without reading the data file
+# ------------------------------------------------
+# structure of a hash index file (t.hash, extendible hashing), each block is BLOCK_SIZE
+# block 0: number_of_pages|has_root|global_depth|directory|index_type|version|field_index|free_list
+# directory: 2^global_depth bucket page ids ('!i' each), in consecutive blocks from block directory
+# bucket pages: page_type|local_depth|number_of_entries|overflow_page   # '!iiii'
+#   hash_1|...|hash_n ('!I' each) | block_id_1|...|block_id_n | offset_1|...|offset_n ('!i' each)
+#   key_length_1|...|key_length_n (one byte each) | key_1|...|key_n
+# the directory slot of a key is the last global_depth bits of its hash (see hash_of), a bucket holds
+# the keys whose hashes end with the same local_depth bits. A bucket that outgrows its page is split
+# in two, the directory doubling when the bucket is as deep as it; only the keys sharing one hash are
+# chained on overflow pages. Hash files before version 2 used a fixed table of 1024 buckets and the
+# hash() of the process, they are not used until the index is created again
+# ------------------------------------------------
+# structure of the index catalog all.idx, which lists the indexes of every table
+# magic|number_of_indexes|last_build_lsn                           # '!4sii'
+# for each index: index_type|build_lsn|number_of_columns|number_of_included   # '!iiBB'
+#   name|table|file|column_1|...|column_n|included_1|...|included_m          # one length byte + utf-8 each
+# catalogs with magic IDX1 have no included fields ('!iiB' entries)
+# the index of name n on table t is stored in t.n.ind or t.n.hash, except the default
+# index of each type (see default_index_name) which keeps the file t.ind or t.hash
+# ------------------------------------------------
 
 import os
 import struct
 import ctypes
+import bisect
+import itertools
+import collections
 import common_db
 import storage_db
+import codec_db
+import extsort_db
+from buffer_db import global_buffer_manager
+from codec_db import to_bool
+from zone_db import normalize
 
 # Constants definitions
 BTREE_INDEX = 1        # B-tree index type
 HASH_INDEX = 2         # Hash index type 
 LEAF_NODE_TYPE = 0     # Leaf node type
 INTERNAL_NODE_TYPE = 1 # Internal node type
+FREE_NODE_TYPE = 2     # Node on the free list
+
+# B-tree and hash index configuration
+HASH_FORMAT_VERSION = 2   # extendible hash files, updated in place by the storage layer
+HASH_BUCKET_TYPE = 3      # page type of a hash bucket page
+MAX_GLOBAL_DEPTH = 20     # the directory holds at most 2^MAX_GLOBAL_DEPTH buckets
+INDEX_FORMAT_VERSION = 4  # B-tree files with variable length keys, updated in place by the storage layer
+NODE_CACHE_SIZE = 256     # number of decoded nodes kept in memory
+MAX_KEY_LENGTH = 255      # longer string keys are cut, the suffix lengths fit in one byte
+MAX_INDEX_COLUMNS = 5     # fields of a composite index
+NODE_SIZE = common_db.BLOCK_SIZE  # bytes a node may take in its block
+
+INDEX_HEAD = struct.Struct('!i?iiiiii')   # see the file structure above, '!i?iii' in older files
+NODE_HEAD = struct.Struct('!iiii')        # node_type, number_of_entries, next_node, prev_node
+LEAF_ENTRY = struct.Struct('!ii')         # bytes of the block_id and offset of a leaf entry
+INTERNAL_ENTRY = struct.Struct('!iii')    # bytes of the block_id, offset and child of an internal entry
+BUCKET_HEAD = struct.Struct('!iiii')      # page_type, local_depth, number_of_entries, overflow_page
+BUCKET_ENTRY_SIZE = 13                    # bytes of the hash, record id and key length of a bucket entry
+UNDERFLOW_SIZE = NODE_SIZE // 3           # a node smaller than this is merged or refilled
+
+# the index catalog, stored next to the data files
+CATALOG_FILE = 'all.idx'
+CATALOG_MAGIC = b'IDX2'
+CATALOG_HEAD = struct.Struct('!4sii')     # magic, number_of_indexes, last_build_lsn
+CATALOG_ENTRY = struct.Struct('!iiBB')    # index_type, build_lsn, number_of_columns, number_of_included
+CATALOG_ENTRY_V1 = struct.Struct('!iiB')  # entries of IDX1 catalogs, without included fields
+
+# one index of the catalog, build_lsn numbers the builds of the indexes in the order they happened
+# include lists the fields stored in the leaf entries besides the key
+IndexEntry = collections.namedtuple('IndexEntry', 'name table columns index_type file build_lsn include',
+                                    defaults=((),))
 
-# B-tree configuration
-BTREE_ORDER = 64       # B-tree order (number of keys per node)
-HASH_TABLE_SIZE = 1024 # Hash table size
+# the parsed catalog and the (path, mtime, size) of the file it was read from
+_catalog = {'version': None, 'entries': collections.OrderedDict(), 'last_lsn': 0}
+
+# decoded nodes, (index_file, block_id) -> (node_type, entries, keys, next_node, prev_node)
+# keys holds the (key, block_id, offset) of every entry for bisect. Every node write goes
+# through Index._write_node, which replaces the cached node, so the cache never gets stale
+_node_cache = collections.OrderedDict()
+
+# ------------------------------------------------
+# forget the cached nodes of an index file, used when the file is truncated or removed
+# ------------------------------------------------
+def _forget_nodes(index_file):
+    for cached in [cached for cached in _node_cache if cached[0] == index_file]:
+        del _node_cache[cached]
+
+# ------------------------------------------------
+# the index key of a field value
+# Input:
+#       value: the field value (int, bool, bytes or str)
+#       field_type: 0 -> str, 1 -> varstr, 2 -> int, 3 -> boolean
+# Output:
+#       bytes comparing with memcmp in the order of the values: a sign flipped
+#       big endian integer, or the stripped string, cut to MAX_KEY_LENGTH bytes
+# ------------------------------------------------
+def make_key(value, field_type):
+    if field_type == 2 or field_type == 3 or isinstance(value, bool):
+        return normalize(value, field_type)
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return value.rstrip(b'\x00').strip()[:MAX_KEY_LENGTH]
+
+# ------------------------------------------------
+# the part of one field value in the key of a composite index
+# integers and booleans are normalized as in make_key; strings are ended by 00 00,
+# a 00 byte inside a string is written 00 ff, so that no part is the prefix of
+# another and the keys still compare with memcmp field after field
+# ------------------------------------------------
+def key_part(value, field_type):
+    if field_type == 2 or field_type == 3 or isinstance(value, bool):
+        return normalize(value, field_type)
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return value.rstrip(b'\x00').strip().replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+
+# ------------------------------------------------
+# the index key of the values of the fields of a composite index
+# Input:
+#       values: the field values, in the order of the index columns
+#       field_types: the types of the fields
+# Output:
+#       the key parts joined, cut to MAX_KEY_LENGTH bytes
+# ------------------------------------------------
+def make_composite_key(values, field_types):
+    return b''.join([key_part(value, field_type) for value, field_type in zip(values, field_types)])[:MAX_KEY_LENGTH]
+
+# ------------------------------------------------
+# the smallest key greater than every key beginning with a prefix
+# Output:
+#       bytes, None if there is no such key (the prefix is empty or all ff)
+# ------------------------------------------------
+def key_successor(prefix):
+    prefix = prefix.rstrip(b'\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+# ------------------------------------------------
+# the 32 bit hash of an index key, the same in every process
+# FNV-1a, with the high bits mixed into the low ones that select the directory slot
+# ------------------------------------------------
+def hash_of(key):
+    h = 0x811c9dc5
+    for byte in key:
+        h = ((h ^ byte) * 0x01000193) & 0xffffffff
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    return h
+
+# ------------------------------------------------
+# the 32 bits of a hash in reverse order; sorted on it, the hashes ending
+# with the same bits are consecutive whatever their number
+# ------------------------------------------------
+def reverse_bits(h):
+    return int.from_bytes(h.to_bytes(4, 'little').translate(_REVERSED_BYTES), 'big')
+
+_REVERSED_BYTES = bytes([int('{:08b}'.format(byte)[::-1], 2) for byte in range(256)])
+
+# ------------------------------------------------
+# the integer value of an index key, see make_key
+# ------------------------------------------------
+def key_int(key):
+    return struct.unpack('!Q', key)[0] - 2 ** 63
+
+# ------------------------------------------------
+# the name of the index created on a table by the index menu, its file keeps the
+# name of the files written before the catalog existed (t.ind, t.hash)
+# ------------------------------------------------
+def default_index_name(table_name, index_type):
+    return '%s_%s' % (table_name, 'hash' if index_type == HASH_INDEX else 'btree')
+
+# ------------------------------------------------
+# the file of a new index
+# Input:
+#       table_name: name of the indexed table (str)
+#       index_name: name of the index
+#       index_type: BTREE_INDEX or HASH_INDEX
+# Output:
+#       t.name.ind or t.name.hash, t.ind or t.hash for the default index of the type
+# ------------------------------------------------
+def index_file_name(table_name, index_name, index_type):
+    extension = '.hash' if index_type == HASH_INDEX else '.ind'
+    if index_name == default_index_name(table_name, index_type):
+        return table_name + extension
+    return '%s.%s%s' % (table_name, index_name, extension)
+
+# ------------------------------------------------
+# read the index catalog, the parsed catalog is kept until the file changes
+# a database without a catalog gets one listing the index files written before it existed
+# Output:
+#       dict with the entries (index name -> IndexEntry) and the last build lsn
+# ------------------------------------------------
+def _read_catalog():
+    try:
+        stat = os.stat(CATALOG_FILE)
+    except FileNotFoundError:
+        _adopt_index_files()
+        stat = os.stat(CATALOG_FILE)
+    version = (os.path.abspath(CATALOG_FILE), stat.st_mtime_ns, stat.st_size)
+    if _catalog['version'] == version:
+        return _catalog
+    with open(CATALOG_FILE, 'rb') as catalog_file:
+        data = catalog_file.read()
+    entries = collections.OrderedDict()
+    last_lsn = 0
+    if len(data) >= CATALOG_HEAD.size and data[:4] in (CATALOG_MAGIC, b'IDX1'):
+        _, number_of_indexes, last_lsn = CATALOG_HEAD.unpack_from(data, 0)
+        pos = CATALOG_HEAD.size
+        for _ in range(number_of_indexes):
+            if data[:4] == CATALOG_MAGIC:
+                index_type, build_lsn, number_of_columns, number_of_included = CATALOG_ENTRY.unpack_from(data, pos)
+                pos += CATALOG_ENTRY.size
+            else:
+                index_type, build_lsn, number_of_columns = CATALOG_ENTRY_V1.unpack_from(data, pos)
+                number_of_included = 0
+                pos += CATALOG_ENTRY_V1.size
+            names = []
+            for _ in range(3 + number_of_columns + number_of_included):
+                names.append(data[pos + 1:pos + 1 + data[pos]].decode('utf-8'))
+                pos += 1 + data[pos]
+            name, table_name, index_file = names[:3]
+            entries[name] = IndexEntry(name, table_name, tuple(names[3:3 + number_of_columns]), index_type,
+                                       index_file, build_lsn, tuple(names[3 + number_of_columns:]))
+    else:
+        print(f"Index catalog {CATALOG_FILE} is not valid, no index is used")
+    _catalog.update(version=version, entries=entries, last_lsn=last_lsn)
+    return _catalog
+
+# ------------------------------------------------
+# write the index catalog, the new file replaces the old one at once
+# Input:
+#       entries: dict of index name -> IndexEntry
+#       last_lsn: build lsn of the last index built
+# ------------------------------------------------
+def _write_catalog(entries, last_lsn):
+    data = [CATALOG_HEAD.pack(CATALOG_MAGIC, len(entries), last_lsn)]
+    for entry in entries.values():
+        data.append(CATALOG_ENTRY.pack(entry.index_type, entry.build_lsn, len(entry.columns), len(entry.include)))
+        for name in (entry.name, entry.table, entry.file) + tuple(entry.columns) + tuple(entry.include):
+            name = name.encode('utf-8')
+            data.append(bytes([len(name)]) + name)
+    with open(CATALOG_FILE + '.tmp', 'wb') as catalog_file:
+        catalog_file.write(b''.join(data))
+    os.replace(CATALOG_FILE + '.tmp', CATALOG_FILE)
+    stat = os.stat(CATALOG_FILE)
+    _catalog.update(version=(os.path.abspath(CATALOG_FILE), stat.st_mtime_ns, stat.st_size),
+                    entries=collections.OrderedDict(entries), last_lsn=last_lsn)
+
+# ------------------------------------------------
+# create the catalog of a database that has none, the index files t.ind and
+# t.hash written before it become the default indexes of their tables
+# ------------------------------------------------
+def _adopt_index_files():
+    entries = collections.OrderedDict()
+    for file_name in sorted(os.listdir('.')):
+        table_name, extension = os.path.splitext(file_name)
+        if extension not in ('.ind', '.hash') or '.' in table_name or not os.path.exists(table_name + '.dat'):
+            continue
+        index_type = HASH_INDEX if extension == '.hash' else BTREE_INDEX
+        columns = ()
+        if global_buffer_manager.block_num(file_name) > 0:
+            field_index = INDEX_HEAD.unpack_from(global_buffer_manager.read_block(file_name, 0), 0)[6]
+            field_list = storage_db.Storage(table_name.encode('utf-8'), debug=False).getFieldList()
+            if 0 <= field_index < len(field_list):
+                columns = (field_list[field_index][0].decode('utf-8').strip(),)
+        name = default_index_name(table_name, index_type)
+        entries[name] = IndexEntry(name, table_name, columns, index_type, file_name, 0)
+    _write_catalog(entries, 0)
+
+# ------------------------------------------------
+# the catalog entry of an index
+# Input:
+#       index_name: name of the index
+# Output:
+#       IndexEntry, None if there is no index of this name
+# ------------------------------------------------
+def find_index(index_name):
+    return _read_catalog()['entries'].get(index_name)
+
+# ------------------------------------------------
+# the catalog entries of the indexes
+# Input:
+#       table_name: name of a table (str), None for the indexes of every table
+# Output:
+#       list of IndexEntry, in the order the indexes were created
+# ------------------------------------------------
+def list_indexes(table_name=None):
+    return [entry for entry in _read_catalog()['entries'].values() if table_name is None or entry.table == table_name]
+
+# ------------------------------------------------
+# add an index to the catalog, or record that it has been built again
+# Input:
+#       index_name: name of the index
+#       table_name: name of the indexed table (str)
+#       columns: names of the indexed fields
+#       index_type: BTREE_INDEX or HASH_INDEX
+#       index_file: name of the index file
+#       include: names of the fields stored in the leaf entries
+# Output:
+#       the new IndexEntry
+# ------------------------------------------------
+def register_index(index_name, table_name, columns, index_type, index_file, include=()):
+    catalog = _read_catalog()
+    entries = collections.OrderedDict(catalog['entries'])
+    build_lsn = catalog['last_lsn'] + 1
+    entries[index_name] = IndexEntry(index_name, table_name, tuple(columns), index_type, index_file, build_lsn,
+                                     tuple(include))
+    _write_catalog(entries, build_lsn)
+    return entries[index_name]
+
+# ------------------------------------------------
+# remove an index file and forget its cached blocks and nodes
+# ------------------------------------------------
+def remove_index_file(index_file):
+    _forget_nodes(index_file)
+    global_buffer_manager.drop_file(index_file)
+    if os.path.exists(index_file):
+        os.remove(index_file)
+
+# ------------------------------------------------
+# remove an index from the catalog, with its file
+# Input:
+#       index_name: name of the index
+# Output:
+#       boolean, False if there is no index of this name
+# ------------------------------------------------
+def drop_index(index_name):
+    catalog = _read_catalog()
+    if index_name not in catalog['entries']:
+        return False
+    entries = collections.OrderedDict(catalog['entries'])
+    remove_index_file(entries.pop(index_name).file)
+    _write_catalog(entries, catalog['last_lsn'])
+    return True
+
+# ------------------------------------------------
+# open the indexes of a table listed in the catalog
+# Input:
+#       table_name: name of the table (str)
+#       field_list: optional field list of the table, read from its data file by default
+# Output:
+#       list of Index objects
+# ------------------------------------------------
+def open_table_indexes(table_name, field_list=None):
+    return [Index(table_name, entry.index_type, field_list, debug=False, index_name=entry.name)
+            for entry in list_indexes(table_name)]
+
+# ------------------------------------------------
+# an index of a table as the catalog describes it, without opening its file
+# its fields, keys and covered fields are those of the Index it opens, so that
+# a query is planned from the catalog and only the index it uses is read
+# ------------------------------------------------
+class CatalogIndex(object):
+
+    # ------------------------------------------------
+    # Constructor
+    # Input:
+    #       entry: the IndexEntry of the index
+    #       field_list: field list of the table
+    # ------------------------------------------------
+    def __init__(self, entry, field_list):
+        self.entry = entry
+        self.index_name = entry.name
+        self.table_name = entry.table
+        self.index_type = entry.index_type
+        self.index_file = entry.file
+        self.field_list = field_list
+        names = [f[0].decode('utf-8').strip() if isinstance(f[0], bytes) else str(f[0]).strip() for f in field_list]
+        self.resolved = all(name in names for name in entry.columns + entry.include)
+        self.field_indexes = tuple([names.index(name) for name in entry.columns]) if self.resolved else ()
+        self.field_types = tuple([field_list[i][1] for i in self.field_indexes])
+        self.field_type = self.field_types[0] if self.field_types else None
+        self.include_indexes = tuple([names.index(name) for name in entry.include]) if self.resolved else ()
+        self._index = None
+
+    # ------------------------------------------------
+    # whether the index is kept up to date by the storage layer
+    # an index built since the catalog exists always is; the file of an index
+    # adopted from before it (build lsn 0) is opened to read its header
+    # ------------------------------------------------
+    @property
+    def maintained(self):
+        if not self.field_indexes or not os.path.exists(self.index_file):
+            return False
+        if self.entry.build_lsn > 0:
+            return True
+        return self.open().maintained
+
+    # ------------------------------------------------
+    # the Index object of the index, opened on first use
+    # ------------------------------------------------
+    def open(self):
+        if self._index is None:
+            self._index = Index(self.table_name, self.index_type, self.field_list, debug=False, index_name=self.index_name)
+        return self._index
+
+    def key_from_values(self, values):
+        return Index.key_from_values(self, values)
+
+    @property
+    def covered_fields(self):
+        return Index.covered_fields.fget(self)
+
+# ------------------------------------------------
+# the indexes of a table listed in the catalog, without opening them
+# Input:
+#       table_name: name of the table (str)
+#       field_list: field list of the table
+# Output:
+#       list of CatalogIndex objects
+# ------------------------------------------------
+def catalog_table_indexes(table_name, field_list):
+    return [CatalogIndex(entry, field_list) for entry in list_indexes(table_name)]
+
+# ------------------------------------------------
+# remove the indexes of a table, from the catalog and from the disk
+# Input:
+#       table_name: name of the table (str)
+# ------------------------------------------------
+def drop_table_indexes(table_name):
+    catalog = _read_catalog()
+    entries = collections.OrderedDict()
+    for name, entry in catalog['entries'].items():
+        if entry.table == table_name:
+            remove_index_file(entry.file)
+        else:
+            entries[name] = entry
+    if len(entries) != len(catalog['entries']):
+        _write_catalog(entries, catalog['last_lsn'])
+
+# ------------------------------------------------
+# one level of a B-tree built bottom up from sorted entries, see Index._create_btree_index
+# the entries are packed into full nodes as they come, and every node written
+# adds its lower bound to the level above. The last full node is held back, so
+# that the last node of the level can share its entries with it rather than be
+# left almost empty
+# ------------------------------------------------
+class _BulkLevel(object):
+    def __init__(self, index_obj, node_type):
+        self.index_obj = index_obj
+        self.node_type = node_type
+        self.entry_size = index_obj._entry_size(node_type)
+        self.skip = 1 if node_type == INTERNAL_NODE_TYPE else 0  # the first key of an internal node is not stored
+        self.entries = []        # the node being filled
+        self.key_bytes = 0       # bytes of its stored keys
+        self.prefix_length = 0   # length of the prefix of its stored keys
+        self.held = None         # (block_id, entries) of the last full node, not written yet
+        self.prev_id = -1        # the node written before the held one
+        self.last_entry = None   # the last entry of that node
+        self.written = 0         # nodes written
+        self.parent = None       # the level above
+
+    # ------------------------------------------------
+    # add the next entry, the node is closed first when the entry does not fit in it
+    # the size of the node is that of Index._node_size; the keys are sorted, so the
+    # prefix of the stored keys is that of the first and the last, and only shrinks
+    # ------------------------------------------------
+    def add(self, entry):
+        key = entry[0]
+        stored = len(self.entries) + 1 - self.skip  # stored keys with this one
+        if stored <= 0:
+            self.entries.append(entry)  # the first entry of an internal node, its key is not stored
+            return
+        if stored == 1:
+            prefix_length = len(key)
+        else:
+            prefix_length, first = self.prefix_length, self.entries[self.skip][0]
+            if key[:prefix_length] != first[:prefix_length]:
+                prefix_length = len(os.path.commonprefix((first, key)))
+        size = (NODE_HEAD.size + 1 + prefix_length + self.key_bytes + len(key) - prefix_length * stored
+                + (len(self.entries) + 1) * (1 + self.entry_size))
+        if size > NODE_SIZE and self.entries:
+            self._close()
+            self.add(entry)
+            return
+        self.entries.append(entry)
+        self.key_bytes += len(key)
+        self.prefix_length = prefix_length
+
+    # ------------------------------------------------
+    # the node being filled is full: it is held back and the one held before is written
+    # ------------------------------------------------
+    def _close(self):
+        block_id = self.index_obj._allocate_node()
+        if self.held is not None:
+            self._write(self.held, block_id)
+        self.held = (block_id, self.entries)
+        self.entries, self.key_bytes = [], 0
+
+    def _write(self, node, next_id):
+        block_id, entries = node
+        if self.node_type == LEAF_NODE_TYPE:
+            self.index_obj._write_node(block_id, LEAF_NODE_TYPE, entries, next_id, self.prev_id)
+            # the bound of a leaf is the shortest key above the previous leaf
+            bound = self.index_obj._separator(self.last_entry, entries[0]) if self.last_entry else (b'', 0, 0)
+        else:
+            self.index_obj._write_node(block_id, INTERNAL_NODE_TYPE, entries)
+            bound = entries[0]
+        if self.parent is None:
+            self.parent = _BulkLevel(self.index_obj, INTERNAL_NODE_TYPE)
+        self.parent.add(bound[:3] + (block_id,))
+        self.prev_id, self.last_entry = block_id, entries[-1] if entries else None
+        self.written += 1
+
+    # ------------------------------------------------
+    # write the last nodes of the level and of the levels above it
+    # Output:
+    #       (root block_id, number of levels from this one up)
+    # ------------------------------------------------
+    def finish(self):
+        index_obj = self.index_obj
+        if self.held is not None and index_obj._node_size(self.node_type, self.entries) < UNDERFLOW_SIZE:
+            # share the entries of the last two nodes, the last one would be almost empty
+            tail = self.held[1] + self.entries
+            mid = index_obj._split_point(self.node_type, tail)
+            if (index_obj._node_size(self.node_type, tail[:mid]) <= NODE_SIZE
+                    and index_obj._node_size(self.node_type, tail[mid:]) <= NODE_SIZE):
+                self.held, self.entries = (self.held[0], tail[:mid]), tail[mid:]
+        self._close()
+        self._write(self.held, -1)
+        if self.written == 1:
+            return self.held[0], 1
+        root, levels = self.parent.finish()
+        return root, levels + 1
 
 # ------------------------------------------------
 # Index class for managing database indexes
@@ -40,47 +576,86 @@ class Index(object):
     # Input:
     #       tablename: name of the table to create index for
     #       index_type: type of index (BTREE_INDEX or HASH_INDEX)
+    #       field_list: optional field list of the table, read from its data file by default
+    #       debug: whether to print progress messages
     # Output:
     #       Index object instance
     # ------------------------------------------------
-    def __init__(self, tablename, index_type=BTREE_INDEX):
-        print(f"Initializing {['', 'B-tree', 'Hash'][index_type]} index for table: {tablename}")
+    def __init__(self, tablename, index_type=BTREE_INDEX, field_list=None, debug=True, index_name=None):
+        self.debug = debug
         self.table_name = tablename.strip()
+        self.index_name = index_name or default_index_name(self.table_name, index_type)
+        entry = find_index(self.index_name)
+        if entry is not None:
+            if entry.table != self.table_name:
+                raise ValueError(f"Index '{self.index_name}' is an index of table {entry.table}")
+            index_type = entry.index_type
+        if debug:
+            print(f"Initializing {['', 'B-tree', 'Hash'][index_type]} index {self.index_name} for table: {tablename}")
         self.index_type = index_type
         self.has_root = False
         self.num_of_levels = 0
         self.root_node_ptr = -1
         self.current_block_id = 1
-        self.hash_table_size = HASH_TABLE_SIZE if index_type == HASH_INDEX else 0
         self.field_list = []
-        self.max_key_length = 8  
+        self.buffer_manager = global_buffer_manager
+        self.node_count = 0
+        self.version = INDEX_FORMAT_VERSION if index_type == BTREE_INDEX else HASH_FORMAT_VERSION
+        self.field_index = -1
+        self.field_type = None
+        self.field_indexes = ()
+        self.field_types = ()
+        self.include_indexes = ()
+        self.payload_codec = None  # codec of the INCLUDE fields stored in the leaf entries
+        self.payload_size = 0
+        self.free_list = -1
     
         try:
-            storage_obj = storage_db.Storage(tablename.encode('utf-8'), debug=False)
-            self.field_list = storage_obj.getFieldList()
-            del storage_obj
+            if field_list is None:
+                storage_obj = storage_db.Storage(tablename.encode('utf-8'), debug=False)
+                field_list = storage_obj.getFieldList()
+                del storage_obj
+            self.field_list = field_list
             
             self.first_block_buf = ctypes.create_string_buffer(common_db.BLOCK_SIZE)
-            index_filename = tablename + ('.hash' if index_type == HASH_INDEX else '.ind')
+            if entry is not None:
+                index_filename = entry.file
+            else:
+                index_filename = index_file_name(self.table_name, self.index_name, index_type)
+            
+            self.index_file = index_filename
             
             if not os.path.exists(index_filename):
-                print(f'Creating new index file: {index_filename}')
-                self.f_handle = open(index_filename, 'wb+')
-                if index_type == HASH_INDEX:
-                    struct.pack_into('!i?iii', self.first_block_buf, 0, 0, False, 0, -1, HASH_INDEX)
-                else:
-                    struct.pack_into('!i?iii', self.first_block_buf, 0, 0, False, 0, -1, BTREE_INDEX)
-                self.f_handle.write(self.first_block_buf)
-                self.f_handle.flush()
+                if debug:
+                    print(f'Creating new index file: {index_filename}')
+                self.buffer_manager.drop_file(index_filename)  # forget blocks of a removed file
+                _forget_nodes(index_filename)
+                self._write_header()
+                self.buffer_manager.flush_file(index_filename)
             else:
-                print(f'Opening existing index file: {index_filename}')
-                self.f_handle = open(index_filename, 'rb+')
+                if debug:
+                    print(f'Opening existing index file: {index_filename}')
                 # Read index file header
-                self.f_handle.seek(0)
-                self.f_handle.readinto(self.first_block_buf)
-                _, self.has_root, self.num_of_levels, self.root_node_ptr, self.index_type = \
-                    struct.unpack_from('!i?iii', self.first_block_buf, 0)
-                print(f"Index loaded - type: {self.index_type}, has_root: {self.has_root}, levels: {self.num_of_levels}")
+                self.first_block_buf = self.buffer_manager.read_block(index_filename, 0)
+                self.node_count, self.has_root, self.num_of_levels, self.root_node_ptr, self.index_type, \
+                    self.version, self.field_index, self.free_list = INDEX_HEAD.unpack_from(self.first_block_buf, 0)
+                if entry is not None and len(entry.columns) > 1:
+                    self._set_fields(self._resolve_fields(entry.columns))
+                elif 0 <= self.field_index < len(self.field_list):
+                    self._set_fields([self.field_index])
+                if entry is not None and entry.include:
+                    include_indexes = self._resolve_fields(entry.include)
+                    if include_indexes is None:
+                        self.field_indexes = ()  # the leaves cannot be read, the index is not used
+                    else:
+                        self._set_include(include_indexes)
+                current = INDEX_FORMAT_VERSION if self.index_type == BTREE_INDEX else HASH_FORMAT_VERSION
+                if self.version < current and self.has_root:
+                    # the pages of older files cannot be read reliably, the index must be created again
+                    print(f"Index file {index_filename} has an old format, create the index again to use it")
+                    self.has_root = False
+                if debug:
+                    print(f"Index loaded - type: {self.index_type}, has_root: {self.has_root}, levels: {self.num_of_levels}")
         except Exception as e:
             print(f"Error initializing index: {str(e)}")
             self.field_list = []
@@ -89,362 +664,1067 @@ class Index(object):
     # ------------------------------------------------
     # Create index on specified field
     # Author: Xinjian Zhang 278254081@qq.com
+    # the entries are sorted with an external merge sort, so that the memory
+    # used stays under extsort_db.SORT_MEMORY whatever the size of the table
     # Input:
-    #       field_name: name of the field to create index on
+    #       field_name: name of the field to create index on, or list of names
     #       index_type: optional index type override
+    #       include: names of the fields stored in the leaf entries of a B-tree
+    #       progress: optional callable progress(stage, done, total), see _sort_entries
     # Output:
     #       boolean indicating success/failure
     # ------------------------------------------------
-    def create_index(self, field_name, index_type=None):
+    def create_index(self, field_name, index_type=None, include=(), progress=None):
         if index_type:
             self.index_type = index_type  
         try:
             # Get storage object and field information
             storage_obj = storage_db.Storage(self.table_name.encode('utf-8'), debug=False)
             field_list = storage_obj.getFieldList()
+            self.field_list = field_list
             
-            # Find target field
-            field_index = -1
-            field_type = None
-            target_field = field_name.strip()
+            # Find target fields, a list of names makes a composite index
+            field_names = [field_name] if isinstance(field_name, str) else list(field_name)
+            if not field_names or len(field_names) > MAX_INDEX_COLUMNS or len(set(field_names)) != len(field_names):
+                print(f"An index covers 1 to {MAX_INDEX_COLUMNS} different fields: {field_names}")
+                return False
+            field_indexes = self._resolve_fields(field_names)
+            if field_indexes is None:
+                return False
+            include_indexes = self._resolve_fields(include)
+            if include_indexes is None:
+                return False
+            if include_indexes and self.index_type != BTREE_INDEX:
+                print("INCLUDE fields are only stored by B-tree indexes")
+                return False
+            if len(set(include_indexes)) != len(include_indexes):
+                print(f"The INCLUDE fields are repeated: {list(include)}")
+                return False
             
-            for i, field in enumerate(field_list):
-                field_name_in_list = field[0].decode('utf-8').strip() if isinstance(field[0], bytes) else str(field[0]).strip()
-                if field_name_in_list == target_field:
-                    field_index = i
-                    field_type = field[1]
-                    break
+            self._set_fields(field_indexes)
+            self._set_include(include_indexes)
+            if self.payload_size > NODE_SIZE // 8:
+                # a leaf must still hold enough entries to be split
+                print(f"The INCLUDE fields take {self.payload_size} bytes, at most {NODE_SIZE // 8} fit in a leaf entry")
+                self._set_include([])
+                return False
+            field_type = self.field_type
             
-            if field_index == -1:
-                print(f"Field not found: '{field_name}'")
-                print(f"Available fields: {[f[0].decode('utf-8').strip() if isinstance(f[0], bytes) else str(f[0]).strip() for f in field_list]}")
-                return False      
-            
-            # Collect all records
-            records = self._collect_records(storage_obj, field_list, field_index, field_type)            
-            if not records:
-                print("No records collected for indexing")
-                return False           
-            print(f"Successfully collected {len(records)} records")           
+            # Collect all records, sorted in runs
+            sorter = self._sort_entries(storage_obj, progress)
+            if not sorter.count:
+                print("No records collected for indexing, the index starts empty")
+            elif self.debug:
+                print(f"Successfully collected {sorter.count} records")           
             
-            # Create index based on type
+            # Create index based on type, from the merged runs
             if self.index_type == HASH_INDEX:
-                return self._create_hash_index(records, field_type)
+                created = self._create_hash_index(sorter.sorted(), field_type)
             else:
-                return self._create_btree_index(records, field_type)     
+                created = self._create_btree_index(sorter.sorted(), field_type)
+            if created:
+                self._register()
+            return created
         except Exception as e:
             print(f"Error creating index: {str(e)}")
             import traceback
             traceback.print_exc()
             return False
 
+    # ------------------------------------------------
+    # the positions of fields in the field list of the table
+    # Input:
+    #       field_names: names of the fields
+    # Output:
+    #       list of field indexes, None if a field does not exist
+    # ------------------------------------------------
+    def _resolve_fields(self, field_names):
+        names = [f[0].decode('utf-8').strip() if isinstance(f[0], bytes) else str(f[0]).strip() for f in self.field_list]
+        field_indexes = []
+        for field_name in field_names:
+            if field_name.strip() not in names:
+                print(f"Field not found: '{field_name}'")
+                print(f"Available fields: {names}")
+                return None
+            field_indexes.append(names.index(field_name.strip()))
+        return field_indexes
+
+    # ------------------------------------------------
+    # set the fields stored in the leaf entries besides the key
+    # ------------------------------------------------
+    def _set_include(self, include_indexes):
+        self.include_indexes = tuple(include_indexes)
+        if self.include_indexes:
+            self.payload_codec = codec_db.TableCodec([self.field_list[i] for i in self.include_indexes], codec_db.FORMAT_V2)
+            self.payload_size = self.payload_codec.content_len
+        else:
+            self.payload_codec = None
+            self.payload_size = 0
+
+    # ------------------------------------------------
+    # set the indexed fields, field_index and field_type are those of the first one
+    # ------------------------------------------------
+    def _set_fields(self, field_indexes):
+        if field_indexes is None:
+            return
+        self.field_indexes = tuple(field_indexes)
+        self.field_types = tuple([self.field_list[i][1] for i in field_indexes])
+        self.field_index = self.field_indexes[0]
+        self.field_type = self.field_types[0]
+
     # ------------------------------------------------
     # Collect records from table for indexing
     # Author: Xinjian Zhang 278254081@qq.com
+    # the data blocks are read one at a time, in order
     # Input:
     #       storage_obj: storage object for table access
-    #       field_list: list of field definitions
-    #       field_index: index of field to create index on
-    #       field_type: data type of the field
+    #       progress: optional callable, called with ('scan', blocks read, number of blocks)
     # Output:
-    #       list of (key, block_id, offset) tuples
+    #       generator of the lists of (key, block_id, offset[, payload]) tuples of the data blocks
     # ------------------------------------------------
-    def _collect_records(self, storage_obj, field_list, field_index, field_type):
-        records = []
-        storage_obj.f_handle.seek(0)
-        header_block = storage_obj.f_handle.read(common_db.BLOCK_SIZE)
-        
-        if len(header_block) < 12:
+    def _collect_records(self, storage_obj, progress=None):
+        if storage_obj.buffer_manager.block_num(storage_obj.file_name) == 0:
             print("Error: Data file header too small")
-            return []
+            return
         
+        header_block = storage_obj.buffer_manager.read_block(storage_obj.file_name, 0)
         block_id, data_block_num = struct.unpack('!ii', header_block[:8])
         if data_block_num == 0:
-            print("No data blocks found")
-            return []
+            if self.debug:
+                print("No data blocks found")
+            return
         
         for block_id in range(1, data_block_num + 1):
-            storage_obj.f_handle.seek(block_id * common_db.BLOCK_SIZE)
-            block = storage_obj.f_handle.read(common_db.BLOCK_SIZE)
-            if len(block) < 8:
-                continue  
-            
-            block_header, num_records = struct.unpack('!ii', block[:8])
-            if num_records == 0:
+            block = storage_obj.buffer_manager.view_block(storage_obj.file_name, block_id)
+            try:
+                yield self._collect_block_records(block, block_id, storage_obj.codec)
+            finally:
+                block.release()
+            if progress:
+                progress('scan', block_id, data_block_num)
+
+    # ------------------------------------------------
+    # the entries of the index for the records of a table, in sorted runs
+    # a hash index sorts its entries on their reversed hash, see _create_hash_index
+    # Input:
+    #       storage_obj: storage object for table access
+    #       progress: optional callable progress(stage, done, total), called with
+    #                 'scan' and the data blocks read, then by the sorter (see extsort_db)
+    # Output:
+    #       the ExternalSorter holding the entries, sorted() gives them in order
+    # ------------------------------------------------
+    def _sort_entries(self, storage_obj, progress=None):
+        sorter = extsort_db.ExternalSorter(progress=progress)
+        for records in self._collect_records(storage_obj, progress):
+            if self.index_type == HASH_INDEX:
+                records = [(reverse_bits(hash_of(key)), key, block_id, offset) for key, block_id, offset in records]
+            sorter.extend(records)
+        return sorter
+
+    # ------------------------------------------------
+    # Collect the index entries of one data block
+    # Input:
+    #       block: the data block, bytes or memoryview
+    #       block_id: id of the data block
+    #       codec: the record codec of the table
+    # Output:
+    #       list of (key, block_id, offset[, payload]) tuples
+    # ------------------------------------------------
+    def _collect_block_records(self, block, block_id, codec):
+        records = []
+        block_header, num_records = struct.unpack_from('!ii', block, 0)
+        for i in range(num_records):
+            start_offset = struct.unpack_from('!i', block, 8 + i * 4)[0]
+            if start_offset == storage_db.TOMBSTONE:
+                continue  # deleted record
+            if start_offset < 0 or start_offset + codec.record_len > len(block):
+                continue
+            # decode the indexed and included fields only, straight from the block
+            try:
+                values = codec.decode(block, start_offset, self.field_indexes + self.include_indexes)
+            except ValueError:
                 continue
             
-            # Read record offsets
-            offsets = []
-            for i in range(num_records):
-                offset_pos = 8 + i * 4
-                if offset_pos + 4 <= len(block):
-                    offset = struct.unpack('!i', block[offset_pos:offset_pos + 4])[0]
-                    offsets.append(offset)
-            
-            # Process each record
-            for rec_idx, start_offset in enumerate(offsets):
-                if start_offset + 18 > len(block):
-                    continue     
-                
-                record_data_start = start_offset + 18
-                curr_offset = record_data_start
-                record = []
-                
-                # Extract field data
-                for field_idx, field in enumerate(field_list):
-                    field_len = field[2]
-                    if curr_offset + field_len > len(block):
-                        break
-                    field_data = block[curr_offset:curr_offset + field_len]
-                    record.append(field_data)
-                    curr_offset += field_len
-                
-                if len(record) <= field_index:
-                    continue   
-                
-                # Process key based on field type
-                key = record[field_index]
-                if field_type == 2:  # Integer type
-                    try:
-                        if isinstance(key, bytes):
-                            key_str = key.decode('utf-8', 'ignore').strip()
-                            if key_str.isdigit():
-                                value_int = int(key_str)
-                            else:
-                                if len(key) >= 4:
-                                    value_int = struct.unpack('!i', key[:4])[0]
-                                else:
-                                    continue
-                        elif isinstance(key, (int, str)):
-                            value_int = int(key)
-                        else:
-                            continue
-                        key = struct.pack('!q', value_int)
-                        
-                    except Exception as e:
-                        continue
-                else:  # String/VARSTRING type
-                    if len(key) > 0:
-                        key_str = key.decode('utf-8', 'ignore').rstrip('\x00').strip()
-                        key = key_str.encode('utf-8')[:8].ljust(8, b'\x00')
-                    else:
-                        continue
-                
-                records.append((key, block_id, start_offset))
-        
-        print(f"Successfully collected {len(records)} records for indexing")
+            if self.payload_size:
+                records.append((self.key_from_values(values), block_id, start_offset,
+                                self.payload_codec.encode(values[len(self.field_indexes):])))
+            else:
+                records.append((self.key_from_values(values), block_id, start_offset))
         return records
 
     # ------------------------------------------------
     # Create B-tree index from collected records
     # Author: Xinjian Zhang 278254081@qq.com
+    # the sorted entries are packed bottom up into full nodes as they come,
+    # the leaves are chained through their next pointers; only the nodes being
+    # filled are kept in memory, one or two for every level (see _BulkLevel)
     # Input:
-    #       records: list of (key, block_id, offset) tuples
+    #       records: iterable of (key, block_id, offset[, payload]) tuples, sorted
     #       field_type: data type of the indexed field
     # Output:
     #       boolean indicating success/failure
     # ------------------------------------------------
     def _create_btree_index(self, records, field_type):
         try:
-            print(f"Creating B-tree index with {len(records)} records")
-            
-            # Sort records by key
-            if field_type == 2:  # Integer type
-                records.sort(key=lambda x: struct.unpack('!q', x[0])[0])
-            else:  # String type
-                records.sort(key=lambda x: x[0])
-            
-            # Calculate optimal tree structure
-            max_keys_per_node = (common_db.BLOCK_SIZE - 8) // 16
-            
-            # Create leaf nodes
-            leaf_nodes = []
-            current_block_id = 1
-            for i in range(0, len(records), max_keys_per_node):
-                chunk = records[i:i + max_keys_per_node]
-                leaf_node = self._create_leaf_node(chunk, current_block_id)
-                leaf_nodes.append((current_block_id, leaf_node))
-                current_block_id += 1
-            
-            # Set root
-            if len(leaf_nodes) == 1:
-                self.has_root = True
-                self.num_of_levels = 1
-                self.root_node_ptr = leaf_nodes[0][0]
-            else:
-                # Create internal nodes
-                self.root_node_ptr = self._create_internal_nodes(leaf_nodes, current_block_id, field_type)
-                self.has_root = True
+            if self.debug:
+                print("Creating B-tree index from the sorted records")
+            self.field_type = field_type
+            self.version = INDEX_FORMAT_VERSION
+            # forget the nodes of a previous tree
+            self.buffer_manager.truncate_file(self.index_file, 1)
+            _forget_nodes(self.index_file)
+            self.node_count = 0
+            self.free_list = -1
             
-            # Write all nodes to file
-            for block_id, node_data in leaf_nodes:
-                self.f_handle.seek(block_id * common_db.BLOCK_SIZE)
-                self.f_handle.write(node_data)
+            # Create the leaves, the internal nodes above them are filled as the leaves are written
+            leaves = _BulkLevel(self, LEAF_NODE_TYPE)
+            for record in records:
+                leaves.add(record)
             
             # Update file header
-            struct.pack_into('!i?iii', self.first_block_buf, 0, current_block_id - 1, 
-                           True, self.num_of_levels, self.root_node_ptr, BTREE_INDEX)
-            self.f_handle.seek(0)
-            self.f_handle.write(self.first_block_buf)
-            self.f_handle.flush()
+            self.has_root = True
+            self.root_node_ptr, self.num_of_levels = leaves.finish()
+            self._write_header()
+            self.buffer_manager.flush_file(self.index_file)
             
-            print(f"✓ B-tree index created: {self.num_of_levels} levels, root at block {self.root_node_ptr}")
+            if self.debug:
+                print(f"✓ B-tree index created: {self.num_of_levels} levels, root at block {self.root_node_ptr}")
             return True
         except Exception as e:
             print(f"✗ Error creating B-tree index: {str(e)}")
             return False
 
     # ------------------------------------------------
-    # Create leaf node for B-tree
-    # Author: Xinjian Zhang 278254081@qq.com
+    # the key bytes shared by the stored keys of a node
+    # ------------------------------------------------
+    def _prefix(self, node_type, entries):
+        stored = entries[1:] if node_type == INTERNAL_NODE_TYPE else entries
+        if not stored:
+            return b''
+        # the keys are sorted, the first and the last share the prefix of all of them
+        return os.path.commonprefix((stored[0][0], stored[-1][0]))
+
+    # ------------------------------------------------
+    # the number of bytes a node takes in its block, see the file structure
+    # ------------------------------------------------
+    def _node_size(self, node_type, entries):
+        stored = entries[1:] if node_type == INTERNAL_NODE_TYPE else entries
+        prefix_length = len(self._prefix(node_type, entries))
+        return (NODE_HEAD.size + 1 + prefix_length + sum([len(e[0]) for e in stored])
+                - prefix_length * len(stored) + len(entries) * (1 + self._entry_size(node_type)))
+
+    # ------------------------------------------------
+    # the bytes of an entry besides its key and its suffix length
+    # ------------------------------------------------
+    def _entry_size(self, node_type):
+        if node_type == INTERNAL_NODE_TYPE:
+            return INTERNAL_ENTRY.size
+        return LEAF_ENTRY.size + self.payload_size
+
+    # ------------------------------------------------
+    # where to split a node so that both halves take about the same bytes
+    # Output:
+    #       position of the first entry of the right half, never 0 nor len(entries)
+    # ------------------------------------------------
+    def _split_point(self, node_type, entries):
+        entry_size = self._entry_size(node_type)
+        costs = [len(e[0]) + entry_size for e in entries]
+        half, taken = sum(costs) / 2, 0
+        for i, cost in enumerate(costs):
+            taken += cost
+            if taken >= half:
+                return max(1, min(i + 1, len(entries) - 1))
+        return len(entries) - 1
+
+    # ------------------------------------------------
+    # the shortest lower bound of a leaf that is above the entries of the leaf before it
     # Input:
-    #       records: list of records for this leaf node
-    #       block_id: block ID for this node
+    #       left_last: last entry of the left leaf
+    #       right_first: first entry of the right leaf
     # Output:
-    #       buffer containing leaf node data
+    #       (key, block_id, offset) between them
     # ------------------------------------------------
-    def _create_leaf_node(self, records, block_id):
-        node = ctypes.create_string_buffer(common_db.BLOCK_SIZE)
-        struct.pack_into('!ii', node, 0, LEAF_NODE_TYPE, len(records))
-        offset = 8
-        for key, data_block_id, rec_offset in records:
-            struct.pack_into('!8sii', node, offset, key, data_block_id, rec_offset)
-            offset += 16
+    def _separator(self, left_last, right_first):
+        if left_last[0] == right_first[0]:
+            return right_first[:3]
+        # one byte past the common prefix is enough to be above left_last
+        key = right_first[0][:len(os.path.commonprefix((left_last[0], right_first[0]))) + 1]
+        return (key, -1, -1)
+
+    # ------------------------------------------------
+    # the decoded node of a block, from the node cache first
+    # the entries are ordered by (key, block_id, offset), which the normalized
+    # keys let Python compare as plain tuples, so the nodes are searched with
+    # bisect over the cached keys. The result must not be modified
+    # Input:
+    #       block_id: block of the node in the index file
+    # Output:
+    #       (node_type, entries, keys, next node, previous node), see _node_cache
+    # ------------------------------------------------
+    def _load_node(self, block_id):
+        cached = (self.index_file, block_id)
+        node = _node_cache.get(cached)
+        if node is not None:
+            _node_cache.move_to_end(cached)
+            return node
+        node = self.buffer_manager.read_block(self.index_file, block_id)
+        node_type, num_keys, next_node, prev_node = NODE_HEAD.unpack_from(node, 0)
+        entry = INTERNAL_ENTRY if node_type == INTERNAL_NODE_TYPE else LEAF_ENTRY
+        if node_type == FREE_NODE_TYPE:
+            num_keys = 0
+        pos = NODE_HEAD.size + 1 + node[NODE_HEAD.size]
+        prefix = node[NODE_HEAD.size + 1:pos]
+        ends = list(itertools.accumulate(node[pos:pos + num_keys], initial=pos + num_keys))
+        keys = [prefix + node[start:end] for start, end in zip(ends, ends[1:])]
+        width = entry.size // 4
+        ids = struct.unpack_from('!%di' % (num_keys * width), node, ends[-1])
+        columns = [ids[i * num_keys:(i + 1) * num_keys] for i in range(width)]
+        if node_type == LEAF_NODE_TYPE and self.payload_size:
+            pos, size = ends[-1] + entry.size * num_keys, self.payload_size
+            columns.append([node[pos + i * size:pos + (i + 1) * size] for i in range(num_keys)])
+        entries = list(zip(keys, *columns))
+        return self._cache_node(block_id, node_type, entries, next_node, prev_node)
+
+    def _cache_node(self, block_id, node_type, entries, next_node, prev_node):
+        if node_type == INTERNAL_NODE_TYPE or self.payload_size:
+            keys = [entry[:3] for entry in entries]
+        else:
+            keys = entries
+        node = (node_type, entries, keys, next_node, prev_node)
+        _node_cache[(self.index_file, block_id)] = node
+        _node_cache.move_to_end((self.index_file, block_id))
+        if len(_node_cache) > NODE_CACHE_SIZE:
+            _node_cache.popitem(last=False)
         return node
 
     # ------------------------------------------------
-    # Create internal nodes for B-tree
-    # Author: Xinjian Zhang 278254081@qq.com
+    # read a tree node to modify it
     # Input:
-    #       child_nodes: list of child node information
-    #       start_block_id: starting block ID for internal nodes
-    #       field_type: data type of the indexed field
+    #       block_id: block of the node in the index file
     # Output:
-    #       block ID of the root node
+    #       (node_type, list of entries, next node, previous node)
+    #       leaf entries are (key, block_id, offset), followed by the payload when the index has INCLUDE fields,
+    #       internal entries are (key, block_id, offset, child), the first three being a lower bound of the child
     # ------------------------------------------------
-    def _create_internal_nodes(self, child_nodes, start_block_id, field_type):
-        if len(child_nodes) == 1:
-            return child_nodes[0][0]
-        
-        max_children_per_node = (common_db.BLOCK_SIZE - 8) // 12  # 8 bytes key + 4 bytes pointer
-        internal_nodes = []
-        current_block_id = start_block_id
-        
-        for i in range(0, len(child_nodes), max_children_per_node):
-            chunk = child_nodes[i:i + max_children_per_node]
-            internal_node = self._create_internal_node(chunk, field_type)
-            internal_nodes.append((current_block_id, internal_node))
-            
-            # Write internal node
-            self.f_handle.seek(current_block_id * common_db.BLOCK_SIZE)
-            self.f_handle.write(internal_node)
-            current_block_id += 1
-        
+    def _read_node(self, block_id):
+        node_type, entries, _, next_node, prev_node = self._load_node(block_id)
+        return node_type, list(entries), next_node, prev_node
+
+    # ------------------------------------------------
+    # write a tree node into its block
+    # Input:
+    #       block_id: block of the node in the index file
+    #       node_type: LEAF_NODE_TYPE, INTERNAL_NODE_TYPE or FREE_NODE_TYPE
+    #       entries: list of entries, see _read_node
+    #       next_node: next leaf, or next free node, -1 if none
+    #       prev_node: previous leaf, -1 if none
+    #       node: the node already encoded by _encode_node, if it is at hand
+    # ------------------------------------------------
+    def _write_node(self, block_id, node_type, entries, next_node=-1, prev_node=-1, node=None):
+        if node is None:
+            node = self._encode_node(node_type, entries, next_node, prev_node)
+        if len(node) > common_db.BLOCK_SIZE:
+            raise ValueError(f"node {block_id} of {self.index_file} does not fit in a block")
+        self.buffer_manager.write_block(self.index_file, block_id, node.ljust(common_db.BLOCK_SIZE, b'\x00'))
+        self._cache_node(block_id, node_type, list(entries), next_node, prev_node)
+
+    # ------------------------------------------------
+    # the bytes of a node, see the file structure, its length is the size of the node
+    # ------------------------------------------------
+    def _encode_node(self, node_type, entries, next_node=-1, prev_node=-1):
+        prefix = self._prefix(node_type, entries)
+        cut = len(prefix)
+        keys, *ids = zip(*entries) if entries else ((), ())
+        suffixes = list(keys) if cut == 0 else [key[cut:] for key in keys]
+        if suffixes and node_type == INTERNAL_NODE_TYPE:
+            suffixes[0] = b''
+        payloads = b''.join(ids.pop()) if entries and node_type == LEAF_NODE_TYPE and self.payload_size else b''
+        ids = struct.pack('!%di' % (len(entries) * len(ids)), *itertools.chain.from_iterable(ids))
+        return b''.join((NODE_HEAD.pack(node_type, len(entries), next_node, prev_node), bytes((cut,)), prefix,
+                         bytes(map(len, suffixes)), b''.join(suffixes), ids, payloads))
+
+    # ------------------------------------------------
+    # point the previous leaf pointer of a leaf to another leaf
+    # ------------------------------------------------
+    def _set_prev_leaf(self, block_id, prev_node):
+        if block_id != -1:
+            self.buffer_manager.write_block(self.index_file, block_id, struct.pack('!i', prev_node), NODE_HEAD.size - 4)
+            _node_cache.pop((self.index_file, block_id), None)
+
+    # ------------------------------------------------
+    # take a block for a new node, from the free list first
+    # ------------------------------------------------
+    def _allocate_node(self):
+        if self.free_list != -1:
+            block_id = self.free_list
+            self.free_list = self._read_node(block_id)[2]
+            return block_id
+        self.node_count += 1
+        return self.node_count
+
+    # ------------------------------------------------
+    # put the block of a removed node on the free list
+    # ------------------------------------------------
+    def _free_node(self, block_id):
+        self._write_node(block_id, FREE_NODE_TYPE, [], self.free_list)
+        self.free_list = block_id
+
+    # ------------------------------------------------
+    # write the index file header into block 0
+    # ------------------------------------------------
+    def _write_header(self):
+        self.buffer_manager.write_block(self.index_file, 0, INDEX_HEAD.pack(
+            self.node_count, self.has_root, self.num_of_levels, self.root_node_ptr, self.index_type,
+            self.version, self.field_index, self.free_list))
+
+    # ------------------------------------------------
+    # descend from the root to the leaf where target belongs
+    # Input:
+    #       target: (key, block_id, offset) tuple
+    # Output:
+    #       (path, leaf_id, leaf entries, leaf keys, next leaf, previous leaf)
+    #       path is the list of (block_id, entries, child position) of the internal nodes passed
+    #       the entries and keys are the cached ones, see _load_node
+    # ------------------------------------------------
+    def _find_leaf(self, target):
+        path = []
+        block_id = self.root_node_ptr
+        while True:
+            node_type, entries, keys, next_node, prev_node = self._load_node(block_id)
+            if node_type != INTERNAL_NODE_TYPE:
+                return path, block_id, entries, keys, next_node, prev_node
+            # the last child whose lower bound is not greater than target, the first child otherwise
+            i = max(0, bisect.bisect_right(keys, target, 1) - 1)
+            path.append((block_id, entries, i))
+            block_id = entries[i][3]
+
+    # ------------------------------------------------
+    # whether the index is kept up to date by the storage layer
+    # ------------------------------------------------
+    @property
+    def maintained(self):
+        current = INDEX_FORMAT_VERSION if self.index_type == BTREE_INDEX else HASH_FORMAT_VERSION
+        return self.version >= current and self.has_root and bool(self.field_indexes) and \
+            all(0 <= i < len(self.field_list) for i in self.field_indexes)
+
+    # ------------------------------------------------
+    # the index key of a record
+    # Input:
+    #       record: tuple of field values, as decoded by the table codec
+    # ------------------------------------------------
+    def key_of(self, record):
+        return self.key_from_values([record[i] for i in self.field_indexes])
+
+    # ------------------------------------------------
+    # the index key of the values of the indexed fields
+    # Input:
+    #       values: the field values, in the order of the index columns
+    # Output:
+    #       see make_key, make_composite_key for an index on several fields
+    # ------------------------------------------------
+    def key_from_values(self, values):
+        if len(self.field_indexes) == 1:
+            return make_key(values[0], self.field_type)
+        return make_composite_key(values, self.field_types)
+
+    # ------------------------------------------------
+    # the payload of the leaf entry of a record
+    # Input:
+    #       record: tuple of field values, as decoded by the table codec
+    # Output:
+    #       the INCLUDE fields encoded, None when the index has none
+    # ------------------------------------------------
+    def payload_of(self, record):
+        if not self.payload_size:
+            return None
+        return self.payload_codec.encode([record[i] for i in self.include_indexes])
+
+    # ------------------------------------------------
+    # the fields whose values an index-only scan can give: the fields of the
+    # key that are never cut (see MAX_KEY_LENGTH) and the INCLUDE fields
+    # ------------------------------------------------
+    @property
+    def covered_fields(self):
+        covered = set(self.include_indexes)
+        if self.index_type != BTREE_INDEX:
+            return covered
+        length = 0
+        for field_index in self.field_indexes:
+            field_type, field_length = self.field_list[field_index][1], self.field_list[field_index][2]
+            if field_type == 2 or field_type == 3:
+                length += 8
+            elif len(self.field_indexes) == 1:
+                length += field_length
+            else:
+                length += 2 * field_length + 2  # every byte escaped, and the end of the string
+            if length > MAX_KEY_LENGTH:
+                break
+            covered.add(field_index)
+        return covered
+
+    # ------------------------------------------------
+    # the field values held by a leaf entry
+    # Input:
+    #       entry: (key, block_id, offset[, payload]) leaf entry
+    # Output:
+    #       list with a value for every field of the table, None for the fields
+    #       not in covered_fields; strings are bytes as decoded by the table codec
+    # ------------------------------------------------
+    def entry_values(self, entry):
+        record = [None] * len(self.field_list)
+        key, pos = entry[0], 0
+        for field_index, field_type in zip(self.field_indexes, self.field_types):
+            if field_type == 2 or field_type == 3:
+                if len(key) < pos + 8:
+                    break
+                value = struct.unpack_from('!Q', key, pos)[0]
+                record[field_index] = value - 2 ** 63 if field_type == 2 else value != 0
+                pos += 8
+            elif len(self.field_indexes) == 1:
+                record[field_index] = key
+            else:
+                # the part ends at the first 00 byte not followed by ff
+                end = key.find(b'\x00', pos)
+                while end != -1 and key[end + 1:end + 2] == b'\xff':
+                    end = key.find(b'\x00', end + 2)
+                if end == -1 or key[end + 1:end + 2] != b'\x00':
+                    break  # the key was cut inside this field
+                record[field_index] = key[pos:end].replace(b'\x00\xff', b'\x00')
+                pos = end + 2
+        if self.payload_size:
+            values = self.payload_codec.decode(entry[3], -codec_db.RECORD_HEAD.size)
+            for field_index, value in zip(self.include_indexes, values):
+                record[field_index] = value
+        return record
+
+    # ------------------------------------------------
+    # add an entry to the index
+    # for a B-tree, a full node is split in two and the split goes up
+    # the path, a new root is made when the root splits
+    # Input:
+    #       key: index key of the record, see make_key
+    #       rid: (block_id, offset) of the record
+    #       payload: the INCLUDE fields of the record, see payload_of
+    # Output:
+    #       True if the entry is added, False if it is already there
+    # ------------------------------------------------
+    def insert(self, key, rid, payload=None):
+        if not self.maintained:
+            return False
+        if self.index_type == HASH_INDEX:
+            return self._hash_insert(key, rid)
+        entry = (key, rid[0], rid[1])
+        path, leaf_id, entries, keys, next_leaf, prev_leaf = self._find_leaf(entry)
+        pos = bisect.bisect_right(keys, entry)
+        if pos > 0 and keys[pos - 1] == entry:
+            return False
+        if self.payload_size:
+            entry += (payload if payload is not None else bytes(self.payload_size),)
+        entries = entries[:pos] + [entry] + entries[pos:]
+        node = self._encode_node(LEAF_NODE_TYPE, entries, next_leaf, prev_leaf)
+        if len(node) <= NODE_SIZE:
+            self._write_node(leaf_id, LEAF_NODE_TYPE, entries, next_leaf, prev_leaf, node)
+            return True
+        # split the leaf, the new right half is linked between it and its next leaf
+        mid = self._split_point(LEAF_NODE_TYPE, entries)
+        right_id = self._allocate_node()
+        self._write_node(right_id, LEAF_NODE_TYPE, entries[mid:], next_leaf, leaf_id)
+        self._write_node(leaf_id, LEAF_NODE_TYPE, entries[:mid], right_id, prev_leaf)
+        self._set_prev_leaf(next_leaf, right_id)
+        separator = self._separator(entries[mid - 1], entries[mid]) + (right_id,)
+        left_first, left_id = entries[0], leaf_id
+        while path:
+            parent_id, parent_entries, i = path.pop()
+            parent_entries = parent_entries[:i + 1] + [separator] + parent_entries[i + 1:]
+            if self._node_size(INTERNAL_NODE_TYPE, parent_entries) <= NODE_SIZE:
+                self._write_node(parent_id, INTERNAL_NODE_TYPE, parent_entries)
+                self._write_header()
+                return True
+            mid = self._split_point(INTERNAL_NODE_TYPE, parent_entries)
+            right_id = self._allocate_node()
+            self._write_node(right_id, INTERNAL_NODE_TYPE, parent_entries[mid:])
+            self._write_node(parent_id, INTERNAL_NODE_TYPE, parent_entries[:mid])
+            separator = parent_entries[mid][:3] + (right_id,)
+            left_first, left_id = parent_entries[0], parent_id
+        # the root was split
+        self.root_node_ptr = self._allocate_node()
+        self._write_node(self.root_node_ptr, INTERNAL_NODE_TYPE, [left_first[:3] + (left_id,), separator])
         self.num_of_levels += 1
-        return self._create_internal_nodes(internal_nodes, current_block_id, field_type)
+        self._write_header()
+        return True
 
     # ------------------------------------------------
-    # Create single internal node
-    # Author: Xinjian Zhang 278254081@qq.com
+    # remove an entry from the index
+    # for a B-tree, a node left less than a third full takes entries
+    # from a sibling, or is merged with it when both fit in one node
     # Input:
-    #       child_nodes: list of child nodes for this internal node
-    #       field_type: data type of the indexed field
+    #       key: index key of the record, see make_key
+    #       rid: (block_id, offset) of the record
     # Output:
-    #       buffer containing internal node data
+    #       True if the entry is removed, False if it is not in the index
     # ------------------------------------------------
-    def _create_internal_node(self, child_nodes, field_type):
-        node = ctypes.create_string_buffer(common_db.BLOCK_SIZE)
-        struct.pack_into('!ii', node, 0, INTERNAL_NODE_TYPE, len(child_nodes))
-        offset = 8
-        
-        for block_id, child_node_data in child_nodes:
-            first_key = self._get_first_key_from_node(child_node_data, field_type)
-            
-            struct.pack_into('!8si', node, offset, first_key, block_id)
-            offset += 12
-        
-        return node
+    def delete(self, key, rid):
+        if not self.maintained:
+            return False
+        if self.index_type == HASH_INDEX:
+            return self._hash_delete(key, rid)
+        target = (key, rid[0], rid[1])
+        path, leaf_id, entries, keys, next_leaf, prev_leaf = self._find_leaf(target)
+        pos = bisect.bisect_left(keys, target)
+        if pos == len(keys) or keys[pos] != target:
+            return False
+        entries = entries[:pos] + entries[pos + 1:]
+        node = self._encode_node(LEAF_NODE_TYPE, entries, next_leaf, prev_leaf)
+        self._write_node(leaf_id, LEAF_NODE_TYPE, entries, next_leaf, prev_leaf, node)
+        size = len(node)
+        changed = False
+        while path and size < UNDERFLOW_SIZE:
+            parent_id, parent_entries, i = path.pop()
+            parent_entries = list(parent_entries)
+            if not self._rebalance(parent_entries, i):
+                break
+            self._write_node(parent_id, INTERNAL_NODE_TYPE, parent_entries)
+            size = self._node_size(INTERNAL_NODE_TYPE, parent_entries)
+            changed = True
+            if not path and len(parent_entries) == 1:
+                # the root has a single child left, which becomes the root
+                self._free_node(parent_id)
+                self.root_node_ptr = parent_entries[0][3]
+                self.num_of_levels -= 1
+        if changed:
+            self._write_header()
+        return True
 
     # ------------------------------------------------
-    # Extract first key from a node
-    # Author: Xinjian Zhang 278254081@qq.com
+    # fix the underflow of a child by merging it with a sibling,
+    # or by sharing their bytes evenly when they do not fit in one node
     # Input:
-    #       node_data: buffer containing node data
-    #       field_type: data type of the indexed field
+    #       parent_entries: entries of the parent node, updated in place
+    #       i: position of the underflowing child in the parent
+    # Output:
+    #       False if the nodes are left as they are, the shared entries would
+    #       not fit with their new prefixes or the new bound would not fit in the parent
+    # ------------------------------------------------
+    def _rebalance(self, parent_entries, i):
+        left = i - 1 if i > 0 else 0  # position of the left node of the pair
+        left_id, right_id = parent_entries[left][3], parent_entries[left + 1][3]
+        node_type, left_entries, _, left_prev = self._read_node(left_id)
+        _, right_entries, right_next, _ = self._read_node(right_id)
+        if node_type == INTERNAL_NODE_TYPE:
+            # the parent separator is the lower bound of the first child of the right node
+            merged = left_entries + [parent_entries[left + 1][:3] + (right_entries[0][3],)] + right_entries[1:]
+        else:
+            merged = left_entries + right_entries
+        if self._node_size(node_type, merged) <= NODE_SIZE:
+            self._write_node(left_id, node_type, merged, right_next, left_prev)
+            self._free_node(right_id)
+            if node_type == LEAF_NODE_TYPE:
+                self._set_prev_leaf(right_next, left_id)
+            del parent_entries[left + 1]
+        else:
+            mid = self._split_point(node_type, merged)
+            if node_type == LEAF_NODE_TYPE:
+                bound = self._separator(merged[mid - 1], merged[mid]) + (right_id,)
+            else:
+                bound = merged[mid][:3] + (right_id,)
+            if (self._node_size(node_type, merged[:mid]) > NODE_SIZE or self._node_size(node_type, merged[mid:]) > NODE_SIZE
+                    or self._node_size(INTERNAL_NODE_TYPE, parent_entries[:left + 1] + [bound] + parent_entries[left + 2:]) > NODE_SIZE):
+                return False
+            if node_type == LEAF_NODE_TYPE:
+                self._write_node(left_id, node_type, merged[:mid], right_id, left_prev)
+                self._write_node(right_id, node_type, merged[mid:], right_next, left_id)
+            else:
+                self._write_node(left_id, node_type, merged[:mid])
+                self._write_node(right_id, node_type, merged[mid:])
+            parent_entries[left + 1] = bound
+        return True
+
+    # ------------------------------------------------
+    # empty the index, a B-tree keeps only a root leaf without entries
+    # ------------------------------------------------
+    def clear(self):
+        if self.index_type == HASH_INDEX:
+            self._create_hash_index([], self.field_type)
+            return
+        self.buffer_manager.truncate_file(self.index_file, 1)
+        _forget_nodes(self.index_file)
+        self.node_count = 0
+        self.free_list = -1
+        self.root_node_ptr = self._allocate_node()
+        self._write_node(self.root_node_ptr, LEAF_NODE_TYPE, [])
+        self.has_root = True
+        self.num_of_levels = 1
+        self._write_header()
+
+    # ------------------------------------------------
+    # build the index again from the records of a table
+    # Input:
+    #       storage_obj: the Storage object of the indexed table
+    #       progress: optional callable progress(stage, done, total), see _sort_entries
     # Output:
-    #       first key in the node (8 bytes)
+    #       boolean indicating success/failure
+    # ------------------------------------------------
+    def rebuild(self, storage_obj, progress=None):
+        sorter = self._sort_entries(storage_obj, progress)
+        if self.index_type == HASH_INDEX:
+            created = self._create_hash_index(sorter.sorted(), self.field_type)
+        else:
+            created = self._create_btree_index(sorter.sorted(), self.field_type)
+        if created:
+            self._register()
+        return created
+
     # ------------------------------------------------
-    def _get_first_key_from_node(self, node_data, field_type):
-        node_type, num_keys = struct.unpack_from('!ii', node_data, 0)
-        if num_keys > 0:
-            first_key, _, _ = struct.unpack_from('!8sii', node_data, 8)
-            return first_key
-        return b'\x00' * 8
+    # record the index in the catalog with the lsn of its last build
+    # ------------------------------------------------
+    def _register(self):
+        names = [field[0].decode('utf-8').strip() if isinstance(field[0], bytes) else str(field[0]).strip()
+                 for field in self.field_list]
+        register_index(self.index_name, self.table_name, [names[i] for i in self.field_indexes], self.index_type,
+                       self.index_file, [names[i] for i in self.include_indexes])
+
+    def flush(self):
+        self.buffer_manager.flush_file(self.index_file)
 
     # ------------------------------------------------
     # Create hash index from collected records
     # Author: Xinjian Zhang 278254081@qq.com
+    # the buckets are split on their hash bits until they fit in one page,
+    # they are written one after the other from the sorted records (see _stream_buckets)
     # Input:
-    #       records: list of (key, block_id, offset) tuples
+    #       records: iterable of (reversed hash, key, block_id, offset) tuples,
+    #                sorted, see reverse_bits
     #       field_type: data type of the indexed field
     # Output:
     #       boolean indicating success/failure
     # ------------------------------------------------
     def _create_hash_index(self, records, field_type):
         try:
-            print(f"Creating hash index with {len(records)} records")
-            
-            # Initialize hash table
-            hash_table = [[] for _ in range(HASH_TABLE_SIZE)]
-            
-            # Hash all records
-            for key, block_id, offset in records:
-                if field_type == 2:  # Integer
-                    value_int = struct.unpack('!q', key)[0]
-                    hash_value = hash(value_int) % HASH_TABLE_SIZE
-                else:  # String
-                    key_str = key.decode('utf-8', 'ignore').strip()
-                    hash_value = hash(key_str) % HASH_TABLE_SIZE
-                hash_table[hash_value].append((key, block_id, offset))
-            
-            # Write hash table to file
-            self.f_handle.seek(common_db.BLOCK_SIZE)  # Skip header block
-            bucket_ptrs = []
-            current_pos = common_db.BLOCK_SIZE + HASH_TABLE_SIZE * 4
-            
-            # Write bucket pointer table
-            for bucket in hash_table:
-                if bucket:
-                    bucket_ptrs.append(current_pos)
-                    current_pos += len(bucket) * 16 + 4
-                else:
-                    bucket_ptrs.append(0)
-            
-            # Write bucket pointers
-            for ptr in bucket_ptrs:
-                self.f_handle.write(struct.pack('!i', ptr))
+            if self.debug:
+                print("Creating hash index from the sorted records")
+            self.field_type = field_type
+            self.version = HASH_FORMAT_VERSION
+            self.buffer_manager.truncate_file(self.index_file, 1)
+            _forget_nodes(self.index_file)
+            self.node_count = 0
+            self.free_list = -1
             
-            # Write buckets
-            for bucket in hash_table:
-                if bucket:
-                    self.f_handle.write(struct.pack('!i', len(bucket)))
-                    for key, block_id, rec_offset in bucket:
-                        self.f_handle.write(struct.pack('!8sii', key, block_id, rec_offset))
+            # write the buckets, then the directory after them
+            buckets = self._stream_buckets(records)
+            self.num_of_levels = max([depth for depth, _, _ in buckets])
+            self.root_node_ptr = self._allocate_directory(self.num_of_levels)
+            directory = [-1] * (1 << self.num_of_levels)
+            for depth, bits, first_page in buckets:
+                for slot in range(bits, len(directory), 1 << depth):
+                    directory[slot] = first_page
+            self._write_directory(directory)
             
             # Update header
             self.has_root = True
-            self.hash_table_size = HASH_TABLE_SIZE
-            struct.pack_into('!i?iii', self.first_block_buf, 0, 1, True, 1, 1, HASH_INDEX)
-            self.f_handle.seek(0)
-            self.f_handle.write(self.first_block_buf)
-            self.f_handle.flush()
+            self._write_header()
+            self.buffer_manager.flush_file(self.index_file)
             
-            print(f"✓ Hash index created with {HASH_TABLE_SIZE} buckets")
+            if self.debug:
+                print(f"✓ Hash index created with {len(directory)} buckets")
             return True
         except Exception as e:
             print(f"✗ Error creating hash index: {str(e)}")
             return False
 
+    # ------------------------------------------------
+    # write the buckets of a new hash index from its entries sorted on their reversed hash
+    # the reversed hashes of a bucket of local depth d, those ending with the same d
+    # bits, make a range of 2^(32-d) values aligned on its size. The ranges are walked
+    # from 0 on, each being halved while its entries do not fit in a page and have
+    # different hashes, as a full bucket is split; at most a page of entries is read
+    # ahead, the entries of a single hash filling more pages are streamed into a chain
+    # Input:
+    #       records: iterable of (reversed hash, key, block_id, offset), sorted
+    # Output:
+    #       list of (local_depth, hash bits, first page) of the buckets
+    # ------------------------------------------------
+    def _stream_buckets(self, records):
+        source = iter(records)
+        window = collections.deque()  # the entries read ahead
+        buckets = []
+
+        def peek(i):
+            # the entry i of the window, None after the last one
+            while len(window) <= i:
+                record = next(source, None)
+                if record is None:
+                    return None
+                window.append(record)
+            return window[i]
+
+        def take(end):
+            # the entries below end, as bucket entries
+            while peek(0) is not None and window[0][0] < end:
+                record = window.popleft()
+                yield (reverse_bits(record[0]),) + record[1:]
+
+        def write_bucket(start, depth):
+            end = start + (1 << (32 - depth))
+            buckets.append((depth, reverse_bits(start), self._stream_chain(depth, take(end))[0]))
+            return end
+
+        position = 0
+        while position < 1 << 32:
+            # the largest range starting at position
+            depth = 33 - (position & -position).bit_length() if position else 0
+            while True:
+                end = position + (1 << (32 - depth))
+                size, i, hashes = BUCKET_HEAD.size, 0, set()
+                while size <= NODE_SIZE and peek(i) is not None and window[i][0] < end:
+                    size += BUCKET_ENTRY_SIZE + len(window[i][1])
+                    hashes.add(window[i][0])
+                    i += 1
+                if size <= NODE_SIZE or depth == MAX_GLOBAL_DEPTH:
+                    position = write_bucket(position, depth)
+                    break
+                if len(hashes) > 1:
+                    depth += 1
+                    continue
+                # the entries of one hash fill more than a page, their bucket is the
+                # range where the next hash is left out, the ranges before it are empty
+                first = window[0][0]
+                chain = []  # local depth and start of the bucket, known once its hash is read
+
+                def chain_entries():
+                    yield from take(first + 1)
+                    following = peek(0)
+                    chain_depth = depth
+                    if following is not None and following[0] < end:
+                        chain_depth = min(33 - (first ^ following[0]).bit_length(), MAX_GLOBAL_DEPTH)
+                    chain.extend((chain_depth, first >> (32 - chain_depth) << (32 - chain_depth)))
+                    yield from take(chain[1] + (1 << (32 - chain_depth)))
+
+                pages = self._stream_chain(depth, chain_entries())
+                chain_depth, start = chain
+                if chain_depth != depth:
+                    self._set_chain_depth(pages, chain_depth)
+                buckets.append((chain_depth, reverse_bits(start), pages[0]))
+                while position < start:
+                    gap_depth = 33 - (position & -position).bit_length() if position else 0
+                    while position + (1 << (32 - gap_depth)) > start:
+                        gap_depth += 1
+                    position = write_bucket(position, gap_depth)
+                position = start + (1 << (32 - chain_depth))
+                break
+        return buckets
+
+    # ------------------------------------------------
+    # write the entries of a new bucket into pages taken as they fill
+    # Input:
+    #       local_depth: local depth of the bucket
+    #       entries: iterable of (hash, key, block_id, offset)
+    # Output:
+    #       list of the pages of the bucket
+    # ------------------------------------------------
+    def _stream_chain(self, local_depth, entries):
+        pages, chunk, size = [self._allocate_node()], [], BUCKET_HEAD.size
+        for entry in entries:
+            if chunk and size + BUCKET_ENTRY_SIZE + len(entry[1]) > NODE_SIZE:
+                pages.append(self._allocate_node())
+                self._write_bucket_page(pages[-2], local_depth, chunk, pages[-1])
+                chunk, size = [], BUCKET_HEAD.size
+            chunk.append(entry)
+            size += BUCKET_ENTRY_SIZE + len(entry[1])
+        self._write_bucket_page(pages[-1], local_depth, chunk, -1)
+        return pages
+
+    def _set_chain_depth(self, pages, local_depth):
+        for page_id in pages:
+            self.buffer_manager.write_bytes(self.index_file, page_id * common_db.BLOCK_SIZE + 4, struct.pack('!i', local_depth))
+
+    # ------------------------------------------------
+    # take consecutive pages at the end of the file for a directory
+    # Input:
+    #       depth: global depth of the directory
+    # Output:
+    #       first page of the directory
+    # ------------------------------------------------
+    def _allocate_directory(self, depth):
+        first_page = self.node_count + 1
+        self.node_count += -(-(4 << depth) // common_db.BLOCK_SIZE)
+        return first_page
+
+    def _read_directory(self):
+        count = 1 << self.num_of_levels
+        data = self.buffer_manager.read_bytes(self.index_file, self.root_node_ptr * common_db.BLOCK_SIZE, 4 * count)
+        return list(struct.unpack('!%di' % count, data))
+
+    def _write_directory(self, directory):
+        self.buffer_manager.write_bytes(self.index_file, self.root_node_ptr * common_db.BLOCK_SIZE,
+                                        struct.pack('!%di' % len(directory), *directory))
+
+    # ------------------------------------------------
+    # the first page of the bucket of a hash, one directory slot is read
+    # ------------------------------------------------
+    def _bucket_of(self, h):
+        slot = h & ((1 << self.num_of_levels) - 1)
+        data = self.buffer_manager.read_bytes(self.index_file, self.root_node_ptr * common_db.BLOCK_SIZE + 4 * slot, 4)
+        return struct.unpack('!i', data)[0]
+
+    # ------------------------------------------------
+    # read all the entries of a bucket, its overflow pages included
+    # Input:
+    #       first_page: first page of the bucket
+    # Output:
+    #       (local_depth, list of (hash, key, block_id, offset), list of the pages of the bucket)
+    # ------------------------------------------------
+    def _read_chain(self, first_page):
+        entries, pages = [], []
+        page_id = first_page
+        while page_id != -1:
+            local_depth, page_entries, next_page = self._decode_bucket(self.buffer_manager.read_block(self.index_file, page_id))
+            entries.extend(page_entries)
+            pages.append(page_id)
+            if len(pages) == 1:
+                depth = local_depth
+            page_id = next_page
+        return depth, entries, pages
+
+    # ------------------------------------------------
+    # the entries of one bucket page
+    # Output:
+    #       (local_depth, list of (hash, key, block_id, offset), overflow page)
+    # ------------------------------------------------
+    def _decode_bucket(self, page):
+        _, local_depth, count, next_page = BUCKET_HEAD.unpack_from(page, 0)
+        ids = struct.unpack_from('!%dI%di' % (count, 2 * count), page, BUCKET_HEAD.size)
+        pos = BUCKET_HEAD.size + 12 * count
+        ends = list(itertools.accumulate(page[pos:pos + count], initial=pos + count))
+        keys = [page[start:end] for start, end in zip(ends, ends[1:])]
+        return local_depth, list(zip(ids[:count], keys, ids[count:2 * count], ids[2 * count:])), next_page
+
+    # ------------------------------------------------
+    # write the entries of a bucket into its pages, pages are taken or freed as needed
+    # Input:
+    #       pages: the pages of the bucket, empty for a new bucket
+    #       local_depth: local depth of the bucket
+    #       entries: list of (hash, key, block_id, offset)
+    # Output:
+    #       first page of the bucket
+    # ------------------------------------------------
+    def _write_chain(self, pages, local_depth, entries):
+        chunks, chunk, size = [], [], BUCKET_HEAD.size
+        for entry in entries:
+            if chunk and size + BUCKET_ENTRY_SIZE + len(entry[1]) > NODE_SIZE:
+                chunks.append(chunk)
+                chunk, size = [], BUCKET_HEAD.size
+            chunk.append(entry)
+            size += BUCKET_ENTRY_SIZE + len(entry[1])
+        chunks.append(chunk)
+        pages = list(pages)
+        if len(pages) != len(chunks):
+            while len(pages) < len(chunks):
+                pages.append(self._allocate_node())
+            for page_id in pages[len(chunks):]:
+                self._free_node(page_id)
+            self._write_header()  # the page count or the free list changed
+        for i, chunk in enumerate(chunks):
+            self._write_bucket_page(pages[i], local_depth, chunk, pages[i + 1] if i + 1 < len(chunks) else -1)
+        return pages[0]
+
+    # ------------------------------------------------
+    # write one page of a bucket
+    # Input:
+    #       page_id: the page
+    #       local_depth: local depth of the bucket
+    #       chunk: list of (hash, key, block_id, offset) fitting in the page
+    #       next_page: overflow page of the bucket, -1 if none
+    # ------------------------------------------------
+    def _write_bucket_page(self, page_id, local_depth, chunk, next_page):
+        hashes, keys, block_ids, offsets = zip(*chunk) if chunk else ((), (), (), ())
+        page = b''.join((BUCKET_HEAD.pack(HASH_BUCKET_TYPE, local_depth, len(chunk), next_page),
+                         struct.pack('!%dI%di' % (len(chunk), 2 * len(chunk)), *hashes, *block_ids, *offsets),
+                         bytes(map(len, keys)), b''.join(keys)))
+        self.buffer_manager.write_block(self.index_file, page_id, page.ljust(common_db.BLOCK_SIZE, b'\x00'))
+        _node_cache.pop((self.index_file, page_id), None)
+
+    # ------------------------------------------------
+    # add an entry to the hash index, a bucket that no longer fits in
+    # one page is split until it does, or gets an overflow page when
+    # all its keys have the same hash
+    # ------------------------------------------------
+    def _hash_insert(self, key, rid):
+        entry = (hash_of(key), key, rid[0], rid[1])
+        while True:
+            slot = entry[0] & ((1 << self.num_of_levels) - 1)
+            local_depth, entries, pages = self._read_chain(self._bucket_of(entry[0]))
+            if entry in entries:
+                return False
+            size = BUCKET_HEAD.size + sum([BUCKET_ENTRY_SIZE + len(e[1]) for e in entries]) + BUCKET_ENTRY_SIZE + len(key)
+            if (size > NODE_SIZE and local_depth < MAX_GLOBAL_DEPTH
+                    and any(e[0] != entry[0] for e in entries)):
+                self._split_bucket(slot, local_depth, entries, pages)
+                continue
+            self._write_chain(pages, local_depth, entries + [entry])
+            return True
+
+    # ------------------------------------------------
+    # split a bucket on the hash bit after its local depth
+    # Input:
+    #       slot: a directory slot of the bucket
+    #       local_depth, entries, pages: the bucket, see _read_chain
+    # ------------------------------------------------
+    def _split_bucket(self, slot, local_depth, entries, pages):
+        if local_depth == self.num_of_levels:
+            self._double_directory()
+        bit = 1 << local_depth
+        self._write_chain(pages, local_depth + 1, [e for e in entries if not e[0] & bit])
+        new_page = self._write_chain([], local_depth + 1, [e for e in entries if e[0] & bit])
+        # the slots of the bucket end with its local_depth bits, those with the bit set move
+        for moved in range((slot & (bit - 1)) | bit, 1 << self.num_of_levels, bit << 1):
+            self.buffer_manager.write_bytes(self.index_file, self.root_node_ptr * common_db.BLOCK_SIZE + 4 * moved,
+                                            struct.pack('!i', new_page))
+        self._write_header()
+
+    # ------------------------------------------------
+    # double the directory, every bucket gets twice as many slots
+    # the directory moves to the end of the file when it outgrows its pages
+    # ------------------------------------------------
+    def _double_directory(self):
+        directory = self._read_directory()
+        old_pages = -(-(4 << self.num_of_levels) // common_db.BLOCK_SIZE)
+        self.num_of_levels += 1
+        if 4 << self.num_of_levels > old_pages * common_db.BLOCK_SIZE:
+            old_first = self.root_node_ptr
+            self.root_node_ptr = self._allocate_directory(self.num_of_levels)
+            for page_id in range(old_first, old_first + old_pages):
+                self._free_node(page_id)
+        self._write_directory(directory + directory)
+        self._write_header()
+
+    # ------------------------------------------------
+    # remove an entry from the hash index, the overflow pages left empty are freed
+    # ------------------------------------------------
+    def _hash_delete(self, key, rid):
+        entry = (hash_of(key), key, rid[0], rid[1])
+        local_depth, entries, pages = self._read_chain(self._bucket_of(entry[0]))
+        if entry not in entries:
+            return False
+        entries.remove(entry)
+        self._write_chain(pages, local_depth, entries)
+        return True
+
+    # ------------------------------------------------
+    # the record ids of one key, with either index type
+    # Input:
+    #       key: index key, see make_key
+    # Output:
+    #       list of (block_id, offset), in the order of the data file
+    # ------------------------------------------------
+    def lookup(self, key):
+        if not self.has_root:
+            return []
+        if self.index_type == HASH_INDEX:
+            rids = self._hash_search(key, self.field_type)
+        else:
+            rids = list(self.range_search(key, key))
+        return sorted(rids)
+
     # ------------------------------------------------
     # Search for records using index
     # Author: Xinjian Zhang 278254081@qq.com
@@ -460,6 +1740,9 @@ class Index(object):
         if not self.has_root:
             print("No root node available")
             return []
+        if len(self.field_indexes) > 1:
+            print("The index covers several fields, search it with lookup or range_search")
+            return []
         
         # 确保field_list存在
         if not hasattr(self, 'field_list') or not self.field_list:
@@ -487,17 +1770,11 @@ class Index(object):
             return []
         
         # Convert search value to proper format
-        if field_type == 2:  # Integer
-            try:
-                search_int = int(search_value)
-                search_key = struct.pack('!q', search_int)  
-            except ValueError:
-                print(f"Invalid integer value: {search_value}")
-                return []
-        else:  # String
-            if not hasattr(self, 'max_key_length'):
-                self.max_key_length = 8
-            search_key = search_value.ljust(self.max_key_length)[:self.max_key_length].encode('utf-8')
+        try:
+            search_key = make_key(search_value, field_type)
+        except ValueError:
+            print(f"Invalid integer value: {search_value}")
+            return []
         
         if self.index_type == BTREE_INDEX:
             return self._btree_search(search_key, field_type)
@@ -506,176 +1783,138 @@ class Index(object):
         else:
             return []
 
+    # ------------------------------------------------
+    # Search the hash index for the entries of a key
+    # Input:
+    #       search_key: index key, see make_key
+    #       field_type: data type of the key
+    # Output:
+    #       list of (block_id, offset) tuples for matching records
+    # ------------------------------------------------
     def _hash_search(self, search_key, field_type):
         try:
-            if field_type == 2:  # Integer
-                search_int = struct.unpack('!q', search_key)[0]
-                hash_value = abs(hash(search_int)) % self.hash_table_size  
-            else:  # String
-                search_str = search_key.decode('utf-8', 'ignore').strip()
-                hash_value = abs(hash(search_str)) % self.hash_table_size  
-            
-            # Read bucket pointer
-            self.f_handle.seek(common_db.BLOCK_SIZE + hash_value * 4)
-            bucket_ptr_data = self.f_handle.read(4)
-            if len(bucket_ptr_data) < 4:
-                return []
-            
-            bucket_ptr = struct.unpack('!i', bucket_ptr_data)[0]
-            if bucket_ptr == 0:
-                return []
-            
-            # Read bucket with better error handling
-            self.f_handle.seek(bucket_ptr)
-            bucket_size_data = self.f_handle.read(4)
-            if len(bucket_size_data) < 4:
-                return []
-            
-            bucket_size = struct.unpack('!i', bucket_size_data)[0]
-            if bucket_size <= 0: 
-                return []
-                
+            h = hash_of(search_key)
             results = []
-            
-            bucket_data = self.f_handle.read(bucket_size * 16)
-            if len(bucket_data) < bucket_size * 16: 
-                print(f"Warning: Expected {bucket_size * 16} bytes, got {len(bucket_data)}")
-                return []
-            
-            for i in range(bucket_size):
-                offset = i * 16
-                if offset + 16 <= len(bucket_data):
-                    key, block_id, record_offset = struct.unpack_from('!8sii', bucket_data, offset)
-                    
-                    if self._keys_equal_simple(key, search_key, field_type):
-                        results.append((block_id, record_offset))
-            
+            page_id = self._bucket_of(h)
+            while page_id != -1:
+                page = self.buffer_manager.read_block(self.index_file, page_id)
+                _, _, count, page_id = BUCKET_HEAD.unpack_from(page, 0)
+                # only the entries whose hash matches are decoded
+                ids = struct.unpack_from('!%dI%di' % (count, 2 * count), page, BUCKET_HEAD.size)
+                pos = BUCKET_HEAD.size + 12 * count
+                ends = None
+                for i in [i for i in range(count) if ids[i] == h]:
+                    if ends is None:
+                        ends = list(itertools.accumulate(page[pos:pos + count], initial=pos + count))
+                    if page[ends[i]:ends[i + 1]] == search_key:
+                        results.append((ids[count + i], ids[2 * count + i]))
             return results
-            
         except Exception as e:
             print(f"Hash search error: {e}")
             return []
 
+    # ------------------------------------------------
+    # Search the B-tree for the entries of a key
+    # Input:
+    #       search_key: index key, see make_key
+    #       field_type: data type of the key
+    # Output:
+    #       list of (block_id, offset) tuples for matching records
+    # ------------------------------------------------
     def _btree_search(self, search_key, field_type):
-        results = []
-        
         try:
-            first_leaf_block = self._find_first_leaf_with_key(search_key, field_type)
-            
-            if first_leaf_block == -1:
-                return results
-            
-            current_leaf = first_leaf_block
-            scanned_leaves = set() 
-            max_leaves_to_scan = max(100, self.num_of_levels * 50)
-            
-            while current_leaf != -1 and current_leaf not in scanned_leaves:
-                scanned_leaves.add(current_leaf)
-                
-                node_buf = ctypes.create_string_buffer(common_db.BLOCK_SIZE)
-                self.f_handle.seek(current_leaf * common_db.BLOCK_SIZE)
-                self.f_handle.readinto(node_buf)
-                
-                node_type, num_keys = struct.unpack_from('!ii', node_buf, 0)
-                
-                if node_type != LEAF_NODE_TYPE:
-                    break
-
-                offset = 8
-                found_in_this_leaf = False
-                
-                for i in range(num_keys):
-                    key, block_id, record_offset = struct.unpack_from('!8sii', node_buf, offset)
-                    
-                    if self._keys_equal_simple(key, search_key, field_type):
-                        results.append((block_id, record_offset))
-                        found_in_this_leaf = True
-                    
-                    offset += 16
-                
-                if not found_in_this_leaf and len(results) > 0:
-                    pass
-                
-                current_leaf += 1
-                
-                if len(scanned_leaves) > max_leaves_to_scan:
-                    print(f"Warning: Scanned {max_leaves_to_scan} leaves, may have missed some results")
-                    break
-    
+            self.field_type = field_type
+            return list(self.range_search(search_key, search_key))
         except Exception as e:
             print(f"B-tree search error: {e}")
-        
-        return results
+            return []
 
-    def _find_first_leaf_with_key(self, search_key, field_type):
-        try:
-            current_block = self.root_node_ptr
-            
+    # ------------------------------------------------
+    # Search the B-tree for the records whose key is in a range
+    # the descent stops at the leaf of the first key of the range, the
+    # following leaves are read along the leaf chain until the range ends,
+    # so only the leaves holding keys of the range are read
+    # Input:
+    #       lo, hi: index keys (see make_key) bounding the range, None for no bound
+    #       lo_inclusive, hi_inclusive: whether keys equal to a bound are in the range
+    #       reverse: walk from hi down to lo along the previous leaf pointers
+    # Output:
+    #       generator of (block_id, offset) of the records, in key order
+    # ------------------------------------------------
+    def range_search(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True, reverse=False):
+        for entry in self._range_entries(lo, hi, lo_inclusive, hi_inclusive, reverse):
+            yield entry[1], entry[2]
+
+    # ------------------------------------------------
+    # the records of a key range given by the leaves alone, without reading
+    # the data file; only the covered_fields of the records are set
+    # Input:
+    #       see range_search
+    # Output:
+    #       generator of records, see entry_values
+    # ------------------------------------------------
+    def covered_search(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True, reverse=False):
+        for entry in self._range_entries(lo, hi, lo_inclusive, hi_inclusive, reverse):
+            yield self.entry_values(entry)
+
+    # ------------------------------------------------
+    # the leaf entries of a range, see range_search
+    # Output:
+    #       generator of (key, block_id, offset[, payload])
+    # ------------------------------------------------
+    def _range_entries(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True, reverse=False):
+        if not self.has_root:
+            return
+        if not reverse:
+            if lo is None:
+                _, entries, next_leaf, _ = self._edge_leaf(last=False)
+                pos = 0
+            else:
+                # before every record id of lo, or after all of them
+                target = (lo, -1, -1) if lo_inclusive else (lo, float('inf'), float('inf'))
+                _, _, entries, keys, next_leaf, _ = self._find_leaf(target)
+                pos = bisect.bisect_right(keys, target)
             while True:
-                node_buf = ctypes.create_string_buffer(common_db.BLOCK_SIZE)
-                self.f_handle.seek(current_block * common_db.BLOCK_SIZE)
-                self.f_handle.readinto(node_buf)
-                
-                node_type, num_keys = struct.unpack_from('!ii', node_buf, 0)
-                
-                if node_type == LEAF_NODE_TYPE:
-                    return current_block
-                
-                elif node_type == INTERNAL_NODE_TYPE:
-                    offset = 8
-                    next_child_ptr = -1
-                    
-                    for i in range(num_keys):
-                        key, ptr = struct.unpack_from('!8si', node_buf, offset)
-                        
-                        if field_type == 2:
-                            key_val = struct.unpack('!q', key)[0]
-                            search_val = struct.unpack('!q', search_key)[0]
-                            
-                            if search_val <= key_val:
-                                next_child_ptr = ptr
-                                break
-                        
-                        offset += 12
-                    
-                    if next_child_ptr == -1:
-                        if num_keys > 0:
-                            offset = 8 + (num_keys - 1) * 12
-                            _, next_child_ptr = struct.unpack_from('!8si', node_buf, offset)
-                    
-                    if next_child_ptr == -1:
-                        return -1
-                    
-                    current_block = next_child_ptr
-                else:
-                    return -1
-                    
-        except Exception as e:
-            print(f"Error finding first leaf: {e}")
-            return -1
+                for entry in entries[pos:]:
+                    if hi is not None and (entry[0] > hi or (entry[0] == hi and not hi_inclusive)):
+                        return
+                    yield entry
+                if next_leaf == -1:
+                    return
+                _, entries, _, next_leaf, _ = self._load_node(next_leaf)
+                pos = 0
+        else:
+            if hi is None:
+                _, entries, _, prev_leaf = self._edge_leaf(last=True)
+                pos = len(entries)
+            else:
+                target = (hi, float('inf'), float('inf')) if hi_inclusive else (hi, -1, -1)
+                _, _, entries, keys, _, prev_leaf = self._find_leaf(target)
+                pos = bisect.bisect_right(keys, target)
+            while True:
+                for entry in reversed(entries[:pos]):
+                    if lo is not None and (entry[0] < lo or (entry[0] == lo and not lo_inclusive)):
+                        return
+                    yield entry
+                if prev_leaf == -1:
+                    return
+                _, entries, _, _, prev_leaf = self._load_node(prev_leaf)
+                pos = len(entries)
 
     # ------------------------------------------------
-    # Compare if first key is less than second key
-    # Author: Xinjian Zhang 278254081@qq.com
+    # the first or the last leaf of the B-tree
     # Input:
-    #       key1: first key to compare
-    #       key2: second key to compare
-    #       field_type: data type of the keys
+    #       last: True for the last leaf
     # Output:
-    #       boolean indicating if key1 < key2
+    #       (leaf_id, entries, next leaf, previous leaf)
     # ------------------------------------------------
-    def _key_less_than(self, key1, key2, field_type):
-        try:
-            if field_type == 2:  # Integer
-                val1 = struct.unpack('!q', key1)[0]
-                val2 = struct.unpack('!q', key2)[0]
-                return val1 < val2
-            else:  # String
-                str1 = key1.decode('utf-8', 'ignore').strip('\x00').strip()
-                str2 = key2.decode('utf-8', 'ignore').strip('\x00').strip()
-                return str1 < str2
-        except:
-            return False
+    def _edge_leaf(self, last=False):
+        block_id = self.root_node_ptr
+        node_type, entries, _, next_node, prev_node = self._load_node(block_id)
+        while node_type == INTERNAL_NODE_TYPE:
+            block_id = entries[-1 if last else 0][3]
+            node_type, entries, _, next_node, prev_node = self._load_node(block_id)
+        return block_id, entries, next_node, prev_node
 
     # ------------------------------------------------
     # Destructor for Index class
@@ -683,12 +1922,12 @@ class Index(object):
     # Input:
     #       None
     # Output:
-    #       None (closes file handles and cleanup)
+    #       None (writes the cached blocks of the index file back)
     # ------------------------------------------------
     def __del__(self):
-        if hasattr(self, 'f_handle') and self.f_handle:
+        if hasattr(self, 'index_file'):
             try:
-                self.f_handle.close()
+                self.buffer_manager.flush_file(self.index_file)
             except:
                 pass
 
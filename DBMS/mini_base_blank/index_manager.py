@@ -10,7 +10,9 @@
 import os
 import time
 import storage_db
+import index_db
 from index_db import Index, BTREE_INDEX, HASH_INDEX
+from buffer_db import global_buffer_manager
 
 # ------------------------------------------------
 # Simplified index management menu handler
@@ -45,6 +47,18 @@ def handle_index_management(schemaObj):
         else:
             print("Invalid choice! Please try again.")
 
+# ------------------------------------------------
+# print the progress of an index build, see Index.create_index
+# Input:
+#       stage: 'scan' (data blocks read), 'sort' (sorted runs written) or 'merge' (entries merged)
+#       done, total: the work done and all of it, total is None for 'sort'
+# ------------------------------------------------
+def show_build_progress(stage, done, total):
+    if total is None:
+        print(f"  {stage}: {done} runs written to temporary files")
+    elif done == total or done % 1000 == 0 or stage == 'merge':
+        print(f"  {stage}: {done}/{total}")
+
 # ------------------------------------------------
 # Comprehensive index performance comparison
 # Creates both index types and compares with sequential scan
@@ -127,7 +141,7 @@ def comprehensive_index_comparison(schemaObj):
     print("Creating B-tree index...")
     start_time = time.perf_counter()
     btree_idx = Index(table_name.decode('utf-8'), BTREE_INDEX)
-    btree_success = btree_idx.create_index(field_name, BTREE_INDEX)
+    btree_success = btree_idx.create_index(field_name, BTREE_INDEX, progress=show_build_progress)
     btree_creation_time = time.perf_counter() - start_time
     print(f"B-tree creation: {'✓ Success' if btree_success else '✗ Failed'} ({btree_creation_time:.4f}s)")
     
@@ -135,7 +149,7 @@ def comprehensive_index_comparison(schemaObj):
     print("Creating Hash index...")
     start_time = time.perf_counter()
     hash_idx = Index(table_name.decode('utf-8'), HASH_INDEX)
-    hash_success = hash_idx.create_index(field_name, HASH_INDEX)
+    hash_success = hash_idx.create_index(field_name, HASH_INDEX, progress=show_build_progress)
     hash_creation_time = time.perf_counter() - start_time
     print(f"Hash creation: {'✓ Success' if hash_success else '✗ Failed'} ({hash_creation_time:.4f}s)")
     
@@ -237,8 +251,8 @@ def comprehensive_index_comparison(schemaObj):
         print("   Try with larger datasets to see index advantages.")
     
     # File size comparison
-    btree_file = f"{table_name.decode('utf-8')}.ind"
-    hash_file = f"{table_name.decode('utf-8')}.hash"
+    btree_file = btree_idx.index_file
+    hash_file = hash_idx.index_file
     if os.path.exists(btree_file) and os.path.exists(hash_file):
         btree_size = os.path.getsize(btree_file)
         hash_size = os.path.getsize(hash_file)
@@ -252,6 +266,10 @@ def comprehensive_index_comparison(schemaObj):
         else:
             print(f"  Both indexes have same size")
     
+    # Buffer pool usage, to size the frame budget
+    print()
+    global_buffer_manager.show_statistics()
+    
     # Consistency check
     consistency_status = "✅ All results consistent" if all_results_consistent else "❌ Result inconsistencies detected"
     print(f"\nResult Consistency: {consistency_status}")
@@ -272,43 +290,34 @@ def comprehensive_index_comparison(schemaObj):
 # Input:
 #       schemaObj: Schema object containing table metadata
 # Output:
-#       None (removes all index files)
+#       None (removes all the indexes of the catalog and their files)
 # ------------------------------------------------
 def delete_all_indexes(schemaObj):
     print("=== DELETE ALL INDEXES ===")
     
-    # Find all index files
+    # Find all indexes of the catalog
     index_files = []
-    for table_name in schemaObj.get_table_name_list():
-        table_str = table_name.decode('utf-8') if isinstance(table_name, bytes) else str(table_name)
-        
-        # Check for B-tree index
-        btree_file = f"{table_str}.ind"
-        if os.path.exists(btree_file):
-            index_files.append((table_str, "B-tree", btree_file))
-        
-        # Check for Hash index
-        hash_file = f"{table_str}.hash"
-        if os.path.exists(hash_file):
-            index_files.append((table_str, "Hash", hash_file))
+    for entry in index_db.list_indexes():
+        if os.path.exists(entry.file):
+            index_files.append((entry.table, "Hash" if entry.index_type == HASH_INDEX else "B-tree", entry.file, entry.name))
     
     if not index_files:
         print("No index files found.")
         return
     
     print(f"Found {len(index_files)} index file(s):")
-    for table, index_type, filename in index_files:
+    for table, index_type, filename, index_name in index_files:
         file_size = os.path.getsize(filename)
-        print(f"  {table} - {index_type} ({filename}) - {file_size} bytes")
+        print(f"  {table} - {index_name} {index_type} ({filename}) - {file_size} bytes")
     
     confirm = input(f"\nAre you sure you want to delete ALL {len(index_files)} index files? (y/n): ").strip().lower()
     
     if confirm == 'y':
         deleted_count = 0
-        for table, index_type, filename in index_files:
+        for table, index_type, filename, index_name in index_files:
             try:
-                os.remove(filename)
-                print(f"✓ Deleted {table} {index_type} index")
+                index_db.drop_index(index_name)
+                print(f"✓ Deleted {table} {index_type} index {index_name}")
                 deleted_count += 1
             except Exception as e:
                 print(f"✗ Failed to delete {filename}: {e}")
@@ -323,39 +332,32 @@ def delete_all_indexes(schemaObj):
 # Input:
 #       schemaObj: Schema object containing table metadata
 # Output:
-#       None (displays list of all index files)
+#       None (displays the indexes of the catalog)
 # ------------------------------------------------
 def list_all_indexes(schemaObj):
     print("=== LIST ALL INDEXES ===")
     found_indexes = []
     
-    for table_name in schemaObj.get_table_name_list():
-        table_str = table_name.decode('utf-8') if isinstance(table_name, bytes) else str(table_name)
-        
-        # Check for B-tree index
-        btree_file = f"{table_str}.ind"
-        if os.path.exists(btree_file):
-            file_size = os.path.getsize(btree_file)
-            found_indexes.append((table_str, "B-tree", btree_file, file_size))
-        
-        # Check for Hash index
-        hash_file = f"{table_str}.hash"
-        if os.path.exists(hash_file):
-            file_size = os.path.getsize(hash_file)
-            found_indexes.append((table_str, "Hash", hash_file, file_size))
+    for entry in index_db.list_indexes():
+        file_size = os.path.getsize(entry.file) if os.path.exists(entry.file) else 0
+        index_type = "Hash" if entry.index_type == HASH_INDEX else "B-tree"
+        columns = ', '.join(entry.columns)
+        if entry.include:
+            columns += ' INCLUDE ' + ', '.join(entry.include)
+        found_indexes.append((entry.name, entry.table, columns, index_type, entry.file, file_size, entry.build_lsn))
     
     if found_indexes:
         print("Existing indexes:")
-        print("-" * 80)
-        print(f"{'Table':<15} {'Type':<10} {'File':<25} {'Size':<10} {'Status'}")
-        print("-" * 80)
-        for table_name, index_type, index_file, file_size in found_indexes:
-            print(f"{table_name:<15} {index_type:<10} {index_file:<25} {file_size:<10} Active")
-        print("-" * 80)
+        print("-" * 100)
+        print(f"{'Name':<15} {'Table':<12} {'Columns':<15} {'Type':<8} {'File':<25} {'Size':<10} {'LSN'}")
+        print("-" * 100)
+        for index_name, table_name, columns, index_type, index_file, file_size, build_lsn in found_indexes:
+            print(f"{index_name:<15} {table_name:<12} {columns:<15} {index_type:<8} {index_file:<25} {file_size:<10} {build_lsn}")
+        print("-" * 100)
         print(f"Total indexes: {len(found_indexes)}")
         
         # Calculate total storage used
-        total_size = sum(size for _, _, _, size in found_indexes)
+        total_size = sum(found[5] for found in found_indexes)
         print(f"Total storage used: {total_size} bytes ({total_size/1024:.1f} KB)")
     else:
         print("No indexes found.")
@@ -15,7 +15,9 @@ import common_db
 tokens = (
     'SELECT', 'FROM', 'WHERE', 'AND', 'TCNAME', 'EQX', 'COMMA', 'CONSTANT',
     'STAR', 'SEMI', 'CREATE', 'TABLE', 'INSERT', 'INTO', 'VALUES', 'DELETE', 
-    'UPDATE', 'SET', 'DROP', 'CHAR', 'INTEGER', 'LPAREN', 'RPAREN'
+    'UPDATE', 'SET', 'DROP', 'CHAR', 'INTEGER', 'LPAREN', 'RPAREN', 'VACUUM',
+    'BETWEEN', 'COMPARE', 'INDEX', 'ON', 'USING', 'INCLUDE', 'ORDER', 'BY',
+    'ASC', 'DESC', 'LIMIT', 'OR'
 )
 
 # ------------------------------------------------
@@ -221,6 +223,17 @@ def t_COMMA(t):
     r""","""
     return t
 
+# ------------------------------------------------
+# To recognize comparison operators in SQL statements
+# Input:
+#       t: token object from PLY lexer
+# Output:
+#       token object with COMPARE type, its value is the operator
+# ------------------------------------------------
+def t_COMPARE(t):
+    r"""<>|!=|<=|>=|<|>"""
+    return t
+
 # ------------------------------------------------
 # To recognize equality operator in SQL statements
 # Input:
@@ -267,19 +280,25 @@ def t_CONSTANT(t):
 
 # ------------------------------------------------
 # To recognize table/column names and handle reserved keywords
+# a field may be qualified by its table, as in table.field
 # Input:
 #       t: token object from PLY lexer
 # Output:
 #       token object with appropriate type (keyword or TCNAME)
 # ------------------------------------------------
 def t_TCNAME(t):
-    r"""[a-zA-Z_][a-zA-Z0-9_]*"""
+    r"""[a-zA-Z_][a-zA-Z0-9_]*(\.[a-zA-Z_][a-zA-Z0-9_]*)?"""
+    # VACUUM, BETWEEN, INDEX, ON, USING, INCLUDE, ORDER, BY, ASC, DESC, LIMIT and OR are only recognized
+    # here, as whole words, so that names such as 'one' or 'vacuumed' are not cut by a keyword rule
     # Reserved keyword dictionary
     reserved = {
         'select': 'SELECT', 'from': 'FROM', 'where': 'WHERE', 'and': 'AND',
         'create': 'CREATE', 'table': 'TABLE', 'insert': 'INSERT', 'into': 'INTO',
         'values': 'VALUES', 'delete': 'DELETE', 'update': 'UPDATE', 'set': 'SET',
-        'drop': 'DROP', 'char': 'CHAR', 'integer': 'INTEGER'
+        'drop': 'DROP', 'char': 'CHAR', 'integer': 'INTEGER', 'vacuum': 'VACUUM',
+        'between': 'BETWEEN', 'index': 'INDEX', 'on': 'ON', 'using': 'USING',
+        'include': 'INCLUDE', 'order': 'ORDER', 'by': 'BY', 'asc': 'ASC', 'desc': 'DESC',
+        'limit': 'LIMIT', 'or': 'OR'
     }
     t.type = reserved.get(t.value.lower(), 'TCNAME')
     return t
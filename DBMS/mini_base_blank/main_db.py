@@ -32,6 +32,8 @@ PROMPT_STR = '''
  | 7: SQL                                  |
  | 8: View log files                       |
  | 9: Index Management                     |
+ | 10: Vacuum a table                      |
+ | 11: Upgrade a table to format v2        |
  | .: Quit                                 |
  +-----------------------------------------+
  Input your choice: '''  # the prompt string for user input
@@ -211,6 +213,34 @@ def main():
             index_manager.handle_index_management(schema_obj)
             choice = input(PROMPT_STR)
 
+        elif choice == '10':  # Vacuum a table
+            table_name = input('Please input the name of the table to vacuum: ').strip()
+            if schema_obj.find_table(table_name.encode('utf-8')):
+                try:
+                    stats = query_plan_db.vacuum_table(table_name)
+                    print(f"{stats['moved']} records moved, blocks {stats['blocks_before']} -> {stats['blocks_after']}, "
+                          f"{stats['bytes_reclaimed']} bytes reclaimed in {stats['seconds']:.3f}s")
+                except Exception as e:
+                    print(f"Error vacuuming table: {e}")
+            else:
+                print(f"Table '{table_name}' does not exist!")
+            choice = input(PROMPT_STR)
+
+        elif choice == '11':  # Upgrade a table to the current data file format
+            table_name = input('Please input the name of the table to upgrade: ').strip()
+            if schema_obj.find_table(table_name.encode('utf-8')):
+                try:
+                    upgraded = query_plan_db.upgrade_table(table_name)
+                    if upgraded is None:
+                        print(f"Table '{table_name}' already uses format v{storage_db.CURRENT_FORMAT}")
+                    else:
+                        print(f"Table '{table_name}' upgraded to format v{storage_db.CURRENT_FORMAT}, {upgraded} records rewritten")
+                except Exception as e:
+                    print(f"Error upgrading table: {e}")
+            else:
+                print(f"Table '{table_name}' does not exist!")
+            choice = input(PROMPT_STR)
+
         elif choice == '.':  # Quit the program
             del schema_obj
             break
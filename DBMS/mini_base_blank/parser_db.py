@@ -26,7 +26,10 @@ def p_statement(p):
                  | InsertQuery
                  | DeleteQuery
                  | UpdateQuery
-                 | DropQuery'''
+                 | DropQuery
+                 | VacuumQuery
+                 | CreateIndexQuery
+                 | DropIndexQuery'''
     p[0] = p[1]
     common_db.global_syn_tree = p[0]
 
@@ -44,15 +47,15 @@ def p_sfw_query(p):
 # ------------------------------------------------
 # To parse complete SFW structure
 # Input:
-#       p: parser object containing SELECT, FROM, WHERE components
+#       p: parser object containing SELECT, FROM, WHERE, ORDER BY and LIMIT components
 # Output:
 #       syntax tree node for SFW structure
 # ------------------------------------------------
 def p_sfw(p):
-    '''SFW : SELECT SelList FROM FromList opt_where opt_semi'''
+    '''SFW : SELECT SelList FROM FromList opt_where opt_order opt_limit opt_semi'''
     p[1] = common_db.Node('SELECT', None)
     p[3] = common_db.Node('FROM', None)
-    p[0] = common_db.Node('SFW', [p[1], p[2], p[3], p[4], p[5]])
+    p[0] = common_db.Node('SFW', [p[1], p[2], p[3], p[4], p[5], p[6], p[7]])
 
 # ------------------------------------------------
 # To parse optional WHERE clause
@@ -70,22 +73,110 @@ def p_opt_where(p):
         p[0] = None
 
 # ------------------------------------------------
-# To parse condition expressions (single or multiple with AND)
+# To parse optional ORDER BY clause
+# Input:
+#       p: parser object containing optional ORDER BY tokens
+# Output:
+#       syntax tree node for ORDER BY clause or None
+# ------------------------------------------------
+def p_opt_order(p):
+    '''opt_order : ORDER BY OrderList
+                 | empty'''
+    if len(p) == 4:
+        p[0] = common_db.Node('ORDER_BY', [p[3]])
+    else:
+        p[0] = None
+
+# ------------------------------------------------
+# To parse the fields of ORDER BY (recursive, multiple fields)
+# Input:
+#       p: parser object containing the order items
+# Output:
+#       syntax tree node for the order list
+# ------------------------------------------------
+def p_order_list(p):
+    '''OrderList : OrderItem
+                 | OrderItem COMMA OrderList'''
+    if len(p) == 2:
+        p[0] = common_db.Node('OrderList', [p[1]])
+    else:
+        p[0] = common_db.Node('OrderList', [p[1], p[3]])
+
+# ------------------------------------------------
+# To parse one field of ORDER BY with its optional direction
+# Input:
+#       p: parser object containing the field name and ASC or DESC
+# Output:
+#       syntax tree node for the order item, ascending by default
+# ------------------------------------------------
+def p_order_item(p):
+    '''OrderItem : TCNAME
+                 | TCNAME ASC
+                 | TCNAME DESC'''
+    direction = p[2].upper() if len(p) == 3 else 'ASC'
+    p[0] = common_db.Node('OrderItem', [common_db.Node('TCNAME', [p[1]]), common_db.Node(direction, None)])
+
+# ------------------------------------------------
+# To parse optional LIMIT clause
+# Input:
+#       p: parser object containing optional LIMIT tokens
+# Output:
+#       syntax tree node for LIMIT clause or None
+# ------------------------------------------------
+def p_opt_limit(p):
+    '''opt_limit : LIMIT CONSTANT
+                 | empty'''
+    if len(p) == 3:
+        p[0] = common_db.Node('LIMIT', [common_db.Node('CONSTANT', [p[2]])])
+    else:
+        p[0] = None
+
+# ------------------------------------------------
+# To parse condition expressions (conditions joined with OR)
+# AND binds tighter than OR, parentheses group conditions
 # Input:
 #       p: parser object containing condition tokens
 # Output:
 #       syntax tree node for condition
 # ------------------------------------------------
 def p_condition(p):
-    '''Condition : SimpleCond
-                 | SimpleCond AND Condition'''
+    '''Condition : AndCondition
+                 | AndCondition OR Condition'''
+    if len(p) == 2:
+        p[0] = p[1]
+    else:
+        p[0] = common_db.Node('OR_OP', [p[1], p[3]])
+
+# ------------------------------------------------
+# To parse conditions joined with AND
+# Input:
+#       p: parser object containing condition tokens
+# Output:
+#       syntax tree node for condition
+# ------------------------------------------------
+def p_and_condition(p):
+    '''AndCondition : CondFactor
+                    | CondFactor AND AndCondition'''
     if len(p) == 2:
         p[0] = p[1]
     else:
         p[0] = common_db.Node('AND_OP', [p[1], p[3]])
 
 # ------------------------------------------------
-# To parse simple condition (column = value/column)
+# To parse a simple condition or a parenthesized condition
+# Input:
+#       p: parser object containing condition tokens
+# Output:
+#       syntax tree node for condition
+# ------------------------------------------------
+def p_cond_factor(p):
+    '''CondFactor : SimpleCond
+                  | LPAREN Condition RPAREN'''
+    p[0] = p[1] if len(p) == 2 else p[2]
+
+# ------------------------------------------------
+# To parse simple condition (column = value/column, column < value/column, ...)
+# != is written <>
 # Input:
 #       p: parser object containing simple condition tokens
 # Output:
@@ -93,15 +184,31 @@ def p_condition(p):
 # ------------------------------------------------
 def p_simple_cond(p):
     '''SimpleCond : TCNAME EQX CONSTANT
-                  | TCNAME EQX TCNAME'''
+                  | TCNAME EQX TCNAME
+                  | TCNAME COMPARE CONSTANT
+                  | TCNAME COMPARE TCNAME'''
     p[1] = common_db.Node('TCNAME', [p[1]])
-    p[2] = common_db.Node('=', None)
+    p[2] = common_db.Node('=' if p.slice[2].type == 'EQX' else '<>' if p[2] == '!=' else p[2], None)
     if p.slice[3].type == 'CONSTANT':
         p[3] = common_db.Node('CONSTANT', [p[3]])
     else:
         p[3] = common_db.Node('TCNAME', [p[3]])
     p[0] = common_db.Node('Cond', [p[1], p[2], p[3]])
 
+# ------------------------------------------------
+# To parse BETWEEN condition (column BETWEEN value AND value)
+# it is turned into two range conditions joined with AND
+# Input:
+#       p: parser object containing BETWEEN condition tokens
+# Output:
+#       syntax tree node for the two range conditions
+# ------------------------------------------------
+def p_between_cond(p):
+    '''SimpleCond : TCNAME BETWEEN CONSTANT AND CONSTANT'''
+    low = common_db.Node('Cond', [common_db.Node('TCNAME', [p[1]]), common_db.Node('>=', None), common_db.Node('CONSTANT', [p[3]])])
+    high = common_db.Node('Cond', [common_db.Node('TCNAME', [p[1]]), common_db.Node('<=', None), common_db.Node('CONSTANT', [p[5]])])
+    p[0] = common_db.Node('AND_OP', [low, high])
+
 # ------------------------------------------------
 # To parse optional semicolon
 # Input:
@@ -248,8 +355,23 @@ def p_data_type(p):
 #       syntax tree node for INSERT INTO
 # ------------------------------------------------
 def p_insert_query(p):
-    'InsertQuery : INSERT INTO TCNAME VALUES LPAREN ValueList RPAREN opt_semi'
-    p[0] = common_db.Node('INSERT_INTO', None, varList={'table_name': p[3], 'values': p[6]})
+    'InsertQuery : INSERT INTO TCNAME VALUES RowList opt_semi'
+    p[0] = common_db.Node('INSERT_INTO', None, varList={'table_name': p[3], 'values': p[5][0], 'rows': p[5]})
+
+# ------------------------------------------------
+# To parse the rows of a multi-row INSERT statement
+# Input:
+#       p: parser object containing parenthesized value lists
+# Output:
+#       list of value lists
+# ------------------------------------------------
+def p_row_list(p):
+    '''RowList : LPAREN ValueList RPAREN COMMA RowList
+               | LPAREN ValueList RPAREN'''
+    if len(p) == 6:
+        p[0] = [p[2]] + p[5]
+    else:
+        p[0] = [p[2]]
 
 # ------------------------------------------------
 # To parse value lists in INSERT statements
@@ -334,6 +456,80 @@ def p_drop_query(p):
     'DropQuery : DROP TABLE TCNAME opt_semi'
     p[0] = common_db.Node('DROP_TABLE', None, varList={'table_name': p[3]})
 
+# ------------------------------------------------
+# To parse VACUUM statements
+# Input:
+#       p: parser object containing VACUUM tokens
+# Output:
+#       syntax tree node for VACUUM
+# ------------------------------------------------
+def p_vacuum_query(p):
+    'VacuumQuery : VACUUM TCNAME opt_semi'
+    p[0] = common_db.Node('VACUUM', None, varList={'table_name': p[2]})
+
+# ------------------------------------------------
+# To parse CREATE INDEX statements
+# CREATE INDEX name ON table(field, ...) [INCLUDE (field, ...)] [USING BTREE|HASH]
+# Input:
+#       p: parser object containing CREATE INDEX tokens
+# Output:
+#       syntax tree node for CREATE INDEX
+# ------------------------------------------------
+def p_create_index_query(p):
+    'CreateIndexQuery : CREATE INDEX TCNAME ON TCNAME LPAREN ColumnList RPAREN opt_include opt_using opt_semi'
+    p[0] = common_db.Node('CREATE_INDEX', None, varList={'index_name': p[3], 'table_name': p[5],
+                                                          'columns': p[7], 'include': p[9], 'method': p[10]})
+
+# ------------------------------------------------
+# To parse the field list of CREATE INDEX
+# Input:
+#       p: parser object containing field names
+# Output:
+#       list of field names
+# ------------------------------------------------
+def p_column_list(p):
+    '''ColumnList : TCNAME COMMA ColumnList
+                  | TCNAME'''
+    if len(p) == 4:
+        p[0] = [p[1]] + p[3]
+    else:
+        p[0] = [p[1]]
+
+# ------------------------------------------------
+# To parse the optional INCLUDE clause of CREATE INDEX
+# Input:
+#       p: parser object containing the included field names
+# Output:
+#       list of field names, empty by default
+# ------------------------------------------------
+def p_opt_include(p):
+    '''opt_include : INCLUDE LPAREN ColumnList RPAREN
+                   | empty'''
+    p[0] = p[3] if len(p) == 5 else []
+
+# ------------------------------------------------
+# To parse the optional USING clause of CREATE INDEX
+# Input:
+#       p: parser object containing the index method
+# Output:
+#       the method name in upper case, BTREE by default
+# ------------------------------------------------
+def p_opt_using(p):
+    '''opt_using : USING TCNAME
+                 | empty'''
+    p[0] = p[2].upper() if len(p) == 3 else 'BTREE'
+
+# ------------------------------------------------
+# To parse DROP INDEX statements
+# Input:
+#       p: parser object containing DROP INDEX tokens
+# Output:
+#       syntax tree node for DROP INDEX
+# ------------------------------------------------
+def p_drop_index_query(p):
+    'DropIndexQuery : DROP INDEX TCNAME opt_semi'
+    p[0] = common_db.Node('DROP_INDEX', None, varList={'index_name': p[3]})
+
 # ------------------------------------------------
 # To handle empty productions
 # Input:
@@ -366,6 +562,6 @@ def p_error(p):
 #       None (sets common_db.global_parser)
 # ------------------------------------------------
 def set_parser_handle():
-    common_db.global_parser = yacc.yacc(write_tables=0)
+    common_db.global_parser = yacc.yacc(debug=False, write_tables=0)
     if common_db.global_parser is None:
         print('Error: YACC parser object could not be created')
\ No newline at end of file
@@ -9,13 +9,21 @@
 import common_db
 import storage_db
 import schema_db
+import index_db
+import os
+import extsort_db
+import heapq
 import itertools 
+import marshal
+import operator
 
 class parseNode:
     def __init__(self):
         self.sel_list = []
         self.from_list = []
         self.where_list = []
+        self.order_list = []
+        self.limit = None
     def get_sel_list(self):
         return self.sel_list
     def get_from_list(self):
@@ -28,13 +36,23 @@ class parseNode:
         self.from_list = from_list
     def update_where_list(self, where_list):
         self.where_list = where_list
+    def add_where_cond(self, cond):
+        self.where_list.append(cond)
+    def get_order_list(self):
+        return self.order_list
+    def add_order_item(self, item):
+        self.order_list.append(item)
+    def get_limit(self):
+        return self.limit
+    def update_limit(self, limit):
+        self.limit = limit
 
 def extract_sfw_data():
     print('extract_sfw_data begins to execute')
     syn_tree = common_db.global_syn_tree  
     if syn_tree is None:
         print('wrong')
-        return [], [], []
+        return [], [], [], [], None
     else:
         def find_sfw(node):
             if isinstance(node, common_db.Node):
@@ -49,10 +67,10 @@ def extract_sfw_data():
         sfw_node = find_sfw(syn_tree)
         if sfw_node is None:
             print('No SFW node found in syntax tree')
-            return [], [], []
+            return [], [], [], [], None
         PN = parseNode()
         destruct(sfw_node, PN)
-        return PN.get_sel_list(), PN.get_from_list(), PN.get_where_list()
+        return PN.get_sel_list(), PN.get_from_list(), PN.get_where_list(), PN.get_order_list(), PN.get_limit()
 
 def destruct(nodeobj, PN):
     if isinstance(nodeobj, common_db.Node):
@@ -65,14 +83,47 @@ def destruct(nodeobj, PN):
                 tmpList = []
                 show(nodeobj, tmpList)
                 PN.update_from_list(tmpList)
-            elif nodeobj.value == 'Cond':
-                tmpList = []
-                show(nodeobj, tmpList)
-                PN.update_where_list(tmpList)
+            elif nodeobj.value == 'Cond' or nodeobj.value == 'OR_OP':
+                for cond in where_conditions(nodeobj):
+                    PN.add_where_cond(cond)
+            elif nodeobj.value == 'OrderItem':
+                # (field, 'ASC' or 'DESC')
+                field, direction = nodeobj.children
+                PN.add_order_item((str(field.children[0]).strip(), direction.value))
+            elif nodeobj.value == 'LIMIT':
+                PN.update_limit(str(nodeobj.children[0].children[0]).strip())
             else:
                 for i in range(len(nodeobj.children)):
                     destruct(nodeobj.children[i], PN)
 
+# ----------------------------------------------
+# the conditions of a WHERE subtree, joined with AND
+# a condition is (field, operator, constant or field, whether the right side is a field);
+# conditions joined with OR make one ('OR', branches) condition, every branch being
+# the tuple of its conditions joined with AND
+# ------------------------------------------------
+def where_conditions(nodeobj):
+    if nodeobj.value == 'AND_OP':
+        return where_conditions(nodeobj.children[0]) + where_conditions(nodeobj.children[1])
+    if nodeobj.value == 'OR_OP':
+        return [('OR', tuple(or_branches(nodeobj)))]
+    left, op, right = nodeobj.children
+    return [(str(left.children[0]).strip(), op.value, str(right.children[0]).strip(), right.value == 'TCNAME')]
+
+def or_branches(nodeobj):
+    if nodeobj.value == 'OR_OP':
+        return or_branches(nodeobj.children[0]) + or_branches(nodeobj.children[1])
+    return [tuple(where_conditions(nodeobj))]
+
+# ----------------------------------------------
+# the names of the fields a condition of a where list reads, see where_conditions
+# ------------------------------------------------
+def where_fields(condition):
+    if condition[0] == 'OR' and len(condition) == 2:
+        return [name for branch in condition[1] for cond in branch for name in where_fields(cond)]
+    field, op, param, is_field = condition
+    return [field, param] if is_field else [field]
+
 def show(nodeobj, tmpList):
     if isinstance(nodeobj, common_db.Node):
         if not nodeobj.children:
@@ -105,28 +156,950 @@ def construct_where_node(from_node, where_list):
     elif from_node and len(where_list) == 0:
         return from_node
 
+def construct_order_node(wf_node, order_list):
+    if wf_node and len(order_list) > 0:
+        return common_db.Node('Sort', [wf_node], tuple(order_list))
+    return wf_node
+
+def construct_limit_node(order_node, limit):
+    if order_node and limit is not None:
+        return common_db.Node('Limit', [order_node], [limit])
+    return order_node
+
 def construct_select_node(wf_node, sel_list):
     if wf_node and len(sel_list) > 0:
         if sel_list[0] == '*' or sel_list[0] == 'STAR':
             return common_db.Node('Proj', [wf_node], ['*'])
         return common_db.Node('Proj', [wf_node], sel_list)
 
+# ----------------------------------------------
+# the names of the fields of a table, [] when the table has no data file
+# ------------------------------------------------
+def table_field_names(table_name):
+    table_name = table_name.decode('utf-8') if isinstance(table_name, bytes) else table_name
+    if not os.path.exists(table_name.strip() + '.dat'):
+        return []
+    return [x[0].decode('utf-8').strip() if isinstance(x[0], bytes) else str(x[0]).strip()
+            for x in storage_db.Storage(table_name, debug=False).getfilenamelist()]
+
+# ----------------------------------------------
+# predicate pushdown: to rewrite a logical tree so that every condition is checked
+# as low in it as possible. A condition on the fields of one table goes to a Filter
+# right above that table, so that it is checked on the records as they are read;
+# a condition between tables goes to a Filter right above the lowest X joining them.
+# A condition whose fields cannot be told apart stays in the Filter above the joins
+# input
+#       tree: a Proj -> [Limit ->] [Sort ->] Filter -> X tree, see construct_logical_tree
+# output
+#       the rewritten tree
+# ------------------------------------------------
+def push_down_predicates(tree):
+    if not isinstance(tree, common_db.Node):
+        return tree
+    if tree.value in ('Proj', 'Limit', 'Sort') and tree.children:
+        return common_db.Node(tree.value, [push_down_predicates(tree.children[0])], tree.var)
+    if tree.value != 'Filter':
+        return tree
+    filter_node = tree
+    tables = []
+    def collect(node):
+        if node.value == 'X':
+            for child in node.children:
+                collect(child)
+        else:
+            tables.append(node.value.decode('utf-8') if isinstance(node.value, bytes) else node.value)
+    collect(filter_node.children[0])
+    fields = [table_field_names(table_name) for table_name in tables]
+    def owner(name):
+        if '.' in name:
+            table_name, field_name = name.split('.', 1)
+            owners = [ti for ti in range(len(tables)) if tables[ti].strip() == table_name and field_name in fields[ti]]
+        else:
+            owners = [ti for ti in range(len(tables)) if name in fields[ti]]
+        return owners[0] if len(owners) == 1 else None
+    # the tables every condition reads, None when one of its fields is unknown
+    condition_tables = []
+    for condition in filter_node.var:
+        owners = set([owner(name) for name in where_fields(condition)])
+        condition_tables.append(None if None in owners else owners)
+    placed = [False] * len(condition_tables)
+    # bottom up, a condition goes to the first node whose tables include all of its own
+    def rebuild(node, first):
+        if node.value == 'X':
+            children, count = [], 0
+            for child in node.children:
+                new_child, child_count = rebuild(child, first + count)
+                children.append(new_child)
+                count += child_count
+            node = common_db.Node('X', children)
+        else:
+            count = 1
+        here = []
+        for i, owners in enumerate(condition_tables):
+            if not placed[i] and owners is not None and owners <= set(range(first, first + count)):
+                placed[i] = True
+                here.append(filter_node.var[i])
+        if here:
+            return common_db.Node('Filter', [node], tuple(here)), count
+        return node, count
+    from_node = rebuild(filter_node.children[0], 0)[0]
+    remaining = tuple([condition for i, condition in enumerate(filter_node.var) if not placed[i]])
+    if remaining:
+        from_node = common_db.Node('Filter', [from_node], remaining)
+    return from_node
+
+# ----------------------------------------------
+# to read a logical tree made by construct_logical_tree and push_down_predicates
+# input
+#       tree: the root of the logical tree
+# output
+#       (tables, table_where, join_where, sel_list, order_list, limit): the names of the tables
+#       from left to right, the conditions of the Filters right above every table, the
+#       conditions of the other Filters, the select list, the (field, 'ASC' or 'DESC') of
+#       the Sort and the row count of the Limit, None without a Limit
+# ------------------------------------------------
+def read_logical_tree(tree):
+    tables, table_where, join_where, sel_list, order_list, limit = [], [], [], [], [], []
+    def walk(node, where):
+        if node.value == 'Proj':
+            sel_list.extend(node.var)
+            walk(node.children[0], ())
+        elif node.value == 'Sort':
+            order_list.extend(node.var)
+            walk(node.children[0], where)
+        elif node.value == 'Limit':
+            limit.extend(node.var)
+            walk(node.children[0], where)
+        elif node.value == 'Filter':
+            walk(node.children[0], where + tuple(node.var))
+        elif node.value == 'X':
+            join_where.extend(where)
+            for child in node.children:
+                walk(child, ())
+        else:
+            tables.append(node.value.decode('utf-8') if isinstance(node.value, bytes) else node.value)
+            table_where.append(list(where))
+    if isinstance(tree, common_db.Node) and tree.value == 'Proj':
+        walk(tree, ())
+    return tables, table_where, join_where, sel_list, order_list, limit[0] if limit else None
+
+HASH_JOIN_ROWS = 100000  # rows of both sides of a hash join beyond which it turns into a sort-merge join
+SORT_BATCH = 1024        # rows given at once to the external sort of a sort-merge join
+
+COMPARE_OPS = {'=': operator.eq, '<>': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+# estimated share of the rows satisfying a comparison, used to order the conditions
+SELECTIVITY = {'=': 0.1, '<>': 0.9, '<': 0.3, '<=': 0.3, '>': 0.3, '>=': 0.3}
+COMPARE_COST = 1.0         # estimated cost of comparing an integer or boolean field
+STRING_COMPARE_COST = 1.5  # of comparing a string field
+COLUMN_COMPARE_COST = 2.0  # of comparing two fields, whose types are checked
+
+# ----------------------------------------------
+# the comparable value of a field, strings are compared stripped
+# ------------------------------------------------
+def field_value(value, FieldType):
+    if isinstance(value, bytes):
+        return value.decode('utf-8').strip()
+    if FieldType == 0 or FieldType == 1:
+        return str(value).strip()
+    return value
+
+# ----------------------------------------------
+# to convert the constant of a condition to the type of its field
+# input
+#       FieldType: type of the compared field
+#       constant: the constant as written in the statement
+# output
+#       int, bool or str; ValueError if it is not a valid value of the field
+# ------------------------------------------------
+def typed_constant(FieldType, constant):
+    constant = constant.strip()
+    if constant.startswith("'") and constant.endswith("'") and len(constant) >= 2:
+        constant = constant[1:-1]
+    if FieldType == 2:
+        return int(constant)
+    if FieldType == 3:
+        return storage_db.to_bool(constant)
+    return constant.strip()
+
+# ----------------------------------------------
+# the tables and fields read by resolved conditions
+# input
+#       conditions, column_conditions, or_conditions: see compile_conditions
+# output
+#       generator of (TableIndex, FieldIndex)
+# ------------------------------------------------
+def condition_fields(conditions, column_conditions=(), or_conditions=()):
+    for condition in conditions:
+        yield condition[0], condition[1]
+    for condition in column_conditions:
+        yield condition[0], condition[1]
+        yield condition[4], condition[5]
+    for branches in or_conditions:
+        for branch in branches:
+            for table_field in condition_fields(*branch):
+                yield table_field
+
+# ----------------------------------------------
+# to compare two fields whose values are not of the same type: both are
+# converted with field_value for the type of the first one, as strings when it is a string
+# ------------------------------------------------
+def mixed_compare(op, FieldType):
+    compare = COMPARE_OPS[op]
+    def test(value, other):
+        try:
+            return compare(field_value(value, FieldType), field_value(other, FieldType))
+        except TypeError:
+            return False  # values of different types never match
+    return test
+
+# ----------------------------------------------
+# the tests of one record built by compile_conditions
+# every test is a function(record) -> bool; all_of and any_of stop at the
+# first test deciding the result
+# ------------------------------------------------
+def constant_test(get, compare, value):
+    return lambda r: compare(get(r), value)
+
+def column_test(get, get_other, compare, mixed):
+    def test(r):
+        value, other = get(r), get_other(r)
+        if value.__class__ is other.__class__:
+            return compare(value, other)
+        return mixed(value, other)
+    return test
+
+def all_of(tests):
+    if len(tests) == 1:
+        return tests[0]
+    def test(r):
+        for part in tests:
+            if not part(r):
+                return False
+        return True
+    return test
+
+def any_of(tests):
+    if len(tests) == 1:
+        return tests[0]
+    def test(r):
+        for part in tests:
+            if part(r):
+                return True
+        return False
+    return test
+
+# ----------------------------------------------
+# to compile conditions joined with AND into one function testing a record
+# every condition becomes a test comparing the field with operator.eq, operator.lt, ...,
+# the constants being converted once to the type the fields have in the records
+# (strings are bytes, see codec_db); the tests are combined with all_of and any_of.
+# The conditions joined with AND are ordered by cost / (1 - selectivity), so that a
+# cheap condition rejecting many rows comes first, those joined with OR by
+# cost / selectivity, see SELECTIVITY
+# input
+#       table_num: 1 when the records are tested (TableIndex is not used then),
+#                  else the number of records in the rows
+#       conditions: list of (TableIndex, FieldIndex, FieldType, op, FilterParam)
+#       column_conditions: list of (TableIndex, FieldIndex, FieldType, op, OtherTableIndex, OtherFieldIndex)
+#       or_conditions: list of conditions joined with OR, every one a list of branches
+#                      (conditions, column_conditions, or_conditions) joined with AND
+# output
+#       function(record) -> bool
+# ------------------------------------------------
+def compile_conditions(table_num, conditions, column_conditions=(), or_conditions=()):
+    def field(TableIndex, FieldIndex):
+        if table_num == 1:
+            return operator.itemgetter(FieldIndex)
+        return lambda r: r[TableIndex][FieldIndex]
+    # (cost, selectivity, test) of conditions joined with AND
+    def conjunction(conditions, column_conditions, or_conditions):
+        terms = []
+        for TableIndex, FieldIndex, FieldType, op, FilterParam in conditions:
+            cost = COMPARE_COST
+            if FieldType == 0 or FieldType == 1:
+                FilterParam, cost = str(FilterParam).encode('utf-8'), STRING_COMPARE_COST
+            terms.append((cost, SELECTIVITY[op],
+                          constant_test(field(TableIndex, FieldIndex), COMPARE_OPS[op], FilterParam)))
+        for TableIndex, FieldIndex, FieldType, op, OtherTable, OtherField in column_conditions:
+            terms.append((COLUMN_COMPARE_COST, SELECTIVITY[op],
+                          column_test(field(TableIndex, FieldIndex), field(OtherTable, OtherField),
+                                      COMPARE_OPS[op], mixed_compare(op, FieldType))))
+        for branches in or_conditions:
+            parts = sorted([conjunction(*branch) for branch in branches], key=lambda part: part[0] / max(part[1], 0.001))
+            missed = 1.0
+            for part in parts:
+                missed *= 1 - part[1]
+            terms.append((sum([part[0] for part in parts]), 1 - missed, any_of([part[2] for part in parts])))
+        if not terms:
+            return 0.0, 1.0, lambda r: True
+        terms.sort(key=lambda term: term[0] / max(1 - term[1], 0.001))
+        selectivity = 1.0
+        for term in terms:
+            selectivity *= term[1]
+        return sum([term[0] for term in terms]), selectivity, all_of([term[2] for term in terms])
+    return conjunction(conditions, column_conditions, or_conditions)[2]
+
+# ----------------------------------------------
+# to keep the records satisfying all the conditions
+# the conditions are compiled once, see compile_conditions, and the records
+# are consumed lazily, one at a time
+# input
+#       records: iterable of records (or of per-table record lists when table_num > 1)
+#       table_num: number of tables in the from list, 1 when the records of one table are tested
+#       conditions: list of (TableIndex, FieldIndex, FieldType, op, FilterParam)
+#       column_conditions: list of (TableIndex, FieldIndex, FieldType, op, OtherTableIndex, OtherFieldIndex)
+#       or_conditions: list of conditions joined with OR, see compile_conditions
+# output
+#       generator of the matching records
+# ------------------------------------------------
+def filter_records(records, table_num, conditions, column_conditions=(), or_conditions=()):
+    matches = compile_conditions(table_num, conditions, column_conditions, or_conditions)
+    for tmpRecord in records:
+        if matches(tmpRecord):
+            yield tmpRecord
+
+# ----------------------------------------------
+# the functions giving the join key of a row and of a record
+# input
+#       row_keys: list of (TableIndex, FieldIndex, FieldType) of the key in the rows
+#       record_keys: list of (FieldIndex, FieldType) of the key in the records, in the same order
+# output
+#       (row_key, record_key): functions returning the tuple of the comparable values of the key
+# ------------------------------------------------
+def join_key_functions(row_keys, record_keys):
+    def row_key(row):
+        return tuple([field_value(row[TableIndex][FieldIndex], FieldType) for TableIndex, FieldIndex, FieldType in row_keys])
+    def record_key(record):
+        return tuple([field_value(record[FieldIndex], FieldType) for FieldIndex, FieldType in record_keys])
+    return row_key, record_key
+
+# ----------------------------------------------
+# to join rows with the records of one more table on equal fields
+# build/probe hash join: the smaller side is put in a hash table on its key
+# and every row or record of the other side looks its key up in it, so the join
+# takes O(n + m) time. Which side is smaller is found by reading both sides in
+# turn until one of them ends, so at most twice the smaller side is held in memory.
+# When both sides have more than HASH_JOIN_ROWS, they are sorted on their key with
+# an external sort and merge joined instead, in bounded memory
+# input
+#       rows: iterable of rows, a row is the list of the records of the tables joined so far
+#       records: iterable of the records of the next table
+#       row_key, record_key: functions giving the join key, see join_key_functions
+#       sortable: whether the keys of both sides have the same types, so that they can be sorted together
+# output
+#       generator of the joined rows, the row followed by the record
+# ------------------------------------------------
+def hash_join(rows, records, row_key, record_key, sortable=False):
+    rows, records = iter(rows), iter(records)
+    row_buffer, record_buffer = [], []
+    while True:
+        row = next(rows, None)
+        if row is None:
+            build, build_key, probe, probe_key = row_buffer, row_key, itertools.chain(record_buffer, records), record_key
+            break
+        row_buffer.append(row)
+        record = next(records, None)
+        if record is None:
+            build, build_key, probe, probe_key = record_buffer, record_key, itertools.chain(row_buffer, rows), row_key
+            break
+        record_buffer.append(record)
+        if sortable and len(record_buffer) >= HASH_JOIN_ROWS:
+            for row in merge_join(sort_by_key(itertools.chain(row_buffer, rows), row_key),
+                                  sort_by_key(itertools.chain(record_buffer, records), record_key)):
+                yield row
+            return
+    del row_buffer, record_buffer
+    table = {}
+    for item in build:
+        table.setdefault(build_key(item), []).append(item)
+    if not table:
+        return
+    del build
+    for item in probe:
+        matches = table.get(probe_key(item))
+        if matches is None:
+            continue
+        if probe_key is row_key:
+            for record in matches:
+                yield item + [record]
+        else:
+            for row in matches:
+                yield row + [item]
+
+# ----------------------------------------------
+# to sort rows or records on their join key with an external sort
+# the items are written to the runs in marshal format, behind their key and
+# their position, so that equal keys keep the order of the items
+# input
+#       items: iterable of rows or records
+#       key: function giving the join key of an item
+# output
+#       generator of (key, item) in ascending order of the keys
+# ------------------------------------------------
+def sort_by_key(items, key):
+    sorter = extsort_db.ExternalSorter()
+    items = iter(items)
+    position = 0
+    while True:
+        batch = list(itertools.islice(items, SORT_BATCH))
+        if not batch:
+            break
+        sorter.extend([key(item) + (position + i, marshal.dumps(item)) for i, item in enumerate(batch)])
+        position += len(batch)
+    for entry in sorter.sorted():
+        yield entry[:-2], marshal.loads(entry[-1])
+
+# ----------------------------------------------
+# to join rows with the records of one more table, both in ascending order of their key
+# sort-merge join: both sides are read once, side by side, and only the records
+# of one key are held in memory
+# input
+#       rows: iterable of (key, row), a row is the list of the records of the tables joined so far
+#       records: iterable of (key, record)
+# output
+#       generator of the joined rows, the row followed by the record
+# ------------------------------------------------
+def merge_join(rows, records):
+    records = iter(records)
+    current = next(records, None)
+    group_key, group = None, []
+    for key, row in rows:
+        if key != group_key:
+            group_key, group = key, []
+            while current is not None and current[0] < key:
+                current = next(records, None)
+            while current is not None and current[0] == key:
+                group.append(current[1])
+                current = next(records, None)
+            if current is None and not group:
+                return
+        for record in group:
+            yield row + [record]
+
+# ----------------------------------------------
+# to join rows with every record of one more table
+# only the records are held in memory, the rows are read once
+# input
+#       rows: iterable of rows, a row is the list of the records of the tables joined so far
+#       records: iterable of the records of the next table
+# output
+#       generator of the joined rows, the row followed by the record
+# ------------------------------------------------
+def cross_join(rows, records):
+    records = list(records)
+    for row in rows:
+        for record in records:
+            yield row + [record]
+
+# ------------------------------------------------
+# Operator class
+# Functionality:
+#   - the base of the operators of a query plan, in the iterator (Volcano) model
+#   - open() prepares the operator, next() gives its next row, None after the last
+#     one, close() frees what it holds
+#   - iterating an operator opens, reads and closes it; an operator reads its
+#     children by iterating them, so rows flow up the tree one at a time and no
+#     operator copies its input
+# ------------------------------------------------
+class Operator(object):
+
+    def __init__(self, *children):
+        self.children = list(children)
+        self._rows = None
+
+    # ------------------------------------------------
+    # the rows of the operator, a generator over its children, see the subclasses
+    # ------------------------------------------------
+    def produce(self):
+        raise NotImplementedError
+
+    def open(self):
+        self._rows = self.produce()
+
+    def next(self):
+        return next(self._rows, None)
+
+    def close(self):
+        if self._rows is not None:
+            if hasattr(self._rows, 'close'):
+                self._rows.close()  # closes the children being read
+            self._rows = None
+
+    def __iter__(self):
+        self.open()
+        try:
+            while True:
+                row = self.next()
+                if row is None:
+                    return
+                yield row
+        finally:
+            self.close()
+
+# ------------------------------------------------
+# Scan operator: the records of a table, block after block
+# the blocks ruled out by the zone map for zone_filter, list of (FieldIndex, op, FilterParam), are skipped
+# ------------------------------------------------
+class Scan(Operator):
+
+    def __init__(self, storage_obj, zone_filter=None):
+        Operator.__init__(self)
+        self.storage_obj = storage_obj
+        self.zone_filter = zone_filter
+
+    def produce(self):
+        return self.storage_obj.scan(zone_filter=self.zone_filter)
+
+# ------------------------------------------------
+# IndexScan operator: the records of a table found through an index
+# the records of the key lookup when it is given, else those of the key range
+# bounds, see Index.range_search; with covered, the records are made from the B-tree
+# leaves without reading the data file, see Index.covered_search. The index is a
+# CatalogIndex, its file is only opened and searched when the scan starts
+# ------------------------------------------------
+class IndexScan(Operator):
+
+    def __init__(self, storage_obj, index_obj, bounds=(), lookup=None, covered=False):
+        Operator.__init__(self)
+        self.storage_obj = storage_obj
+        self.index_obj = index_obj
+        self.bounds = bounds
+        self.lookup = lookup
+        self.covered = covered
+
+    def produce(self):
+        index_obj = self.index_obj.open()
+        if self.covered:
+            return index_obj.covered_search(*self.bounds)
+        if self.lookup is not None:
+            return self.storage_obj.fetch(index_obj.lookup(self.lookup))
+        return self.storage_obj.fetch(index_obj.range_search(*self.bounds))
+
+# ------------------------------------------------
+# Filter operator: the rows satisfying all the conditions, see filter_records
+# ------------------------------------------------
+class Filter(Operator):
+
+    def __init__(self, child, table_num, conditions, column_conditions=(), or_conditions=()):
+        Operator.__init__(self, child)
+        self.table_num = table_num
+        self.conditions = conditions
+        self.column_conditions = column_conditions
+        self.or_conditions = or_conditions
+
+    def produce(self):
+        return filter_records(self.children[0], self.table_num, self.conditions, self.column_conditions,
+                              self.or_conditions)
+
+# ------------------------------------------------
+# Project operator: the selected fields of every row, see project_records
+# ------------------------------------------------
+class Project(Operator):
+
+    def __init__(self, child, table_num, SelIndexList):
+        Operator.__init__(self, child)
+        self.table_num = table_num
+        self.SelIndexList = SelIndexList
+
+    def produce(self):
+        return project_records(self.children[0], self.table_num, self.SelIndexList)
+
+# ------------------------------------------------
+# Join operator: the rows of the left child joined with the records of the right child
+# method is 'HASH' (see hash_join), 'MERGE' (see merge_join, both children in the
+# order of the key) or 'CROSS' (see cross_join); the left child gives records
+# rather than rows when it is the first table
+# ------------------------------------------------
+class Join(Operator):
+
+    def __init__(self, left, right, method, row_key=None, record_key=None, sortable=False, left_is_table=False):
+        Operator.__init__(self, left, right)
+        self.method = method
+        self.row_key = row_key
+        self.record_key = record_key
+        self.sortable = sortable
+        self.left_is_table = left_is_table
+
+    def produce(self):
+        left, right = self.children
+        rows = ([record] for record in left) if self.left_is_table else left
+        if self.method == 'HASH':
+            return hash_join(rows, right, self.row_key, self.record_key, self.sortable)
+        if self.method == 'MERGE':
+            return merge_join(((self.row_key(row), row) for row in rows),
+                              ((self.record_key(record), record) for record in right))
+        return cross_join(rows, right)
+
+# ------------------------------------------------
+# Sort operator: the rows in the order of keys, list of (TableIndex, FieldIndex,
+# FieldType, descending); equal rows keep their order. The rows are sorted with an
+# external sort, see sort_by_key; when only the first limit rows are wanted they are
+# kept in a heap of limit rows instead
+# ------------------------------------------------
+class Sort(Operator):
+
+    def __init__(self, child, table_num, keys, limit=None):
+        Operator.__init__(self, child)
+        self.table_num = table_num
+        self.keys = keys
+        self.limit = limit
+
+    def sort_key(self, row):
+        key = []
+        for TableIndex, FieldIndex, FieldType, descending in self.keys:
+            value = field_value((row if self.table_num == 1 else row[TableIndex])[FieldIndex], FieldType)
+            if descending:
+                # negated integers, and strings as their negated characters ended by a
+                # value above them all so that a string comes after its prefixes
+                value = tuple([-ord(c) for c in value]) + (1,) if isinstance(value, str) else -value
+            key.append(value)
+        return tuple(key)
+
+    def produce(self):
+        if self.limit is not None:
+            top = heapq.nsmallest(self.limit, ((self.sort_key(row), position, row)
+                                               for position, row in enumerate(self.children[0])))
+            return (row for _, _, row in top)
+        return (row for _, row in sort_by_key(self.children[0], self.sort_key))
+
+# ------------------------------------------------
+# Limit operator: the first count rows, the child is closed as soon as they are read
+# ------------------------------------------------
+class Limit(Operator):
+
+    def __init__(self, child, count):
+        Operator.__init__(self, child)
+        self.count = count
+
+    def produce(self):
+        if self.count <= 0:
+            return
+        rows = iter(self.children[0])
+        try:
+            for done, row in enumerate(rows, 1):
+                yield row
+                if done >= self.count:
+                    return
+        finally:
+            if hasattr(rows, 'close'):
+                rows.close()
+
+# ----------------------------------------------
+# to join the tables of the from list, from left to right
+# a table is joined with the tables before it on the = conditions between their
+# fields: a merge join when the first two tables can both be read in the order of
+# the fields of one condition (see ordered_access), a hash join otherwise; a table
+# without such a condition is joined as a cross product
+# input
+#       table_scans: the operator (or iterable) giving the records of every table
+#       column_conditions: list of (TableIndex, FieldIndex, FieldType, op, OtherTableIndex, OtherFieldIndex)
+#       tableName_Order: names of the tables
+#       current_field: field lists of the tables
+#       ordered_scan: optional function (TableIndex, FieldIndex) -> (operator, access_path) reading
+#                     a table in the order of a field, None when it cannot
+#       access_paths: the access path of every table, updated when a table is read by ordered_scan
+# output
+#       (rows, column_conditions, joins): the Join operator giving the rows (lists of records),
+#       the column conditions left to check and the description of every join
+# ------------------------------------------------
+def join_tables(table_scans, column_conditions, tableName_Order, current_field, ordered_scan=None, access_paths=None):
+    def field_name(TableIndex, FieldIndex):
+        name = current_field[TableIndex][FieldIndex][0]
+        if isinstance(name, bytes):
+            name = name.decode('utf-8')
+        return tableName_Order[TableIndex].strip() + '.' + name.strip()
+    def same_type(TableIndex, FieldIndex, OtherTable, OtherField):
+        return current_field[TableIndex][FieldIndex][1] == current_field[OtherTable][OtherField][1]
+    rows = table_scans[0]
+    joins = []
+    for ti in range(1, len(table_scans)):
+        pairs = []  # (condition, row key field, record key field, description)
+        remaining = []
+        for condition in column_conditions:
+            TableIndex, FieldIndex, FieldType, op, OtherTable, OtherField = condition
+            if op == '=' and TableIndex == ti and OtherTable < ti:
+                pairs.append((condition, (OtherTable, OtherField, FieldType), (FieldIndex, FieldType),
+                              field_name(TableIndex, FieldIndex) + ' = ' + field_name(OtherTable, OtherField)))
+            elif op == '=' and OtherTable == ti and TableIndex < ti:
+                pairs.append((condition, (TableIndex, FieldIndex, FieldType), (OtherField, FieldType),
+                              field_name(TableIndex, FieldIndex) + ' = ' + field_name(OtherTable, OtherField)))
+            else:
+                remaining.append(condition)
+        column_conditions = remaining
+        if not pairs:
+            rows = Join(rows, table_scans[ti], 'CROSS', left_is_table=ti == 1)
+            joins.append('CROSS JOIN ' + tableName_Order[ti].strip())
+            continue
+        sortable = all(same_type(*(condition[:2] + condition[4:])) for condition, _, _, _ in pairs)
+        merged = False
+        if ti == 1 and ordered_scan is not None:
+            # the first table alone makes the rows, both tables may come ordered by a B-tree
+            for condition, row_field, record_field, description in pairs:
+                if not same_type(*(condition[:2] + condition[4:])):
+                    continue
+                left = ordered_scan(row_field[0], row_field[1])
+                right = ordered_scan(ti, record_field[0]) if left is not None else None
+                if right is None:
+                    continue
+                row_key, record_key = join_key_functions([row_field], [record_field])
+                rows = Join(left[0], right[0], 'MERGE', row_key, record_key, left_is_table=True)
+                if access_paths is not None:
+                    access_paths[row_field[0]], access_paths[ti] = left[1], right[1]
+                # the other conditions between the two tables are checked on the joined rows
+                column_conditions += [other[0] for other in pairs if other[0] is not condition]
+                joins.append('MERGE JOIN ' + description)
+                merged = True
+                break
+        if not merged:
+            row_key, record_key = join_key_functions([row_field for _, row_field, _, _ in pairs],
+                                                     [record_field for _, _, record_field, _ in pairs])
+            rows = Join(rows, table_scans[ti], 'HASH', row_key, record_key, sortable, left_is_table=ti == 1)
+            joins.append('HASH JOIN ' + ' AND '.join([description for _, _, _, description in pairs]))
+    return rows, column_conditions, joins
+
+# ----------------------------------------------
+# the range of values allowed by conditions on one field
+# input
+#       conditions: list of (op, FilterParam) on the field
+# output
+#       (lo, hi, lo_inclusive, hi_inclusive) values, None if no condition bounds the field
+# ------------------------------------------------
+def value_range(conditions):
+    lo = hi = None
+    lo_inclusive = hi_inclusive = True
+    for op, FilterParam in conditions:
+        if op in ('=', '>', '>=') and (lo is None or FilterParam > lo or (FilterParam == lo and op == '>')):
+            lo, lo_inclusive = FilterParam, op != '>'
+        if op in ('=', '<', '<=') and (hi is None or FilterParam < hi or (FilterParam == hi and op == '<')):
+            hi, hi_inclusive = FilterParam, op != '<'
+    if lo is None and hi is None:
+        return None
+    return lo, hi, lo_inclusive, hi_inclusive
+
+# ----------------------------------------------
+# the bounds of the key range allowed by conditions on one field
+# input
+#       conditions: list of (op, FilterParam) on the field
+#       FieldType: type of the field
+# output
+#       (lo, hi, lo_inclusive, hi_inclusive) index keys for Index.range_search, None if no condition bounds the field
+# ------------------------------------------------
+def index_range(conditions, FieldType):
+    bounds = value_range(conditions)
+    if bounds is None:
+        return None
+    lo, hi, lo_inclusive, hi_inclusive = bounds
+    lo_key = None if lo is None else index_db.make_key(lo, FieldType)
+    hi_key = None if hi is None else index_db.make_key(hi, FieldType)
+    # a string key cut to MAX_KEY_LENGTH may stand for a value beyond it
+    if lo_key is not None and len(lo_key) >= index_db.MAX_KEY_LENGTH:
+        lo_inclusive = True
+    if hi_key is not None and len(hi_key) >= index_db.MAX_KEY_LENGTH:
+        hi_inclusive = True
+    return lo_key, hi_key, lo_inclusive, hi_inclusive
+
+# ----------------------------------------------
+# the bounds of the key range of a composite index allowed by equalities on
+# its leading fields and conditions on the next field
+# the keys of the range are those beginning with prefix whose next part is in
+# the range of the conditions, see index_db.make_composite_key
+# input
+#       prefix: the key parts of the values of the leading fields
+#       conditions: list of (op, FilterParam) on the next field
+#       FieldType: type of the next field
+# output
+#       (lo, hi, lo_inclusive, hi_inclusive) index keys for Index.range_search
+# ------------------------------------------------
+def composite_range(prefix, conditions, FieldType):
+    lo_key = prefix or None
+    hi_key = index_db.key_successor(prefix)
+    bounds = value_range(conditions)
+    if bounds is not None:
+        lo, hi, lo_inclusive, hi_inclusive = bounds
+        if lo is not None:
+            lo_key = prefix + index_db.key_part(lo, FieldType)
+            if not lo_inclusive:
+                lo_key = index_db.key_successor(lo_key)
+        if hi is not None:
+            hi_key = prefix + index_db.key_part(hi, FieldType)
+            if hi_inclusive:
+                hi_key = index_db.key_successor(hi_key)
+    # the keys are cut to MAX_KEY_LENGTH, a cut bound must still cover its keys
+    if lo_key is not None and len(lo_key) > index_db.MAX_KEY_LENGTH:
+        lo_key = lo_key[:index_db.MAX_KEY_LENGTH]
+    if hi_key is not None and len(hi_key) > index_db.MAX_KEY_LENGTH:
+        hi_key = index_db.key_successor(hi_key[:index_db.MAX_KEY_LENGTH])
+    return lo_key, hi_key, True, False
+
+# ----------------------------------------------
+# how an index can answer conditions on the fields of its table
+# the equalities on the leading fields of the index are used, then the
+# conditions on the next field when the index is a B-tree
+# input
+#       index_obj: an index kept up to date on the table, see index_db.CatalogIndex
+#       conditions: list of (FieldIndex, FieldType, op, FilterParam)
+# output
+#       (used, key, bounds, columns): the number of fields used, the key to look up when
+#       every field of the index has an equality (bounds is None then), else the bounds
+#       for Index.range_search (key is None then), and the description of the fields used;
+#       None if the index cannot narrow the records
+# ------------------------------------------------
+def index_plan(index_obj, conditions):
+    equal_values = []
+    for FieldIndex in index_obj.field_indexes:
+        values = [FilterParam for ConditionField, FieldType, op, FilterParam in conditions
+                  if ConditionField == FieldIndex and op == '=']
+        if not values:
+            break
+        equal_values.append(values[0])
+    names = [index_obj.field_list[FieldIndex][0].decode('utf-8').strip() for FieldIndex in index_obj.field_indexes]
+    columns = ['%s = %s' % (name, value) for name, value in zip(names, equal_values)]
+    if len(equal_values) == len(index_obj.field_indexes):
+        return len(equal_values), index_obj.key_from_values(equal_values), None, ', '.join(columns)
+    if index_obj.index_type != index_db.BTREE_INDEX:
+        return None
+    next_field = len(equal_values)
+    next_conditions = [(op, FilterParam) for FieldIndex, FieldType, op, FilterParam in conditions
+                       if FieldIndex == index_obj.field_indexes[next_field]]
+    used = len(equal_values)
+    if value_range(next_conditions) is not None:
+        used += 1
+        columns.append(names[next_field])
+    if used == 0:
+        return None
+    if len(index_obj.field_indexes) == 1:
+        bounds = index_range(next_conditions, index_obj.field_type)
+    else:
+        prefix = b''.join([index_db.key_part(value, FieldType)
+                           for value, FieldType in zip(equal_values, index_obj.field_types)])
+        bounds = composite_range(prefix, next_conditions, index_obj.field_types[next_field])
+    return used, None, bounds, ', '.join(columns)
+
+# ----------------------------------------------
+# to read the records of a table that may satisfy conditions on its fields
+# the access path is chosen among the indexes kept up to date on the table,
+# the index using the most conditions wins (see index_plan): when every field
+# of an index has an equality its key is looked up and only the records of
+# the matching rids are read, an index holding the needed fields first, then
+# a hash index before a B-tree one when there are several;
+# otherwise a B-tree reads the records of the key range of the conditions
+# with one descent; otherwise the table is scanned and the blocks ruled out
+# by its zone map are skipped. When a B-tree holds all the needed fields in
+# its leaves (see Index.covered_fields), the records are made from the leaf
+# entries and the data file is not read (INDEX ONLY). The path is chosen from
+# the index catalog alone (see index_db.CatalogIndex), the chosen index is read
+# when the records are. The records are not checked against the conditions,
+# see filter_records
+# input
+#       storage_obj: the Storage object of the table
+#       conditions: list of (FieldIndex, FieldType, op, FilterParam)
+#       needed: the field indexes the query reads, None for all of them
+# output
+#       (records, access_path): the Scan or IndexScan operator giving the records and the description
+#       of the chosen access path; the fields not needed may be None in the records of an index only access
+# ------------------------------------------------
+def access_table(storage_obj, conditions, needed=None):
+    table_name = storage_obj.tablename.strip()
+    if not conditions:
+        return Scan(storage_obj), 'TABLE SCAN ' + table_name
+    index_objs = sorted((index_obj for index_obj in index_db.catalog_table_indexes(table_name, storage_obj.getFieldList())
+                         if index_obj.maintained),
+                        key=lambda index_obj: index_obj.index_type != index_db.HASH_INDEX)
+    plans = []
+    for index_obj in index_objs:
+        plan = index_plan(index_obj, conditions)
+        if plan is not None:
+            plans.append((index_obj,) + plan)
+    if not plans:
+        return Scan(storage_obj, [(FieldIndex, op, FilterParam) for FieldIndex, FieldType, op, FilterParam in conditions]), \
+               'TABLE SCAN %s (zone map)' % table_name
+    most_used = max(plan[1] for plan in plans)
+    plans = [plan for plan in plans if plan[1] == most_used]
+    if needed is None:
+        needed = range(len(storage_obj.getFieldList()))
+    covering = [plan[0] for plan in plans if plan[0].covered_fields.issuperset(needed)]
+    # a lookup, an index only one first, then the first in the order of index_objs
+    lookups = [plan for plan in plans if plan[2] is not None]
+    if lookups:
+        index_obj, used, key, bounds, columns = min(lookups, key=lambda plan: plan[0] not in covering)
+        if index_obj in covering:
+            return IndexScan(storage_obj, index_obj, (key, key), covered=True), \
+                   'INDEX ONLY LOOKUP %s (%s)' % (index_obj.index_file, columns)
+        return IndexScan(storage_obj, index_obj, lookup=key), 'INDEX LOOKUP %s (%s)' % (index_obj.index_file, columns)
+    index_obj, used, key, bounds, columns = min(plans, key=lambda plan: plan[0] not in covering)
+    if index_obj in covering:
+        return IndexScan(storage_obj, index_obj, bounds, covered=True), 'INDEX ONLY SCAN %s (%s)' % (index_obj.index_file, columns)
+    return IndexScan(storage_obj, index_obj, bounds), 'INDEX RANGE SCAN %s (%s)' % (index_obj.index_file, columns)
+
+# ----------------------------------------------
+# to read the records of a table in the order of one of its fields
+# a B-tree kept up to date on the table whose first field it is gives that order,
+# only the key range of the conditions on its fields is read (see index_plan);
+# the field must not be cut in the keys (see Index.covered_fields) for the keys
+# to have the order of the values. An index holding all the needed fields is
+# preferred, then the one using the most conditions
+# input
+#       storage_obj: the Storage object of the table
+#       FieldIndex: the field giving the order
+#       conditions: list of (FieldIndex, FieldType, op, FilterParam)
+#       needed: the field indexes the query reads, None for all of them
+# output
+#       (records, access_path): the IndexScan operator and its description, None if no B-tree gives the order
+# ------------------------------------------------
+def ordered_access(storage_obj, FieldIndex, conditions, needed=None):
+    if needed is None:
+        needed = range(len(storage_obj.getFieldList()))
+    best = None
+    for index_obj in index_db.catalog_table_indexes(storage_obj.tablename.strip(), storage_obj.getFieldList()):
+        if index_obj.index_type != index_db.BTREE_INDEX or not index_obj.maintained or \
+           index_obj.field_indexes[0] != FieldIndex or FieldIndex not in index_obj.covered_fields:
+            continue
+        plan = index_plan(index_obj, conditions)
+        rank = (index_obj.covered_fields.issuperset(needed), plan[0] if plan else 0)
+        if best is None or rank > best[0]:
+            best = (rank, index_obj, plan)
+    if best is None:
+        return None
+    (covering, used), index_obj, plan = best
+    if plan is None:
+        bounds, columns = (None, None), index_obj.field_list[FieldIndex][0].decode('utf-8').strip()
+    elif plan[1] is not None:
+        bounds, columns = (plan[1], plan[1]), plan[3]
+    else:
+        bounds, columns = plan[2], plan[3]
+    if covering:
+        return IndexScan(storage_obj, index_obj, bounds, covered=True), \
+               'INDEX ONLY ORDERED SCAN %s (%s)' % (index_obj.index_file, columns)
+    return IndexScan(storage_obj, index_obj, bounds), 'INDEX ORDERED SCAN %s (%s)' % (index_obj.index_file, columns)
+
+# ----------------------------------------------
+# to keep only the selected fields of every record
+# input
+#       records: iterable of records (or of per-table record lists when table_num > 1)
+#       table_num: number of tables in the from list
+#       SelIndexList: list of (TableIndex, FieldIndex) to keep
+# output
+#       generator of the projected records
+# ------------------------------------------------
+def project_records(records, table_num, SelIndexList):
+    for tmpRecord in records:
+        tmp = []
+        for x in SelIndexList:
+            if table_num == 1:
+                tmp.append(tmpRecord[x[1]])
+            else:
+                tmp.append(tmpRecord[x[0]][x[1]])
+        yield tmp
+
 def execute_logical_tree():
     if common_db.global_logical_tree:
+        access_paths = []  # the access path of every table of the from list, then of every join
         def excute_tree():
-            idx = 0
-            dict_ = {}
-            def show_tree(node_obj, idx, dict_):
-                if isinstance(node_obj, common_db.Node):  # it is a Node object
-                    dict_.setdefault(idx, [])
-                    dict_[idx].append(node_obj.value)
-                    if node_obj.var:
-                        dict_[idx][-1] = tuple((dict_[idx][-1], node_obj.var))
-                    if node_obj.children:
-                        for i in range(len(node_obj.children)):
-                            show_tree(node_obj.children[i], idx + 1, dict_)
-            show_tree(common_db.global_logical_tree, idx, dict_)
-            idx = sorted(dict_.keys(), reverse=True)[0]
+            # the tables, the conditions of the Filter above each of them and those of the Filters
+            # above the joins, see push_down_predicates
+            tableName_Order, table_where, join_where, sel_list, order_list, limit = read_logical_tree(common_db.global_logical_tree)
+            if not tableName_Order:
+                return [], [], False
             def GetFilterParam(tableName_Order, current_field, param):
                 if isinstance(param, bytes):
                     param = param.decode('utf-8')
@@ -141,7 +1114,13 @@ def execute_logical_tree():
                     TableIndex = 0
                     FieldName = param
                 else:
-                    return 0, 0, 0, False
+                    # a field without its table must belong to exactly one table
+                    FieldName = param
+                    owners = [ti for ti, fields in enumerate(current_field)
+                              if FieldName in [x[0].decode('utf-8').strip() if isinstance(x[0], bytes) else str(x[0]).strip() for x in fields]]
+                    if len(owners) != 1:
+                        return 0, 0, 0, False
+                    TableIndex = owners[0]
                 tmp = [x[0].decode('utf-8').strip() if isinstance(x[0], bytes) else str(x[0]).strip() for x in current_field[TableIndex]]
                 if FieldName in tmp:
                     FieldIndex = tmp.index(FieldName)
@@ -149,110 +1128,145 @@ def execute_logical_tree():
                     return TableIndex, FieldIndex, FieldType, True
                 else:
                     return 0, 0, 0, False
-            current_field = []
-            current_list =[]
-            while (idx >= 0):
-                if idx == sorted(dict_.keys(), reverse=True)[0]:
-                    if len(dict_[idx]) > 1:
-                        t1 = dict_[idx][0]
-                        t2 = dict_[idx][1]
-                        if isinstance(t1, bytes):
-                            t1 = t1.decode('utf-8')
-                        if isinstance(t2, bytes):
-                            t2 = t2.decode('utf-8')
-                        a_1 = storage_db.Storage(t1,debug=False)
-                        a_2 = storage_db.Storage(t2,debug=False)
-                        current_list = []
-                        tableName_Order = [t1, t2]
-                        current_field = [a_1.getfilenamelist(), a_2.getfilenamelist()]
-                        for x in itertools.product(a_1.getRecord(), a_2.getRecord()):
-                            current_list.append(list(x))
-                    else:
-                        t1 = dict_[idx][0]
-                        if isinstance(t1, bytes):
-                            t1 = t1.decode('utf-8')
-                        a_1 = storage_db.Storage(t1,debug=False)
-                        current_list = a_1.getRecord()
-                        tableName_Order = [t1]
-                        current_field = [a_1.getfilenamelist()]
-                elif 'X' in dict_[idx] and len(dict_[idx]) > 1:
-                    t2 = dict_[idx][1]
-                    if isinstance(t2, bytes):
-                        t2 = t2.decode('utf-8')
-                    a_2 = storage_db.Storage(t2,debug=False)
-                    tableName_Order.append(t2)
-                    current_field.append(a_2.getfilenamelist())
-                    tmp_List = current_list[:]
-                    current_list = []
-                    for x in itertools.product(tmp_List, a_2.getRecord()):
-                        current_list.append(list((x[0][0], x[0][1], x[1])))
-                elif 'X' not in dict_[idx]:
-                    if 'Filter' in dict_[idx][0]:
-                        FilterChoice = dict_[idx][0][1]
-                        TableIndex, FieldIndex, FieldType, isTrue = GetFilterParam(tableName_Order, current_field,FilterChoice[0])
+            table_objs = [storage_db.Storage(table_name, debug=False) for table_name in tableName_Order]
+            current_field = [table_obj.getfilenamelist() for table_obj in table_objs]
+            access_paths[:] = ['TABLE SCAN ' + table_name for table_name in tableName_Order]
+            # the conditions of a where list, joined with AND, as (conditions, column_conditions,
+            # or_conditions), see compile_conditions; None when a field or a constant is wrong
+            def resolve(where):
+                resolved = ([], [], [])
+                for condition in where:
+                    if len(condition) == 2:
+                        # ('OR', branches), see where_conditions
+                        branches = [resolve(branch) for branch in condition[1]]
+                        if None in branches:
+                            return None
+                        resolved[2].append(branches)
+                        continue
+                    field, op, param, is_field = condition
+                    TableIndex, FieldIndex, FieldType, isTrue = GetFilterParam(tableName_Order, current_field, field)
+                    if not isTrue:
+                        return None
+                    if is_field:
+                        OtherTable, OtherField, _, isTrue = GetFilterParam(tableName_Order, current_field, param)
                         if not isTrue:
-                            return [], [], False
-                        else:
-                            if FieldType == 2:
-                                FilterParam = int(FilterChoice[2].strip())
-                            elif FieldType == 3:
-                                FilterParam = bool(FilterChoice[2].strip())
-                            else:
-                                FilterParam = FilterChoice[2].strip()
-                        tmp_List = current_list[:]
-                        current_list = []
-                        for tmpRecord in tmp_List:
-                            if len(current_field) == 1:
-                                ans = tmpRecord[FieldIndex]
-                            else:
-                                ans = tmpRecord[TableIndex][FieldIndex]
-                            if FieldType == 0 or FieldType == 1:
-                                ans = ans.strip() if isinstance(ans, bytes) else str(ans).strip()
-                            if isinstance(FilterParam, bytes):
-                                FilterParam = FilterParam.decode('utf-8').strip()
-                            else:
-                                FilterParam = str(FilterParam).strip()
-                            if isinstance(ans, bytes):
-                                ans = ans.decode('utf-8').strip()
-                            else:
-                                ans = str(ans).strip()
-                            if FilterParam == ans:
-                                current_list.append(tmpRecord)
-                    if 'Proj' in dict_[idx][0]:
-                        SelIndexList = []
-                        if dict_[idx][0][1][0] == '*':
-                            for ti, fields in enumerate(current_field):
-                                for fi in range(len(fields)):
-                                    SelIndexList.append((ti, fi))
-                        else:
-                            for i in range(len(dict_[idx][0][1])):
-                                param = dict_[idx][0][1][i]
-                                TableIndex, FieldIndex, FieldType, isTrue = GetFilterParam(tableName_Order, current_field, param)
-                                if not isTrue:
-                                    return [], [], False
-                                SelIndexList.append((TableIndex, FieldIndex))
-                        tmp_List = current_list[:]
-                        current_list = []
-                        for tmpRecord in tmp_List:
-                            tmp = []
-                            for x in SelIndexList:
-                                if len(current_field) == 1:
-                                    tmp.append(tmpRecord[x[1]])
-                                else:
-                                    tmp.append(tmpRecord[x[0]][x[1]])
-                            current_list.append(tmp)
-                        outPutField = []
-                        for xi in SelIndexList:
-                            field_name = current_field[xi[0]][xi[1]][0]
-                            if isinstance(field_name, bytes):
-                                field_name = field_name.decode('utf-8')
-                            outPutField.append(
-                                tableName_Order[xi[0]].strip() + '.' + field_name.strip()
-                            )
-                        return outPutField, current_list, True
-                idx -= 1
+                            return None
+                        resolved[1].append((TableIndex, FieldIndex, FieldType, op, OtherTable, OtherField))
+                        continue
+                    try:
+                        resolved[0].append((TableIndex, FieldIndex, FieldType, op, typed_constant(FieldType, param)))
+                    except ValueError:
+                        return None
+                return resolved
+            # the conditions are joined with AND; those on the fields of one table are checked
+            # on its records as they are read, the others on the joined rows
+            scan_conditions = [[] for _ in table_objs]         # (0, FieldIndex, FieldType, op, FilterParam)
+            scan_column_conditions = [[] for _ in table_objs]  # (0, FieldIndex, FieldType, op, 0, OtherField)
+            scan_or_conditions = [[] for _ in table_objs]
+            conditions = []
+            column_conditions = []
+            or_conditions = []
+            for where, pushed_to in [(where, ti) for ti, where in enumerate(table_where)] + [(join_where, None)]:
+                for condition in where:
+                    resolved = resolve([condition])
+                    if resolved is None:
+                        return [], [], False
+                    if set([ti for ti, fi in condition_fields(*resolved)]) != set([pushed_to]):
+                        conditions += resolved[0]
+                        column_conditions += resolved[1]
+                        or_conditions += resolved[2]
+                        continue
+                    scan_conditions[pushed_to] += [(0,) + condition[1:] for condition in resolved[0]]
+                    scan_column_conditions[pushed_to] += [(0,) + condition[1:4] + (0, condition[5])
+                                                          for condition in resolved[1]]
+                    # the TableIndex of the records of one table is not used, see compile_conditions
+                    scan_or_conditions[pushed_to] += resolved[2]
+            # the fields read by the rest of the query, an index holding them all
+            # answers the query without the data file
+            needed = [set() for _ in table_objs]
+            for ti in range(len(table_objs)):
+                needed[ti].update(condition[1] for condition in scan_conditions[ti])
+                needed[ti].update(condition[1] for condition in scan_column_conditions[ti])
+                needed[ti].update(condition[5] for condition in scan_column_conditions[ti])
+                needed[ti].update(fi for _, fi in condition_fields((), (), scan_or_conditions[ti]))
+            for TableIndex, FieldIndex in condition_fields(conditions, column_conditions, or_conditions):
+                needed[TableIndex].add(FieldIndex)
+            # the fields of the Sort, (TableIndex, FieldIndex, FieldType, descending)
+            SortKeys = []
+            for param, direction in order_list:
+                TableIndex, FieldIndex, FieldType, isTrue = GetFilterParam(tableName_Order, current_field, param)
+                if not isTrue:
+                    return [], [], False
+                needed[TableIndex].add(FieldIndex)
+                SortKeys.append((TableIndex, FieldIndex, FieldType, direction == 'DESC'))
+            for param in sel_list:
+                if param == '*':
+                    needed = [set(range(len(fields))) for fields in current_field]
+                    break
+                TableIndex, FieldIndex, FieldType, isTrue = GetFilterParam(tableName_Order, current_field, param)
+                if isTrue:
+                    needed[TableIndex].add(FieldIndex)
+            if limit is not None:
+                try:
+                    limit = int(limit.strip("'"))
+                except ValueError:
+                    return [], [], False
+            # every table is read through its best access path for its own conditions
+            def filtered(ti, records):
+                if not scan_conditions[ti] and not scan_column_conditions[ti] and not scan_or_conditions[ti]:
+                    return records
+                return Filter(records, 1, scan_conditions[ti], scan_column_conditions[ti], scan_or_conditions[ti])
+            table_conditions = [[condition[1:] for condition in scan_conditions[ti]] for ti in range(len(table_objs))]
+            table_scans = []
+            for ti, table_obj in enumerate(table_objs):
+                records, access_paths[ti] = access_table(table_obj, table_conditions[ti], needed[ti])
+                table_scans.append(filtered(ti, records))
+            def ordered_scan(ti, FieldIndex):
+                if 'LOOKUP' in access_paths[ti]:
+                    return None  # the few records of a lookup are hash joined
+                ordered = ordered_access(table_objs[ti], FieldIndex, table_conditions[ti], needed[ti])
+                if ordered is None:
+                    return None
+                return filtered(ti, ordered[0]), ordered[1]
+            if len(table_scans) == 1:
+                current_list = table_scans[0]
+            else:
+                # joined on the = conditions between tables instead of the full product
+                current_list, column_conditions, access_paths[len(table_scans):] = \
+                    join_tables(table_scans, column_conditions, tableName_Order, current_field,
+                                ordered_scan, access_paths)
+            if conditions or column_conditions or or_conditions:
+                current_list = Filter(current_list, len(current_field), conditions, column_conditions, or_conditions)
+            if SortKeys:
+                current_list = Sort(current_list, len(current_field), SortKeys, limit)
+            if limit is not None:
+                current_list = Limit(current_list, limit)
+            SelIndexList = []
+            if sel_list[0] == '*':
+                for ti, fields in enumerate(current_field):
+                    for fi in range(len(fields)):
+                        SelIndexList.append((ti, fi))
+            else:
+                for param in sel_list:
+                    TableIndex, FieldIndex, FieldType, isTrue = GetFilterParam(tableName_Order, current_field, param)
+                    if not isTrue:
+                        return [], [], False
+                    SelIndexList.append((TableIndex, FieldIndex))
+            current_list = Project(current_list, len(current_field), SelIndexList)
+            outPutField = []
+            for xi in SelIndexList:
+                field_name = current_field[xi[0]][xi[1]][0]
+                if isinstance(field_name, bytes):
+                    field_name = field_name.decode('utf-8')
+                outPutField.append(
+                    tableName_Order[xi[0]].strip() + '.' + field_name.strip()
+                )
+            return outPutField, current_list, True
         outPutField, current_list, isRight = excute_tree()
         if isRight:
+            print('ACCESS PATH:')
+            for access_path in access_paths:
+                print('    ' + access_path)
             print('-' * (len(outPutField) * 12))
             print(' | '.join(outPutField))
             print('-' * (len(outPutField) * 12))
@@ -274,13 +1288,16 @@ def construct_logical_tree():
     syn_tree = common_db.global_syn_tree
     if syn_tree:
         if syn_tree.value == 'SFW':
-            sel_list, from_list, where_list = extract_sfw_data()
+            sel_list, from_list, where_list, order_list, limit = extract_sfw_data()
             sel_list = [i for i in sel_list if i != ',']
             from_list = [i for i in from_list if i != ',']
             where_list = tuple(where_list)
             from_node = construct_from_node(from_list)
             where_node = construct_where_node(from_node, where_list)
-            common_db.global_logical_tree = construct_select_node(where_node, sel_list)
+            order_node = construct_order_node(where_node, order_list)
+            limit_node = construct_limit_node(order_node, limit)
+            # the conditions on one table are moved down to it, see push_down_predicates
+            common_db.global_logical_tree = push_down_predicates(construct_select_node(limit_node, sel_list))
         else:
             common_db.global_logical_tree = syn_tree
     else:
@@ -322,7 +1339,7 @@ def execute_create_table(syn_tree, schema_obj=None):
 
 # ----------------------------------------------
 # Author: Xinjian Zhang   278254081@qq.com
-# to execute INSERT INTO SQL statements
+# to execute INSERT INTO SQL statements, with one or many rows
 # input
 #       syn_tree: syntax tree node for INSERT INTO
 #       schema_obj: schema object (optional)
@@ -333,10 +1350,17 @@ def execute_insert_into(syn_tree):
     if syn_tree.value == 'INSERT_INTO':
         table_name = syn_tree.var['table_name']
         values = syn_tree.var['values']
+        rows = syn_tree.var.get('rows') or [values]
         try:
             table_name_bytes = table_name.encode('utf-8')
             storage_obj = storage_db.Storage(table_name_bytes, debug=False)
-            if storage_obj.insert_record(values):
+            if len(rows) > 1:
+                # many rows are written block by block as one transaction
+                if storage_obj.insert_many(rows):
+                    print(f"{len(rows)} records inserted into '{table_name}' successfully!")
+                else:
+                    print(f"Failed to insert records into '{table_name}'!")
+            elif storage_obj.insert_record(values):
                 print(f"Record inserted into '{table_name}' successfully!")
             else:
                 print(f"Failed to insert record into '{table_name}'!")
@@ -361,9 +1385,10 @@ def execute_delete_from(syn_tree):
             storage_obj = storage_db.Storage(table_name_bytes, debug=False)
             if condition is None:
                 # Delete all records
-                storage_obj.record_list = []
-                storage_obj._rewrite_data_file()
+                storage_obj.delete_all_records()
                 print(f"All records deleted from '{table_name}'!")
+            elif condition.value != 'Cond' or condition.children[1].value != '=':
+                print("Only a single '=' condition is supported in DELETE")
             else:
                 # Delete based on condition
                 field_name = condition.children[0].children[0]  # TCNAME
@@ -390,6 +1415,9 @@ def execute_update_set(syn_tree):
         table_name = syn_tree.var['table_name']
         assignments = syn_tree.var['assignments']
         condition = syn_tree.var.get('condition')
+        if condition is not None and (condition.value != 'Cond' or condition.children[1].value != '='):
+            print("Only a single '=' condition is supported in UPDATE")
+            return
         try:
             table_name_bytes = table_name.encode('utf-8')
             storage_obj = storage_db.Storage(table_name_bytes, debug=False)
@@ -407,54 +1435,10 @@ def execute_update_set(syn_tree):
                     # Remove quotes from condition_value if present
                     if isinstance(condition_value, str) and condition_value.startswith("'") and condition_value.endswith("'"):
                         condition_value = condition_value[1:-1]
-                    # Handle case where update field differs from condition field
-                    if update_field == condition_field:
-                        # If update field and condition field are the same, use existing method
-                        storage_obj.update_record_by_field(condition_field, condition_value, update_field, new_value)
-                    else:
-                        # Custom update logic for different fields
-                        updated = False
-                        # Find field indices
-                        condition_field_index = None
-                        update_field_index = None
-                        for idx, field in enumerate(storage_obj.field_name_list):
-                            field_name = field[0].decode('utf-8').strip() if isinstance(field[0], bytes) else str(field[0]).strip()
-                            if field_name == condition_field:
-                                condition_field_index = idx
-                            if field_name == update_field:
-                                update_field_index = idx
-                        if condition_field_index is not None and update_field_index is not None:
-                            # Iterate through records to find matching condition
-                            for i, record in enumerate(storage_obj.record_list):
-                                record_value = record[condition_field_index]
-                                if isinstance(record_value, bytes):
-                                    record_value = record_value.decode('utf-8').strip()
-                                else:
-                                    record_value = str(record_value).strip()
-                                if record_value == condition_value:
-                                    # Found matching record, update target field
-                                    record_list = list(record)
-                                    # Handle field type for new value
-                                    field_type = storage_obj.field_name_list[update_field_index][1]
-                                    field_length = storage_obj.field_name_list[update_field_index][2]
-                                    if field_type == 0 or field_type == 1:  # String types
-                                        # Ensure new value fits field length
-                                        padded_value = new_value.ljust(field_length)[:field_length]
-                                        record_list[update_field_index] = padded_value.encode('utf-8')
-                                    elif field_type == 2:  # Integer type
-                                        record_list[update_field_index] = int(new_value)
-                                    elif field_type == 3:  # Boolean type
-                                        record_list[update_field_index] = bool(new_value)
-                                    storage_obj.record_list[i] = tuple(record_list)
-                                    updated = True
-                                    print(f"Updated record: {condition_field}='{condition_value}' -> {update_field}='{new_value}'")
-                                    break
-                            if updated:
-                                storage_obj._rewrite_data_file()
-                            else:
-                                print("No matching record found.")
-                        else:
-                            print(f"Field not found: {condition_field} or {update_field}")
+                    # the record is located by the condition field and rewritten in its own block,
+                    # the update field may differ from the condition field
+                    if storage_obj.update_record_by_field(condition_field, condition_value, update_field, new_value):
+                        print(f"Updated record: {condition_field}='{condition_value}' -> {update_field}='{new_value}'")
                 else:
                     # Update all records (no WHERE condition)
                     print("Update without WHERE clause not implemented for safety!")               
@@ -489,6 +1473,129 @@ def execute_drop_table(syn_tree, schema_obj=None):
         except Exception as e:
             print(f"Error dropping table: {e}")
 
+# ----------------------------------------------
+# to build again the indexes of a table that the storage layer does not maintain
+# (files of an older format), after its records have moved; they are written in
+# the current format and maintained from then on. An index whose fields are no
+# longer in the table cannot be built and is left unused
+# input
+#       storage_obj: the Storage object of the table
+# output
+#       None (prints the indexes built or left)
+# ------------------------------------------------
+def rebuild_old_indexes(storage_obj):
+    table_name = storage_obj.tablename.strip()
+    for index_obj in index_db.open_table_indexes(table_name, storage_obj.getFieldList()):
+        if index_obj.maintained:
+            continue
+        if index_obj.field_indexes and index_obj.rebuild(storage_obj):
+            print(f"Index '{index_obj.index_name}' built again in the current format")
+        else:
+            print(f"Index '{index_obj.index_name}' is out of date, create it again to use it")
+
+# ----------------------------------------------
+# to compact a table
+# the maintained indexes are updated by the storage layer, the older index files are built again
+# input
+#       table_name: name of the table (str)
+# output
+#       dict of vacuum statistics, see Storage.vacuum
+# ------------------------------------------------
+def vacuum_table(table_name):
+    storage_obj = storage_db.Storage(table_name.encode('utf-8'), debug=False)
+    stats = storage_obj.vacuum()
+    if stats['moved']:
+        rebuild_old_indexes(storage_obj)
+    return stats
+
+# ----------------------------------------------
+# to upgrade the data file of a table to the current format version
+# the maintained indexes are built again by the storage layer, the older index files here
+# input
+#       table_name: name of the table (str)
+# output
+#       number of records rewritten, None if the table already has the current format
+# ------------------------------------------------
+def upgrade_table(table_name):
+    storage_obj = storage_db.Storage(table_name.encode('utf-8'), debug=False)
+    moves = storage_obj.upgrade_format()
+    if moves is None:
+        return None
+    rebuild_old_indexes(storage_obj)
+    return len(moves)
+
+# ----------------------------------------------
+# to execute CREATE INDEX SQL statements
+# the index is built from the records of the table and added to the index catalog
+# input
+#       syn_tree: syntax tree node for CREATE INDEX
+#       schema_obj: schema object (optional)
+# output
+#       None (creates the index file, prints the result)
+# ------------------------------------------------
+def execute_create_index(syn_tree, schema_obj=None):
+    index_name = syn_tree.var['index_name']
+    table_name = syn_tree.var['table_name']
+    index_type = {'BTREE': index_db.BTREE_INDEX, 'HASH': index_db.HASH_INDEX}.get(syn_tree.var['method'])
+    if index_type is None:
+        print(f"Unknown index method '{syn_tree.var['method']}', use BTREE or HASH")
+        return
+    if schema_obj is None:
+        schema_obj = schema_db.Schema()
+    if not schema_obj.find_table(table_name.encode('utf-8')):
+        print(f"Table '{table_name}' does not exist!")
+        return
+    if index_db.find_index(index_name) is not None:
+        print(f"Index '{index_name}' already exists!")
+        return
+    try:
+        index_obj = index_db.Index(table_name, index_type, debug=False, index_name=index_name)
+        if index_obj.create_index(syn_tree.var['columns'], include=syn_tree.var['include']):
+            include = f" including ({', '.join(syn_tree.var['include'])})" if syn_tree.var['include'] else ''
+            print(f"Index '{index_name}' created on {table_name}({', '.join(syn_tree.var['columns'])}){include} "
+                  f"using {syn_tree.var['method']}, file {index_obj.index_file}")
+        else:
+            index_db.remove_index_file(index_obj.index_file)  # the file of an index that was not built
+    except Exception as e:
+        print(f"Error creating index: {e}")
+
+# ----------------------------------------------
+# to execute DROP INDEX SQL statements
+# input
+#       syn_tree: syntax tree node for DROP INDEX
+# output
+#       None (removes the index from the catalog and its file)
+# ------------------------------------------------
+def execute_drop_index(syn_tree):
+    index_name = syn_tree.var['index_name']
+    if index_db.drop_index(index_name):
+        print(f"Index '{index_name}' dropped successfully!")
+    else:
+        print(f"Index '{index_name}' does not exist!")
+
+# ----------------------------------------------
+# to execute VACUUM SQL statements
+# input
+#       syn_tree: syntax tree node for VACUUM
+#       schema_obj: schema object (optional)
+# output
+#       None (compacts the table, prints reclaimed bytes and time taken)
+# ------------------------------------------------
+def execute_vacuum(syn_tree, schema_obj=None):
+    table_name = syn_tree.var['table_name']
+    if schema_obj is None:
+        schema_obj = schema_db.Schema()
+    if not schema_obj.find_table(table_name.encode('utf-8')):
+        print(f"Table '{table_name}' does not exist!")
+        return
+    try:
+        stats = vacuum_table(table_name)
+        print(f"Table '{table_name}' vacuumed: {stats['moved']} records moved, "
+              f"blocks {stats['blocks_before']} -> {stats['blocks_after']}, "
+              f"{stats['bytes_reclaimed']} bytes reclaimed in {stats['seconds']:.3f}s")
+    except Exception as e:
+        print(f"Error vacuuming table: {e}")
+
 # ----------------------------------------------
 # Author: Xinjian Zhang   278254081@qq.com
 # unified entry point for executing SQL statements
@@ -506,7 +1613,7 @@ def execute_sql_statement(schema_obj=None):
         construct_logical_tree()
         execute_logical_tree()
         print("LOGICAL TREE:")
-        common_db.show(common_db.global_syn_tree)
+        common_db.show(common_db.global_logical_tree)
     elif syn_tree.value == 'CREATE_TABLE':
         execute_create_table(syn_tree, schema_obj)
     elif syn_tree.value == 'INSERT_INTO':
@@ -517,5 +1624,11 @@ def execute_sql_statement(schema_obj=None):
         execute_update_set(syn_tree)
     elif syn_tree.value == 'DROP_TABLE':
         execute_drop_table(syn_tree, schema_obj)
+    elif syn_tree.value == 'VACUUM':
+        execute_vacuum(syn_tree, schema_obj)
+    elif syn_tree.value == 'CREATE_INDEX':
+        execute_create_index(syn_tree, schema_obj)
+    elif syn_tree.value == 'DROP_INDEX':
+        execute_drop_index(syn_tree)
     else:
         print(f"Unsupported SQL statement type: {syn_tree.value}")
\ No newline at end of file
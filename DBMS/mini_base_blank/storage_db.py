@@ -20,6 +20,17 @@ from common_db import BLOCK_SIZE
 # block_id                                # 0
 # number_of_dat_blocks                    # at first it is 0 because there is no data in the table
 # number_of_fields or number_of_records   # the total number of fields for the table
+# field_name|field_type|field_length      # one entry per field
+# ...
+# free space map                          # from the end of the field entries to FORMAT_VERSION_OFFSET, see below
+# format version                          # at FORMAT_VERSION_OFFSET, 0 in files written before it existed (version 1)
+# FSM magic                               # at FSM_MAGIC_OFFSET, the last 4 bytes of the block
+# -----------------------------------------------------------------------------------------
+# the free space map (FSM) keeps one byte per data block: the number of free slots
+# (tombstones plus never used slots) in the block, capped at 255. It lives in block 0
+# between the field entries and the format version, so the data blocks keep their ids
+# and a table of n fields tracks FORMAT_VERSION_OFFSET - 12 - 18 * n blocks (see
+# fsm_capacity). The blocks beyond are not tracked and only the last of them is filled
 # -----------------------------------------------------------------------------------------
 # the data type is as follows
 # ----------------------------------------------------------
@@ -32,7 +43,7 @@ from common_db import BLOCK_SIZE
 # record_0_offset         # it is a pointer to the data of record
 # record_1_offset
 # ...
-# record_n_offset
+# record_n_offset         # -1 if the record is deleted (a tombstone)
 # ....
 # free space
 # ...
@@ -51,12 +62,29 @@ from common_db import BLOCK_SIZE
 # ...
 # field_n_value
 # -------------------------
+# the encoding of the field values depends on the format version, see codec_db.py
+# version 1 stores every value as text, version 2 stores INTEGER in 8 bytes and BOOLEAN in 1 byte
+# -------------------------
 import struct
 import os
 import ctypes
 import common_db 
 import log_db
 import uuid
+import time
+import itertools
+import index_db
+from buffer_db import global_buffer_manager
+from codec_db import TableCodec, TOMBSTONE, FORMAT_V1, FORMAT_V2, CURRENT_FORMAT, to_bool
+from zone_db import ZoneMap
+
+FORMAT_VERSION_OFFSET = BLOCK_SIZE - 8  # where the format version is stored in block 0
+FSM_MAGIC = b'FSM1'                     # marks a block 0 whose free space map is valid
+FSM_MAGIC_OFFSET = BLOCK_SIZE - 4       # where the magic is stored in block 0
+# the most fields whose entries fit in block 0 before the format version
+MAX_FIELD_NUM = (FORMAT_VERSION_OFFSET - struct.calcsize('!iii')) // struct.calcsize('!10sii')
+
+VACUUM_STEP_BLOCKS = 8  # data blocks emptied per vacuum step, the file is consistent between steps
 # --------------------------------------------
 # the class can store table data into files
 # functions include insert, delete and update
@@ -71,30 +99,35 @@ class Storage(object):
     def __init__(self, tablename, field_list_from_create_table=None, debug=False):
         self.tablename = tablename.decode('utf-8') if isinstance(tablename, bytes) else tablename
         tablename = self.tablename.strip()
-        self.record_list = []
-        self.record_Position = []
+        self._record_list = None      # materialized lazily, see scan()
+        self._record_Position = None
         self.data_block_num = 0  
+        self.format_version = CURRENT_FORMAT  # new tables use the current format
         self.debug = debug
         
-        if not os.path.exists(tablename + '.dat'):
+        self.file_name = tablename + '.dat'
+        # all the blocks of the file are accessed through the shared buffer pool
+        self.buffer_manager = global_buffer_manager
+        
+        self.open = False
+        created = not os.path.exists(self.file_name)
+        if created and field_list_from_create_table and len(field_list_from_create_table) > MAX_FIELD_NUM:
+            raise ValueError(f"A table has at most {MAX_FIELD_NUM} fields, {len(field_list_from_create_table)} given")
+        if created:
             if debug:
                 print('table file ' + tablename + '.dat does not exist')
-            self.f_handle = open(tablename + '.dat', 'wb+')
-            self.f_handle.close()
+            self.buffer_manager.drop_file(self.file_name)  # forget blocks of a removed file
+            open(self.file_name, 'wb').close()
             self.open = False
             if debug:
                 print('table file ' + tablename + '.dat has been created')
         
-        self.f_handle = open(tablename + '.dat', 'rb+')
         if debug:
             print(f'table file {tablename}.dat has been opened')
         
         self.open = True
-        self.dir_buf = ctypes.create_string_buffer(BLOCK_SIZE)
-        self.f_handle.seek(0)
-        self.dir_buf = self.f_handle.read(BLOCK_SIZE)
-        self.dir_buf.strip()
-        my_len = len(self.dir_buf)
+        my_len = self.buffer_manager.block_num(self.file_name)
+        self.dir_buf = self.buffer_manager.read_block(self.file_name, 0)
         self.field_name_list = []
         beginIndex = 0
         
@@ -118,9 +151,10 @@ class Storage(object):
                     self.field_name_list.append(temp_tuple)
                     struct.pack_into('!10sii', self.dir_buf, beginIndex, field_name_padded.encode('utf-8'), field_type, field_length)
                     beginIndex = beginIndex + struct.calcsize('!10sii')
-                self.f_handle.seek(0)
-                self.f_handle.write(self.dir_buf)
-                self.f_handle.flush()
+                struct.pack_into('!i', self.dir_buf, FORMAT_VERSION_OFFSET, self.format_version)
+                struct.pack_into('!4s', self.dir_buf, FSM_MAGIC_OFFSET, FSM_MAGIC)  # empty free space map
+                self.buffer_manager.write_block(self.file_name, 0, self.dir_buf)
+                self.buffer_manager.flush_file(self.file_name)
             else:
                 if isinstance(tablename, bytes):
                     self.num_of_fields = int(input(
@@ -128,6 +162,9 @@ class Storage(object):
                 else:
                     self.num_of_fields = int(input(
                         "please input the number of feilds in table " + tablename + ":"))
+                if self.num_of_fields > MAX_FIELD_NUM:
+                    print(f"A table has at most {MAX_FIELD_NUM} fields")
+                    self.num_of_fields = 0
                 if self.num_of_fields > 0:
                     self.dir_buf = ctypes.create_string_buffer(BLOCK_SIZE)
                     self.block_id = 0
@@ -152,9 +189,10 @@ class Storage(object):
                             field_name = field_name.encode('utf-8')
                         struct.pack_into('!10sii', self.dir_buf, beginIndex, field_name, int(field_type),int(field_length))
                         beginIndex = beginIndex + struct.calcsize('!10sii')
-                    self.f_handle.seek(0)
-                    self.f_handle.write(self.dir_buf)
-                    self.f_handle.flush()
+                    struct.pack_into('!i', self.dir_buf, FORMAT_VERSION_OFFSET, self.format_version)
+                    struct.pack_into('!4s', self.dir_buf, FSM_MAGIC_OFFSET, FSM_MAGIC)  # empty free space map
+                    self.buffer_manager.write_block(self.file_name, 0, self.dir_buf)
+                    self.buffer_manager.flush_file(self.file_name)
         else:  # there is something in the file
             self.block_id, self.data_block_num, self.num_of_fields = struct.unpack_from('!iii', self.dir_buf, 0)
             if debug:
@@ -169,40 +207,269 @@ class Storage(object):
                 if debug:
                     print(f"the {i+1}th field information (field name, field type, field length) is "
                           f"('{field_name.decode('utf-8').strip()}', {field_type}, {field_length})")
+            # files written before the version existed have 0 there
+            self.format_version = max(FORMAT_V1, struct.unpack_from('!i', self.dir_buf, FORMAT_VERSION_OFFSET)[0])
+            if debug:
+                print('format version', self.format_version)
     
-        # print self.field_name_list
-        record_head_len = struct.calcsize('!ii10s')
-        record_content_len = sum(map(lambda x: x[2], self.field_name_list))
-        # print record_content_len
-        Flag = 1
-        while Flag <= self.data_block_num:
-            self.f_handle.seek(BLOCK_SIZE * Flag)
-            self.active_data_buf = self.f_handle.read(BLOCK_SIZE)
-            if len(self.active_data_buf) < 8:
-                Flag += 1
+        # only block 0 is read here, the data blocks are read lazily by scan()
+        self.codec = TableCodec(self.field_name_list, self.format_version)
+        # the per block min/max of every field, maintained from the start for a new table
+        self.zone_map = ZoneMap(tablename, self.field_name_list)
+        if created:
+            self.zone_map.clear()
+
+    # ------------------------------
+    # decode the record stored at offset of a data block
+    # input:
+    #       buf: the data block
+    #       offset: where the record head begins in the block
+    #       columns: optional list of field indexes to decode, all the fields by default
+    # output:
+    #       tuple of field values
+    # -------------------------------------
+    def _decode_record(self, buf, offset, columns=None):
+        return self.codec.decode(buf, offset, columns)
+
+    # ------------------------------
+    # map a list of field names or field indexes to field indexes
+    # input:
+    #       columns: list of field names (str/bytes) or field indexes (int)
+    # output:
+    #       list of field indexes
+    # -------------------------------------
+    def _resolve_columns(self, columns):
+        names = [x[0].decode('utf-8').strip() if isinstance(x[0], bytes) else str(x[0]).strip() for x in self.field_name_list]
+        indexes = []
+        for column in columns:
+            if isinstance(column, int):
+                indexes.append(column)
                 continue
-            self.block_id, self.Number_of_Records = struct.unpack_from('!ii', self.active_data_buf, 0)
-            if debug:
-                print('Block_ID=%s,   Contains %s data' % (self.block_id, self.Number_of_Records))
-            # There exists record
-            if self.Number_of_Records > 0:
-                for i in range(self.Number_of_Records):
-                    self.record_Position.append((Flag, i))
-                    offset = \
-                        struct.unpack_from('!i', self.active_data_buf,struct.calcsize('!ii') + i * struct.calcsize('!i'))[0]
-                    record = struct.unpack_from('!' + str(record_content_len) + 's', self.active_data_buf,offset + record_head_len)[0]
-                    tmp = 0
-                    tmpList = []
-                    for field in self.field_name_list:
-                        t = record[tmp:tmp + field[2]].strip()
-                        tmp = tmp + field[2]
-                        if field[1] == 2:
-                            t = int(t)
-                        if field[1] == 3:
-                            t = bool(t)
-                        tmpList.append(t)
-                    self.record_list.append(tuple(tmpList))
-            Flag += 1
+            if isinstance(column, bytes):
+                column = column.decode('utf-8')
+            column = column.strip()
+            if column not in names:
+                raise ValueError(f"Field '{column}' not found")
+            indexes.append(names.index(column))
+        return indexes
+
+    # ------------------------------
+    # scan the table block by block and yield the records lazily
+    # every block is decoded at once from a read only view of the buffer manager, memory mapped when possible
+    # without a predicate only the projected fields are decoded
+    # input:
+    #       columns: optional list of field names or indexes to project
+    #       predicate: optional function taking the full record tuple, a record is yielded only if it returns True
+    #       with_position: if True, yield ((block_id, slot), record) instead of record
+    #       zone_filter: optional list of (field_index, op, value) conditions, op in = < <= > >=,
+    #                    the blocks whose zone map shows they cannot match all of them are skipped;
+    #                    the records of the other blocks are not checked, use predicate for that
+    # output:
+    #       generator of record tuples
+    # -------------------------------------
+    def scan(self, columns=None, predicate=None, with_position=False, zone_filter=None):
+        column_indexes = tuple(self._resolve_columns(columns)) if columns is not None else None
+        decode_columns = column_indexes if predicate is None else None
+        if zone_filter:
+            self._ensure_zone_map()
+        for block_id in range(1, self.data_block_num + 1):
+            if zone_filter and not self.zone_map.may_match(block_id, zone_filter):
+                continue
+            buf = self.buffer_manager.view_block(self.file_name, block_id)
+            try:
+                records = self.codec.decode_block(buf, decode_columns)
+            finally:
+                buf.release()
+            if self.debug:
+                print('Block_ID=%s,   Contains %s data' % (block_id, len(records)))
+            for slot, record in records:
+                if predicate is not None:
+                    if not predicate(record):
+                        continue
+                    if column_indexes is not None:
+                        record = tuple(record[x] for x in column_indexes)
+                if with_position:
+                    yield (block_id, slot), record
+                else:
+                    yield record
+
+    # ------------------------------
+    # read the records at given record ids, as returned by an index
+    # consecutive ids in the same block are decoded from one view of the block
+    # input:
+    #       rids: iterable of (block_id, offset)
+    #       columns: optional list of field names or indexes to project
+    # output:
+    #       generator of record tuples, in the order of rids
+    # -------------------------------------
+    def fetch(self, rids, columns=None):
+        column_indexes = tuple(self._resolve_columns(columns)) if columns is not None else None
+        for block_id, block_rids in itertools.groupby(rids, key=lambda rid: rid[0]):
+            buf = self.buffer_manager.view_block(self.file_name, block_id)
+            try:
+                records = [self.codec.decode(buf, offset, column_indexes) for _, offset in block_rids]
+            finally:
+                buf.release()
+            for record in records:
+                yield record
+
+    # ------------------------------
+    # make sure the zone map of the table exists, tables written before it existed get it built once
+    # -------------------------------------
+    def _ensure_zone_map(self):
+        if not self.zone_map.available:
+            self.zone_map.build(self)
+
+    # ------------------------------
+    # the indexes of the table that are kept up to date on every write
+    # -------------------------------------
+    def _maintained_indexes(self):
+        return [index_obj for index_obj in index_db.open_table_indexes(self.tablename.strip(), self.field_name_list)
+                if index_obj.maintained]
+
+    # ------------------------------
+    # apply a change of the table to its indexes
+    # an entry removed and added again unchanged, as in an update of another field, is left alone
+    # input:
+    #       removed: list of (record, (block_id, offset)) no longer in the table
+    #       added: list of (record, (block_id, offset)) now in the table
+    # -------------------------------------
+    def _maintain_indexes(self, removed=(), added=()):
+        for index_obj in self._maintained_indexes():
+            removed_keys = [(index_obj.key_of(record), rid, index_obj.payload_of(record)) for record, rid in removed]
+            added_keys = [(index_obj.key_of(record), rid, index_obj.payload_of(record)) for record, rid in added]
+            unchanged = set(removed_keys) & set(added_keys)
+            for key, rid, payload in removed_keys:
+                if (key, rid, payload) not in unchanged:
+                    index_obj.delete(key, rid)
+            for key, rid, payload in added_keys:
+                if (key, rid, payload) not in unchanged:
+                    index_obj.insert(key, rid, payload)
+            index_obj.flush()
+
+    # ------------------------------
+    # the maximum number of record slots in one data block
+    # input:
+    #       record_len: the length of a record with its head, that of the table by default
+    # -------------------------------------
+    def _max_record_num(self, record_len=None):
+        if record_len is None:
+            record_len = self.codec.record_len
+        return int((BLOCK_SIZE - struct.calcsize('!i') - struct.calcsize('!ii')) / (record_len + struct.calcsize('!i')))
+
+    # ------------------------------
+    # the free slots of a data block: tombstoned slots first, then never used slots
+    # input:
+    #       data_buf: the data block
+    # -------------------------------------
+    def _free_slots(self, data_buf):
+        number_of_records = struct.unpack_from('!ii', data_buf, 0)[1]
+        free_slots = [slot for slot in range(number_of_records)
+                      if struct.unpack_from('!i', data_buf, struct.calcsize('!ii') + slot * struct.calcsize('!i'))[0] == TOMBSTONE]
+        free_slots.extend(range(number_of_records, self._max_record_num()))
+        return free_slots
+
+    def _free_slot_num(self, data_buf):
+        return len(self._free_slots(data_buf))
+
+    # ------------------------------
+    # where the free space map begins in block 0, right after the field entries
+    # -------------------------------------
+    @property
+    def fsm_offset(self):
+        return struct.calcsize('!iii') + len(self.field_name_list) * struct.calcsize('!10sii')
+
+    # ------------------------------
+    # number of data blocks tracked by the free space map
+    # -------------------------------------
+    @property
+    def fsm_capacity(self):
+        return FORMAT_VERSION_OFFSET - self.fsm_offset
+
+    # ------------------------------
+    # make sure the free space map in block 0 is valid
+    # files written before the map existed get it built once from the block headers
+    # -------------------------------------
+    def _ensure_fsm(self):
+        dir_buf = self.buffer_manager.pin(self.file_name, 0)
+        valid = bytes(dir_buf[FSM_MAGIC_OFFSET:FSM_MAGIC_OFFSET + 4]) == FSM_MAGIC
+        self.buffer_manager.unpin(self.file_name, 0)
+        if valid:
+            return
+        fsm = bytearray(self.fsm_capacity)
+        for block_id in range(1, min(self.data_block_num, self.fsm_capacity) + 1):
+            data_buf = self.buffer_manager.pin(self.file_name, block_id)
+            fsm[block_id - 1] = min(255, self._free_slot_num(data_buf))
+            self.buffer_manager.unpin(self.file_name, block_id)
+        dir_buf = self.buffer_manager.pin(self.file_name, 0)
+        dir_buf[self.fsm_offset:FORMAT_VERSION_OFFSET] = fsm
+        dir_buf[FSM_MAGIC_OFFSET:FSM_MAGIC_OFFSET + 4] = FSM_MAGIC
+        self.buffer_manager.unpin(self.file_name, 0, dirty=True)
+
+    # ------------------------------
+    # record the number of free slots of a data block in the free space map
+    # -------------------------------------
+    def _set_free_slots(self, block_id, free_slot_num):
+        if 1 <= block_id <= self.fsm_capacity:
+            dir_buf = self.buffer_manager.pin(self.file_name, 0)
+            dir_buf[self.fsm_offset + block_id - 1] = min(255, free_slot_num)
+            self.buffer_manager.unpin(self.file_name, 0, dirty=True)
+
+    # ------------------------------
+    # find a data block with a free slot
+    # the free space map is searched first, then the last block of the table
+    # output:
+    #       block_id, or None if a new block must be allocated
+    # -------------------------------------
+    def _find_free_block(self):
+        tracked = min(self.data_block_num, self.fsm_capacity)
+        dir_buf = self.buffer_manager.pin(self.file_name, 0)
+        fsm = dir_buf[self.fsm_offset:self.fsm_offset + tracked]
+        self.buffer_manager.unpin(self.file_name, 0)
+        first_free = len(fsm) - len(fsm.lstrip(b'\x00'))  # the first non zero entry
+        if first_free < tracked:
+            return first_free + 1
+        if self.data_block_num > self.fsm_capacity:
+            data_buf = self.buffer_manager.pin(self.file_name, self.data_block_num)
+            free_slot_num = self._free_slot_num(data_buf)
+            self.buffer_manager.unpin(self.file_name, self.data_block_num)
+            if free_slot_num > 0:
+                return self.data_block_num
+        return None
+
+    # ------------------------------
+    # all the records of the table, materialized on first access
+    # prefer scan() which keeps memory flat
+    # -------------------------------------
+    @property
+    def record_list(self):
+        if self._record_list is None:
+            self._load_records()
+        return self._record_list
+
+    @record_list.setter
+    def record_list(self, records):
+        self._record_list = records
+
+    # ------------------------------
+    # the (block_id, slot) of every record, materialized on first access
+    # -------------------------------------
+    @property
+    def record_Position(self):
+        if self._record_Position is None:
+            self._load_records()
+        return self._record_Position
+
+    @record_Position.setter
+    def record_Position(self, positions):
+        self._record_Position = positions
+
+    def _load_records(self):
+        self._record_list = []
+        self._record_Position = []
+        for position, record in self.scan(with_position=True):
+            self._record_Position.append(position)
+            self._record_list.append(record)
 
     # ------------------------------
     # return the record list of the table
@@ -228,29 +495,10 @@ class Storage(object):
         # Log before image (no record exists yet)
         log_db.LogManager.log_before_image(tx_id, getattr(self, "tablename", "unknown"), None, "INSERT")
         # Step 1: Validate and process insert_record
-        tmpRecord = []
-        for idx in range(len(self.field_name_list)):
-            insert_record[idx] = insert_record[idx].strip()
-            if self.field_name_list[idx][1] == 0 or self.field_name_list[idx][1] == 1:  # String types
-                if len(insert_record[idx]) > self.field_name_list[idx][2]:
-                    print(f"Field value too long for field {idx}")
-                    return False
-                tmpRecord.append(insert_record[idx])
-            elif self.field_name_list[idx][1] == 2:  # Integer type
-                try:
-                    tmpRecord.append(int(insert_record[idx]))
-                except:
-                    print(f"Invalid integer value for field {idx}")
-                    return False
-            elif self.field_name_list[idx][1] == 3:  # Boolean type
-                try:
-                    tmpRecord.append(bool(insert_record[idx]))
-                except:
-                    print(f"Invalid boolean value for field {idx}")
-                    return False
-            # Pad string fields if necessary
-            if len(insert_record[idx]) < self.field_name_list[idx][2]:
-                insert_record[idx] = ' ' * (self.field_name_list[idx][2] - len(insert_record[idx])) + insert_record[idx]
+        prepared = self._prepare_record(insert_record)
+        if prepared is None:
+            return False
+        tmpRecord, inputstr = prepared
         # Format record for logging
         formatted_record = []
         for i, field in enumerate(self.field_name_list):
@@ -259,57 +507,12 @@ class Storage(object):
             if isinstance(field_value, bytes):
                 field_value = field_value.decode('utf-8', 'ignore').strip()
             formatted_record.append(f"{field_name.strip()}: {field_value}")
-        # Step 2: Add tmpRecord to record_list and prepare for writing
-        inputstr = ''.join(insert_record)
-        self.record_list.append(tuple(tmpRecord))
-        # Step 3: Calculate record positioning
-        record_content_len = len(inputstr)
-        record_head_len = struct.calcsize('!ii10s')
-        record_len = record_head_len + record_content_len
-        MAX_RECORD_NUM = int((BLOCK_SIZE - struct.calcsize('!i') - struct.calcsize('!ii')) / (record_len + struct.calcsize('!i')))
-        # Step 4: Calculate new record position
-        if not len(self.record_Position):
-            self.data_block_num += 1
-            self.record_Position.append((1, 0))
-        else:
-            last_Position = self.record_Position[-1]
-            if last_Position[1] == MAX_RECORD_NUM - 1:
-                self.record_Position.append((last_Position[0] + 1, 0))
-                self.data_block_num += 1
-            else:
-                self.record_Position.append((last_Position[0], last_Position[1] + 1))
-        last_Position = self.record_Position[-1]
-        # Step 5: Write new record into file
+        # Step 2: Write new record into file
         try:
-            # Update data_block_num
-            self.f_handle.seek(0)
-            self.buf = ctypes.create_string_buffer(struct.calcsize('!ii'))
-            struct.pack_into('!ii', self.buf, 0, 0, self.data_block_num)
-            self.f_handle.write(self.buf)
-            self.f_handle.flush()
-            # Update data block head
-            self.f_handle.seek(BLOCK_SIZE * last_Position[0])
-            self.buf = ctypes.create_string_buffer(struct.calcsize('!ii'))
-            struct.pack_into('!ii', self.buf, 0, last_Position[0], last_Position[1] + 1)
-            self.f_handle.write(self.buf)
-            self.f_handle.flush()
-            # Update data offset
-            offset = struct.calcsize('!ii') + last_Position[1] * struct.calcsize('!i')
-            beginIndex = BLOCK_SIZE - (last_Position[1] + 1) * record_len
-            self.f_handle.seek(BLOCK_SIZE * last_Position[0] + offset)
-            self.buf = ctypes.create_string_buffer(struct.calcsize('!i'))
-            struct.pack_into('!i', self.buf, 0, beginIndex)
-            self.f_handle.write(self.buf)
-            self.f_handle.flush()
-            # Update data
-            record_schema_address = struct.calcsize('!iii')
-            update_time = datetime.datetime.now().strftime('%Y-%m-%d')
-            self.f_handle.seek(BLOCK_SIZE * last_Position[0] + beginIndex)
-            self.buf = ctypes.create_string_buffer(record_len)
-            struct.pack_into('!ii10s', self.buf, 0, record_schema_address, record_content_len, update_time.encode('utf-8'))
-            struct.pack_into('!' + str(record_content_len) + 's', self.buf, record_head_len, inputstr.encode('utf-8'))
-            self.f_handle.write(self.buf.raw)
-            self.f_handle.flush()
+            self._write_records([inputstr])
+            # a reused slot changes the scan order, the caches are rebuilt on next access
+            self._record_list = None
+            self._record_Position = None
             # Log after image (record inserted)
             record_info = f"Record inserted: [{', '.join(formatted_record)}]"
             log_db.LogManager.log_after_image(tx_id, getattr(self, "tablename", "unknown"), record_info, "INSERT")
@@ -320,13 +523,152 @@ class Storage(object):
             print(f"Error during record insertion: {e}")
             return False
 
+    # ------------------------------
+    # Insert many records into table as one logged transaction
+    # the rows are validated first, then packed into whole blocks that are written once
+    # Input:
+    #       rows: list of records, each one a list of field values
+    # Output:
+    #       bool: True if all the rows are inserted, False if any row is invalid (nothing is inserted)
+    # ----------------------------------------------
+    def insert_many(self, rows):
+        rows = [list(row) for row in rows]
+        if not rows:
+            return True
+        # Step 1: Validate every row before anything is written
+        prepared_rows = []
+        for row_num, row in enumerate(rows):
+            if len(row) != len(self.field_name_list):
+                print(f"Row {row_num + 1} has {len(row)} values, {len(self.field_name_list)} expected")
+                return False
+            prepared = self._prepare_record(row)
+            if prepared is None:
+                print(f"Row {row_num + 1} is invalid, no record inserted")
+                return False
+            prepared_rows.append(prepared)
+        # Step 2: One transaction for the whole batch
+        tx_id = str(uuid.uuid4())
+        log_db.LogManager.add_active_tx(tx_id, "INSERT")
+        log_db.LogManager.log_before_image(tx_id, getattr(self, "tablename", "unknown"), None, "INSERT")
+        try:
+            positions = self._write_records([inputstr for _, inputstr in prepared_rows])
+            self._record_list = None
+            self._record_Position = None
+            record_info = f"{len(prepared_rows)} records inserted in blocks {min(positions)[0]}-{max(positions)[0]}"
+            log_db.LogManager.log_after_image(tx_id, getattr(self, "tablename", "unknown"), record_info, "INSERT")
+            log_db.LogManager.add_commit_tx(tx_id, "INSERT")
+            return True
+        except Exception as e:
+            print(f"Error during batch insertion: {e}")
+            return False
+
+    # ------------------------------
+    # Validate the field values of a record and convert them to the stored format
+    # Input:
+    #       insert_record: list of field values, stripped in place
+    # Output:
+    #       (tmpRecord, inputstr): the typed values and the padded record content (bytes),
+    #       None if a value is invalid
+    # ----------------------------------------------
+    def _prepare_record(self, insert_record):
+        tmpRecord = []
+        for idx in range(len(self.field_name_list)):
+            insert_record[idx] = insert_record[idx].strip()
+            if self.field_name_list[idx][1] == 0 or self.field_name_list[idx][1] == 1:  # String types
+                if len(insert_record[idx]) > self.field_name_list[idx][2]:
+                    print(f"Field value too long for field {idx}")
+                    return None
+                tmpRecord.append(insert_record[idx])
+            elif self.field_name_list[idx][1] == 2:  # Integer type
+                try:
+                    tmpRecord.append(int(insert_record[idx]))
+                except:
+                    print(f"Invalid integer value for field {idx}")
+                    return None
+                if not self.codec.int_fits(tmpRecord[-1]):
+                    print(f"Integer value out of range for field {idx}")
+                    return None
+            elif self.field_name_list[idx][1] == 3:  # Boolean type
+                try:
+                    tmpRecord.append(to_bool(insert_record[idx]))
+                except:
+                    print(f"Invalid boolean value for field {idx}")
+                    return None
+        return tmpRecord, self.codec.encode(insert_record)
+
+    # ------------------------------
+    # Store records in free slots, found through the free space map
+    # tombstoned slots of a block are filled first, then its never used slots,
+    # then new blocks are appended. Every touched block is filled in the buffer pool,
+    # block 0 is updated in memory and the file is flushed once
+    # Input:
+    #       contents: list of record contents (bytes), all of the same length
+    #       maintain_indexes: whether to add the records to the indexes of the table
+    # Output:
+    #       list of (block_id, slot) where the records are stored
+    # ----------------------------------------------
+    def _write_records(self, contents, maintain_indexes=True):
+        # Calculate record positioning
+        record_content_len = len(contents[0])
+        record_head_len = struct.calcsize('!ii10s')
+        record_len = record_head_len + record_content_len
+        record_schema_address = struct.calcsize('!iii')
+        update_time = datetime.datetime.now().strftime('%Y-%m-%d').encode('utf-8')
+        self._ensure_fsm()
+        positions = []
+        index_entries = []
+        i = 0
+        while i < len(contents):
+            block_id = self._find_free_block()
+            if block_id is None:
+                block_id = self.data_block_num + 1
+            if block_id > self.data_block_num:
+                self.zone_map.reset(block_id)  # a new block
+            written = []
+            data_buf = self.buffer_manager.pin(self.file_name, block_id)
+            try:
+                number_of_records = struct.unpack_from('!ii', data_buf, 0)[1]
+                # reuse tombstoned slots first, then take never used slots
+                free_slots = self._free_slots(data_buf)
+                used = 0
+                for slot in free_slots:
+                    if i >= len(contents):
+                        break
+                    # data offset, record head and record content
+                    beginIndex = BLOCK_SIZE - (slot + 1) * record_len
+                    struct.pack_into('!i', data_buf, struct.calcsize('!ii') + slot * struct.calcsize('!i'), beginIndex)
+                    struct.pack_into('!ii10s', data_buf, beginIndex, record_schema_address, record_content_len, update_time)
+                    data_buf[beginIndex + record_head_len:beginIndex + record_len] = contents[i]
+                    written.append(self.codec.decode(data_buf, beginIndex))
+                    index_entries.append((written[-1], (block_id, beginIndex)))
+                    positions.append((block_id, slot))
+                    number_of_records = max(number_of_records, slot + 1)
+                    used += 1
+                    i += 1
+                # data block head
+                struct.pack_into('!ii', data_buf, 0, block_id, number_of_records)
+            finally:
+                self.buffer_manager.unpin(self.file_name, block_id, dirty=True)
+            self._set_free_slots(block_id, len(free_slots) - used)
+            self.zone_map.widen(block_id, written)
+            self.data_block_num = max(self.data_block_num, block_id)
+        # Update data_block_num
+        dir_buf = self.buffer_manager.pin(self.file_name, 0)
+        struct.pack_into('!ii', dir_buf, 0, 0, self.data_block_num)
+        self.buffer_manager.unpin(self.file_name, 0, dirty=True)
+        self.buffer_manager.flush_file(self.file_name)
+        self.zone_map.flush()
+        if maintain_indexes:
+            self._maintain_indexes(added=index_entries)
+        return positions
+
     # ------------------------------
     # show the data structure and its data
     # -------------------------------------
     def show_table_data(self):
         print('|'.join(map(lambda x: x[0].decode('utf-8').strip(), self.field_name_list)))  # show the structure
         # the following is to show the data of the table
-        for record in self.record_list:
+        for record in self.scan():
             display = [field.decode('utf-8').strip() if isinstance(field, bytes) else str(field) for field in record]
             print('|'.join(display))
 
@@ -338,13 +680,16 @@ class Storage(object):
     #       True or False
     # -----------------------------------
     def delete_table_data(self, tableName):
-        # step 1: identify whether the file is still open
+        # step 1: identify whether the file is still open, its cached blocks are discarded
         if self.open == True:
-            self.f_handle.close()
+            self.buffer_manager.drop_file(self.file_name)
             self.open = False
+        self.zone_map.drop()
+        index_db.drop_table_indexes(self.tablename.strip())
         # step 2: remove the file from os   
         tableName.strip()
         if os.path.exists(tableName + '.dat'.encode('utf-8')):
+            self.buffer_manager.drop_file(tableName + '.dat'.encode('utf-8'))
             os.remove(tableName + '.dat'.encode('utf-8'))
         return True
 
@@ -366,17 +711,18 @@ class Storage(object):
     # ------------------------------------------------
     def __del__(self):  # write the metahead information in head object to file
         if self.open == True:
-            self.f_handle.seek(0)
-            self.buf = ctypes.create_string_buffer(struct.calcsize('!ii'))
-            struct.pack_into('!ii', self.buf, 0, 0, self.data_block_num)
-            self.f_handle.write(self.buf)
-            self.f_handle.flush()
-            self.f_handle.close()
+            try:
+                dir_buf = self.buffer_manager.pin(self.file_name, 0)
+                struct.pack_into('!ii', dir_buf, 0, 0, self.data_block_num)
+                self.buffer_manager.unpin(self.file_name, 0, dirty=True)
+                self.buffer_manager.flush_file(self.file_name)
+            except Exception:
+                pass  # the interpreter may be shutting down
     
     # ----------------------------------------------
     # Author: Xinjian Zhang
     # modified by: Ruizhe Yang   419198812@qq.com
-    # to delete the first record matching a field value and rewrite the data file
+    # to delete the first record matching a field value, only its block is rewritten
     # input
     #       field_name: the field to match
     #       keyword: the value to match
@@ -393,18 +739,10 @@ class Storage(object):
         if field_index is None:
             print(f"Field '{field_name}' not found.")
             return False
-        new_records = []
-        deleted = False
-        for record in self.record_list:
-            value = record[field_index]
-            value_str = value.decode('utf-8').strip() if isinstance(value, bytes) else str(value).strip()
-            if not deleted and value_str == keyword:
-                deleted = True
-                continue
-            new_records.append(record)
-        if deleted:
-            self.record_list = new_records
-            self._rewrite_data_file()
+        position = self._find_position(field_index, keyword)
+        if position is not None:
+            self._delete_at(position)
+            self.buffer_manager.flush_file(self.file_name)
             print("Record deleted.")
             return True
         else:
@@ -414,6 +752,7 @@ class Storage(object):
     # ----------------------------------------------
     # Author: Xinjian Zhang
     # Update records by field criteria with enhanced logging
+    # the record is overwritten in its own block
     # Input:
     #       search_field: field name to search by
     #       search_value: value to search for
@@ -447,76 +786,164 @@ class Storage(object):
         if update_field_index is None:
             print(f"Update field '{update_field}' not found.")
             return False
-        updated = False
-        updated_records = []
-        for i, record in enumerate(self.record_list):
-            # Check if record matches search criteria
-            search_value_in_record = record[search_field_index]
-            search_value_str = search_value_in_record.decode('utf-8').strip() if isinstance(search_value_in_record, bytes) else str(search_value_in_record).strip()
-            if search_value_str == search_value:
-                # Log before image
-                old_record_formatted = []
-                for j, field in enumerate(self.field_name_list):
-                    field_name = field[0].decode('utf-8') if isinstance(field[0], bytes) else field[0]
-                    field_value = record[j]
-                    if isinstance(field_value, bytes):
-                        field_value = field_value.decode('utf-8', 'ignore').strip()
-                    old_record_formatted.append(f"{field_name.strip()}: {field_value}")
-                old_record_info = f"Record before update: [{', '.join(old_record_formatted)}]"
-                log_db.LogManager.log_before_image(tx_id, getattr(self, "tablename", "unknown"), old_record_info, "UPDATE")
-                # Update the record
-                record_list = list(record)
-                field_type = self.field_name_list[update_field_index][1]
-                if field_type == 0 or field_type == 1:  # String types
-                    field_length = self.field_name_list[update_field_index][2]
-                    padded_value = new_value.ljust(field_length)[:field_length]
-                    record_list[update_field_index] = padded_value.encode('utf-8') if isinstance(padded_value, str) else padded_value
-                elif field_type == 2:  # Integer type
-                    try:
-                        record_list[update_field_index] = int(new_value)
-                    except ValueError:
-                        print("Invalid integer value.")
-                        return False
-                elif field_type == 3:  # Boolean type
-                    record_list[update_field_index] = bool(new_value)
-                self.record_list[i] = tuple(record_list)
-                updated = True
-                # Log after image
-                new_record_formatted = []
-                for j, field in enumerate(self.field_name_list):
-                    field_name = field[0].decode('utf-8') if isinstance(field[0], bytes) else field[0]
-                    field_value = record_list[j]
-                    if isinstance(field_value, bytes):
-                        field_value = field_value.decode('utf-8', 'ignore').strip()
-                    new_record_formatted.append(f"{field_name.strip()}: {field_value}")
-                new_record_info = f"Record after update: [{', '.join(new_record_formatted)}]"
-                log_db.LogManager.log_after_image(tx_id, getattr(self, "tablename", "unknown"), new_record_info, "UPDATE")
-                updated_records.append((old_record_info, new_record_info))
-                break  # Only update first matching record
-        if updated:
-            self._rewrite_data_file()
-            # Commit transaction
-            log_db.LogManager.add_commit_tx(tx_id, "UPDATE")
-            print("Record updated successfully.")
-            return True
-        else:
+        # Only update first matching record
+        found = self._find_position(search_field_index, search_value, with_record=True)
+        if found is None:
             print("No matching record found.")
             return False
+        position, record = found
+        # Log before image
+        old_record_formatted = []
+        for j, field in enumerate(self.field_name_list):
+            field_name = field[0].decode('utf-8') if isinstance(field[0], bytes) else field[0]
+            field_value = record[j]
+            if isinstance(field_value, bytes):
+                field_value = field_value.decode('utf-8', 'ignore').strip()
+            old_record_formatted.append(f"{field_name.strip()}: {field_value}")
+        old_record_info = f"Record before update: [{', '.join(old_record_formatted)}]"
+        log_db.LogManager.log_before_image(tx_id, getattr(self, "tablename", "unknown"), old_record_info, "UPDATE")
+        # Update the record
+        record_list = list(record)
+        field_type = self.field_name_list[update_field_index][1]
+        if field_type == 0 or field_type == 1:  # String types
+            field_length = self.field_name_list[update_field_index][2]
+            padded_value = new_value.ljust(field_length)[:field_length]
+            record_list[update_field_index] = padded_value.encode('utf-8') if isinstance(padded_value, str) else padded_value
+        elif field_type == 2:  # Integer type
+            try:
+                record_list[update_field_index] = int(new_value)
+            except ValueError:
+                print("Invalid integer value.")
+                return False
+            if not self.codec.int_fits(record_list[update_field_index]):
+                print("Integer value out of range.")
+                return False
+        elif field_type == 3:  # Boolean type
+            record_list[update_field_index] = to_bool(new_value)
+        self._update_at(position, tuple(record_list))
+        self.buffer_manager.flush_file(self.file_name)
+        # Log after image
+        new_record_formatted = []
+        for j, field in enumerate(self.field_name_list):
+            field_name = field[0].decode('utf-8') if isinstance(field[0], bytes) else field[0]
+            field_value = record_list[j]
+            if isinstance(field_value, bytes):
+                field_value = field_value.decode('utf-8', 'ignore').strip()
+            new_record_formatted.append(f"{field_name.strip()}: {field_value}")
+        new_record_info = f"Record after update: [{', '.join(new_record_formatted)}]"
+        log_db.LogManager.log_after_image(tx_id, getattr(self, "tablename", "unknown"), new_record_info, "UPDATE")
+        # Commit transaction
+        log_db.LogManager.add_commit_tx(tx_id, "UPDATE")
+        print("Record updated successfully.")
+        return True
 
     # ------------------------------------------------
-    # Rewrite the entire data file after delete or update operations
-    # Author: Xinjian Zhang 278254081@qq.com
+    # find the position of the first record whose field equals value
     # Input:
-    #       None (uses self.record_list from memory)
+    #       field_index: index of the field to compare
+    #       value: the value to match, compared as a stripped string
+    #       with_record: whether to return the record too
     # Output:
-    #       None (rewrites entire .dat file with current records)
+    #       (block_id, slot), or ((block_id, slot), record) if with_record; None if not found
     # ------------------------------------------------
-    def _rewrite_data_file(self):
-        # Clear existing file content
-        self.f_handle.seek(0)
-        self.f_handle.truncate(0)
-        
-        # Write metadata block (block 0)
+    def _find_position(self, field_index, value, with_record=False):
+        def matches(record):
+            field_value = record[field_index]
+            field_value = field_value.decode('utf-8').strip() if isinstance(field_value, bytes) else str(field_value).strip()
+            return field_value == value
+        for position, record in self.scan(predicate=matches, with_position=True, zone_filter=[(field_index, '=', value)]):
+            return (position, record) if with_record else position
+        return None
+
+    # ------------------------------------------------
+    # convert a record tuple into the stored record content
+    # Input:
+    #       record: tuple of field values
+    # Output:
+    #       bytes, each field padded or truncated to its length
+    # ------------------------------------------------
+    def _encode_record(self, record):
+        return self.codec.encode(record)
+
+    # ------------------------------------------------
+    # delete the record at position by turning its slot into a tombstone
+    # only the block holding the record is modified, the caller flushes the file
+    # Input:
+    #       position: (block_id, slot) of the record
+    # ------------------------------------------------
+    def _delete_at(self, position):
+        block_id, slot = position
+        self._ensure_fsm()
+        data_buf = self.buffer_manager.pin(self.file_name, block_id)
+        try:
+            offset = struct.unpack_from('!i', data_buf, struct.calcsize('!ii') + slot * struct.calcsize('!i'))[0]
+            record = self.codec.decode(data_buf, offset)
+            struct.pack_into('!i', data_buf, struct.calcsize('!ii') + slot * struct.calcsize('!i'), TOMBSTONE)
+            free_slot_num = self._free_slot_num(data_buf)
+        finally:
+            self.buffer_manager.unpin(self.file_name, block_id, dirty=True)
+        self._set_free_slots(block_id, free_slot_num)  # the slot can be reused by the next insert
+        self._maintain_indexes(removed=[(record, (block_id, offset))])
+        self._record_list = None
+        self._record_Position = None
+
+    # ------------------------------------------------
+    # overwrite the record at position
+    # the record is rewritten in place when its length is unchanged,
+    # otherwise it is deleted and appended at the end of the table
+    # Input:
+    #       position: (block_id, slot) of the record
+    #       record: tuple of the new field values
+    # Output:
+    #       the (block_id, slot) where the record is stored now
+    # ------------------------------------------------
+    def _update_at(self, position, record):
+        block_id, slot = position
+        inputstr = self._encode_record(record)
+        record_head_len = struct.calcsize('!ii10s')
+        data_buf = self.buffer_manager.pin(self.file_name, block_id)
+        try:
+            offset = struct.unpack_from('!i', data_buf, struct.calcsize('!ii') + slot * struct.calcsize('!i'))[0]
+            record_content_len = struct.unpack_from('!i', data_buf, offset + struct.calcsize('!i'))[0]
+            in_place = record_content_len == len(inputstr)
+            if in_place:
+                old_record = self.codec.decode(data_buf, offset)
+                update_time = datetime.datetime.now().strftime('%Y-%m-%d')
+                struct.pack_into('!10s', data_buf, offset + struct.calcsize('!ii'), update_time.encode('utf-8'))
+                data_buf[offset + record_head_len:offset + record_head_len + len(inputstr)] = inputstr
+                new_record = self.codec.decode(data_buf, offset)
+        finally:
+            self.buffer_manager.unpin(self.file_name, block_id, dirty=True)
+        self._record_list = None
+        self._record_Position = None
+        if in_place:
+            self.zone_map.widen(block_id, [new_record])
+            self.zone_map.flush()
+            self._maintain_indexes(removed=[(old_record, (block_id, offset))], added=[(new_record, (block_id, offset))])
+            return position
+        self._delete_at(position)
+        return self._write_records([inputstr])[0]
+
+    # ------------------------------------------------
+    # remove all the records of the table, only block 0 is kept
+    # Input:
+    #       None
+    # Output:
+    #       None
+    # ------------------------------------------------
+    def delete_all_records(self):
+        self.record_list = []
+        self._rewrite_data_file()
+
+    # ------------------------------------------------
+    # build block 0 of an empty table file
+    # Input:
+    #       format_version: the format version of the file
+    # Output:
+    #       buffer of BLOCK_SIZE holding the header, the field definitions,
+    #       the format version and an empty free space map
+    # ------------------------------------------------
+    def _meta_block(self, format_version):
         dir_buf = ctypes.create_string_buffer(BLOCK_SIZE)
         beginIndex = 0
         
@@ -531,92 +958,230 @@ class Storage(object):
                 field_name = field_name.encode('utf-8')
             struct.pack_into('!10sii', dir_buf, beginIndex, field_name, field[1], field[2])
             beginIndex += struct.calcsize('!10sii')
+        struct.pack_into('!i', dir_buf, FORMAT_VERSION_OFFSET, format_version)
+        struct.pack_into('!4s', dir_buf, FSM_MAGIC_OFFSET, FSM_MAGIC)  # empty free space map
+        return dir_buf
+
+    # ------------------------------------------------
+    # Rewrite the entire data file
+    # Author: Xinjian Zhang 278254081@qq.com
+    # Input:
+    #       None (uses self.record_list from memory)
+    # Output:
+    #       None (rewrites entire .dat file with current records, packed into as many blocks as needed,
+    #       the indexes of the table are built again)
+    # ------------------------------------------------
+    def _rewrite_data_file(self):
+        records = self.record_list
+        # Clear existing file content
+        self.buffer_manager.truncate_file(self.file_name, 0)
         
         # Write metadata block to file
-        self.f_handle.seek(0)
-        self.f_handle.write(dir_buf)
-        self.f_handle.flush()
+        self.buffer_manager.write_block(self.file_name, 0, self._meta_block(self.format_version))
+        self.data_block_num = 0
+        self.zone_map.clear()  # every block is written again
         
         # Write data records if any exist
-        if self.record_list:
-            data_block_num = 1
-            num_records = len(self.record_list)
-            record_head_len = struct.calcsize('!ii10s')
-            record_content_len = sum(map(lambda x: x[2], self.field_name_list))
-            record_len = record_head_len + record_content_len
-            
-            # Create data block buffer
-            data_buf = ctypes.create_string_buffer(BLOCK_SIZE)
-            
-            # Write data block header: block_id, number_of_records
-            struct.pack_into('!ii', data_buf, 0, data_block_num, num_records)
-            
-            # Write each record
-            for i, record in enumerate(self.record_list):
-                # Write record offset pointer
-                offset = struct.calcsize('!ii') + i * struct.calcsize('!i')
-                beginIndex = BLOCK_SIZE - (i + 1) * record_len
-                struct.pack_into('!i', data_buf, offset, beginIndex)
-                
-                # Write record header: schema_address, content_length, timestamp
-                record_schema_address = struct.calcsize('!iii')
-                update_time = datetime.datetime.now().strftime('%Y-%m-%d')
-                struct.pack_into('!ii10s', data_buf, beginIndex, 
-                               record_schema_address, record_content_len, 
-                               update_time.encode('utf-8'))
-                
-                # Write record content
-                inputstr = b''
-                for idx, field in enumerate(self.field_name_list):
-                    val = record[idx]
-                    
-                    # Convert value to bytes
-                    if isinstance(val, int):
-                        val = str(val).encode('utf-8')
-                    elif isinstance(val, str):
-                        val = val.encode('utf-8')
-                    elif isinstance(val, bytes):
-                        val = val
-                    else:
-                        val = str(val).encode('utf-8')
-                    
-                    # Pad or truncate to field length
-                    val = b' ' * (field[2] - len(val)) + val if len(val) < field[2] else val[:field[2]]
-                    inputstr += val
-                
-                # Pack record content into buffer
-                struct.pack_into('!' + str(record_content_len) + 's', 
-                               data_buf, beginIndex + record_head_len, inputstr)
-            
-            # Write data block to file
-            self.f_handle.seek(BLOCK_SIZE)
-            self.f_handle.write(data_buf)
-            self.f_handle.flush()
-            
-            # Update header with correct data_block_num
-            self.f_handle.seek(0)
-            self.buf = ctypes.create_string_buffer(struct.calcsize('!ii'))
-            struct.pack_into('!ii', self.buf, 0, 0, 1)
-            self.f_handle.write(self.buf)
-            self.f_handle.flush()
-        else:
-            # No records - just write empty metadata
-            self.f_handle.seek(0)
-            dir_buf = ctypes.create_string_buffer(BLOCK_SIZE)
-            beginIndex = 0
-            struct.pack_into('!iii', dir_buf, beginIndex, 0, 0, len(self.field_name_list))
-            beginIndex += struct.calcsize('!iii')
-            
-            for field in self.field_name_list:
-                field_name = field[0]
-                if isinstance(field_name, str):
-                    field_name = field_name.encode('utf-8')
-                struct.pack_into('!10sii', dir_buf, beginIndex, field_name, field[1], field[2])
-                beginIndex += struct.calcsize('!10sii')
-            
-            self.f_handle.write(dir_buf)
-            self.f_handle.flush()
+        if records:
+            positions = self._write_records([self._encode_record(record) for record in records], maintain_indexes=False)
+            self._record_list = list(records)
+            self._record_Position = positions
+        self.buffer_manager.flush_file(self.file_name)
+        # a bulk build is cheaper than adding the records one by one
+        for index_obj in self._maintained_indexes():
+            index_obj.rebuild(self)
     
+    # ------------------------------------------------
+    # compact the table: live records of the last blocks are moved into the free
+    # slots of the first blocks, the emptied blocks are cut off the file
+    # the work is done in steps of at most step_blocks emptied blocks, after every step
+    # block 0 and the moved blocks are flushed, so the table stays readable
+    # Input:
+    #       step_blocks: the number of blocks emptied per step
+    #       on_moves: called after every step with {(old_block, old_offset): (new_block, new_offset)},
+    #                 the maintained indexes of the table are updated before it is called
+    # Output:
+    #       dict with moved records, blocks before/after, bytes reclaimed and seconds taken
+    # ------------------------------------------------
+    def vacuum(self, step_blocks=VACUUM_STEP_BLOCKS, on_moves=None):
+        start_time = time.time()
+        self._ensure_fsm()
+        self.buffer_manager.flush_file(self.file_name)
+        file_blocks_before = self.buffer_manager.block_num(self.file_name)
+        data_blocks_before = self.data_block_num
+        moved = 0
+        done = False
+        while not done:
+            moves, done = self._vacuum_step(step_blocks)
+            moved += len(moves)
+            if moves and on_moves is not None:
+                on_moves(moves)
+        # cut the emptied blocks off the file
+        self.buffer_manager.truncate_file(self.file_name, self.data_block_num + 1)
+        if self.zone_map.available:
+            self.zone_map.build(self)  # tighten the ranges widened by the moves
+        self._record_list = None
+        self._record_Position = None
+        return {
+            'moved': moved,
+            'blocks_before': data_blocks_before,
+            'blocks_after': self.data_block_num,
+            'bytes_reclaimed': (file_blocks_before - self.data_block_num - 1) * BLOCK_SIZE,
+            'seconds': time.time() - start_time,
+        }
+
+    # ------------------------------------------------
+    # one step of vacuum, empties at most step_blocks blocks from the end of the table
+    # Output:
+    #       (moves, done), done is True when no record can be moved forward any more
+    # ------------------------------------------------
+    def _vacuum_step(self, step_blocks):
+        record_len = self.codec.record_len
+        slot_size = struct.calcsize('!i')
+        moves = {}
+        index_removed, index_added = [], []
+        done = False
+        emptied = 0
+        while emptied < step_blocks:
+            src_block = self.data_block_num
+            if src_block == 0:
+                done = True
+                break
+            src_buf = self.buffer_manager.pin(self.file_name, src_block)
+            try:
+                number_of_records = struct.unpack_from('!ii', src_buf, 0)[1]
+                live_slots = [slot for slot in range(number_of_records)
+                              if struct.unpack_from('!i', src_buf, struct.calcsize('!ii') + slot * slot_size)[0] != TOMBSTONE]
+                while live_slots:
+                    dst_block = self._find_free_block()
+                    if dst_block is None or dst_block >= src_block:
+                        break
+                    moved = []
+                    dst_buf = self.buffer_manager.pin(self.file_name, dst_block)
+                    try:
+                        dst_records = struct.unpack_from('!ii', dst_buf, 0)[1]
+                        free_slots = self._free_slots(dst_buf)
+                        for dst_slot in free_slots[:len(live_slots)]:
+                            src_slot = live_slots.pop()
+                            src_offset = struct.unpack_from('!i', src_buf, struct.calcsize('!ii') + src_slot * slot_size)[0]
+                            dst_offset = BLOCK_SIZE - (dst_slot + 1) * record_len
+                            dst_buf[dst_offset:dst_offset + record_len] = src_buf[src_offset:src_offset + record_len]
+                            struct.pack_into('!i', dst_buf, struct.calcsize('!ii') + dst_slot * slot_size, dst_offset)
+                            struct.pack_into('!i', src_buf, struct.calcsize('!ii') + src_slot * slot_size, TOMBSTONE)
+                            moves[(src_block, src_offset)] = (dst_block, dst_offset)
+                            moved.append(self.codec.decode(dst_buf, dst_offset))
+                            index_removed.append((moved[-1], (src_block, src_offset)))
+                            index_added.append((moved[-1], (dst_block, dst_offset)))
+                            dst_records = max(dst_records, dst_slot + 1)
+                        struct.pack_into('!ii', dst_buf, 0, dst_block, dst_records)
+                        free_slot_num = self._free_slot_num(dst_buf)
+                    finally:
+                        self.buffer_manager.unpin(self.file_name, dst_block, dirty=True)
+                    self._set_free_slots(dst_block, free_slot_num)
+                    self.zone_map.widen(dst_block, moved)
+                if live_slots:
+                    # no free slot before this block, the table is compact
+                    done = True
+                    break
+                struct.pack_into('!ii', src_buf, 0, src_block, 0)
+            finally:
+                self.buffer_manager.unpin(self.file_name, src_block, dirty=True)
+            self._set_free_slots(src_block, 0)
+            self.zone_map.reset(src_block)
+            self.data_block_num -= 1
+            emptied += 1
+        # data_block_num of block 0
+        dir_buf = self.buffer_manager.pin(self.file_name, 0)
+        struct.pack_into('!ii', dir_buf, 0, 0, self.data_block_num)
+        self.buffer_manager.unpin(self.file_name, 0, dirty=True)
+        self.buffer_manager.flush_file(self.file_name)
+        self.zone_map.flush()
+        self._maintain_indexes(index_removed, index_added)
+        return moves, done
+
+    # ------------------------------------------------
+    # upgrade the data file to the current format version
+    # the old blocks are read one at a time and their live records appended, in the
+    # new format, to the blocks of a temporary file, which then replaces the data file,
+    # so the memory used does not grow with the table and a failure leaves the old file
+    # intact. The object is only switched to the new format once the file is replaced
+    # Input:
+    #       None
+    # Output:
+    #       dict {(old_block, old_offset): (new_block, new_offset)} of every record,
+    #       None if the file already has the current format
+    # ------------------------------------------------
+    def upgrade_format(self):
+        if self.format_version >= CURRENT_FORMAT:
+            return None
+        codec = TableCodec(self.field_name_list, CURRENT_FORMAT)
+        record_head_len = struct.calcsize('!ii10s')
+        slot_size = struct.calcsize('!i')
+        max_record_num = self._max_record_num(codec.record_len)
+        tmp_name = self.file_name + '.tmp'
+        self.buffer_manager.drop_file(tmp_name)
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        dir_buf = self._meta_block(CURRENT_FORMAT)
+        moves = {}
+        new_block, new_slot, data_buf = 0, 0, None
+        # write a filled block of the temporary file and its free slots
+        def write_block():
+            struct.pack_into('!ii', data_buf, 0, new_block, new_slot)
+            self.buffer_manager.write_block(tmp_name, new_block, data_buf)
+            if new_block <= self.fsm_capacity:
+                dir_buf[self.fsm_offset + new_block - 1] = min(255, max_record_num - new_slot)
+        try:
+            for block_id in range(1, self.data_block_num + 1):
+                buf = self.buffer_manager.view_block(self.file_name, block_id)
+                try:
+                    number_of_records = struct.unpack_from('!ii', buf, 0)[1]
+                    for slot in range(number_of_records):
+                        offset = struct.unpack_from('!i', buf, struct.calcsize('!ii') + slot * slot_size)[0]
+                        if offset == TOMBSTONE:
+                            continue
+                        if data_buf is None or new_slot == max_record_num:
+                            if data_buf is not None:
+                                write_block()
+                            new_block, new_slot, data_buf = new_block + 1, 0, bytearray(BLOCK_SIZE)
+                        # the record keeps its schema address and update time
+                        record_schema_address, _, update_time = struct.unpack_from('!ii10s', buf, offset)
+                        new_offset = BLOCK_SIZE - (new_slot + 1) * codec.record_len
+                        struct.pack_into('!i', data_buf, struct.calcsize('!ii') + new_slot * slot_size, new_offset)
+                        struct.pack_into('!ii10s', data_buf, new_offset, record_schema_address, codec.content_len, update_time)
+                        data_buf[new_offset + record_head_len:new_offset + codec.record_len] = \
+                            codec.encode(self.codec.decode(buf, offset))
+                        moves[(block_id, offset)] = (new_block, new_offset)
+                        new_slot += 1
+                finally:
+                    buf.release()
+            if data_buf is not None:
+                write_block()
+            struct.pack_into('!ii', dir_buf, 0, 0, new_block)
+            self.buffer_manager.write_block(tmp_name, 0, dir_buf)
+            self.buffer_manager.flush_file(tmp_name)
+            self.buffer_manager.drop_file(tmp_name)
+            self.buffer_manager.flush_file(self.file_name)
+            self.buffer_manager.drop_file(self.file_name)
+            os.replace(tmp_name, self.file_name)
+        except Exception:
+            self.buffer_manager.drop_file(tmp_name)
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+        # the data file has the new format from here on
+        self.format_version = CURRENT_FORMAT
+        self.codec = codec
+        self.data_block_num = new_block
+        self.dir_buf = self.buffer_manager.read_block(self.file_name, 0)
+        self._record_list = None
+        self._record_Position = None
+        if self.zone_map.available:
+            self.zone_map.build(self)  # the records have moved to other blocks
+        for index_obj in self._maintained_indexes():
+            index_obj.rebuild(self)
+        return moves
+
     # ------------------------------------------------
     # Sequential scan to find records by field value
     # Author: Xinjian Zhang 278254081@qq.com
@@ -640,18 +1205,16 @@ class Storage(object):
         if field_index is None:
             return results
         
-        # Sequential scan through all records in memory
-        for record in self.record_list:
+        # Sequential scan through the data blocks
+        search_value = search_value.strip()
+        def matches(record):
             field_value = record[field_index]
-            
             # Convert field value to string for comparison
             if isinstance(field_value, bytes):
                 field_value_str = field_value.decode('utf-8', 'ignore').strip()
             else:
                 field_value_str = str(field_value).strip()
-            
             # Check for exact match
-            if field_value_str == search_value.strip():
-                results.append(record)
-        
+            return field_value_str == search_value
+        results.extend(self.scan(predicate=matches, zone_filter=[(field_index, '=', search_value)]))
         return results
\ No newline at end of file
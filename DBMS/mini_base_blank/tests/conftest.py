@@ -0,0 +1,86 @@
+# ------------------------------------------------
+# conftest.py
+# ------------------------------------------------
+# the modules of the DBMS import each other by name and keep their files
+# relative to the current directory, so every test runs in its own directory
+# ------------------------------------------------
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ------------------------------------------------
+# an empty working directory holding the schema file and the log directory,
+# as main_db expects them
+# ------------------------------------------------
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('DBMS/mini_base_blank')
+    os.makedirs('logs')
+    open('DBMS/mini_base_blank/all.sch', 'wb').close()
+    yield tmp_path
+    import buffer_db
+    buffer_db.global_buffer_manager.flush_all()
+
+# ------------------------------------------------
+# create a table file with its fields and rows
+# Input:
+#       name: table name
+#       fields: list of (field_name, type_code, length)
+#       rows: list of rows, every value given as text as INSERT does
+# Output:
+#       the Storage object of the table
+# ------------------------------------------------
+@pytest.fixture
+def make_table(workdir):
+    import storage_db
+
+    def make(name, fields, rows=()):
+        storage_obj = storage_db.Storage(name.encode('utf-8'), [
+            {'name': field_name, 'type_code': type_code, 'length': length}
+            for field_name, type_code, length in fields])
+        if rows:
+            storage_obj.insert_many([[str(value) for value in row] for row in rows])
+        return storage_obj
+    return make
+
+# ------------------------------------------------
+# run SQL statements the way option 7 of the menu does
+# Output:
+#       function(statement) -> the result rows of a SELECT, as lists of strings,
+#       the printed lines for the other statements
+# ------------------------------------------------
+@pytest.fixture
+def sql(workdir):
+    pytest.importorskip('ply')
+    import common_db
+    import lex_db
+    import parser_db
+    import query_plan_db
+    import schema_db
+    schema_obj = schema_db.Schema()
+
+    def run(statement):
+        lex_db.set_lex_handle()
+        parser_db.set_parser_handle()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            common_db.global_lexer.input(statement)
+            common_db.global_syn_tree = common_db.global_parser.parse(lexer=common_db.global_lexer)
+            query_plan_db.execute_sql_statement(schema_obj)
+        lines = output.getvalue().splitlines()
+        if 'LOGICAL TREE:' not in lines:
+            return lines
+        # the rows follow the header of the field names, between separator lines
+        lines = lines[:lines.index('LOGICAL TREE:')]
+        separators = [i for i, line in enumerate(lines) if line.startswith('---')]
+        if len(separators) < 2:
+            return []
+        return [line.split(' | ') for line in lines[separators[1] + 1:] if line and not line.startswith('---')]
+    return run
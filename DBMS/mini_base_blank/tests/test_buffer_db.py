@@ -0,0 +1,66 @@
+# ------------------------------------------------
+# test_buffer_db.py
+# ------------------------------------------------
+# buffer pool: eviction, write back and the coherence of memory mapped reads
+# ------------------------------------------------
+
+from buffer_db import BufferManager
+from common_db import BLOCK_SIZE
+
+
+def make_file(path, block_num):
+    with open(path, 'wb') as f_handle:
+        f_handle.write(bytes(BLOCK_SIZE * block_num))
+
+
+def test_clock_evicts_unpinned_frames(workdir):
+    make_file('a.dat', 4)
+    buf = BufferManager(frame_num=2)
+    buf.pin('a.dat', 0)
+    buf.read_block('a.dat', 1)
+    buf.read_block('a.dat', 2)
+    buf.read_block('a.dat', 3)
+    assert buf.get_statistics()['frames_used'] == 2
+    assert buf.evictions == 2
+    assert (buf._path('a.dat'), 0) in buf.page_table  # pinned, never evicted
+
+
+def test_evicted_dirty_block_is_written_back(workdir):
+    make_file('a.dat', 3)
+    buf = BufferManager(frame_num=1)
+    buf.write_block('a.dat', 1, b'NEW!')
+    buf.read_block('a.dat', 2)
+    with open('a.dat', 'rb') as f_handle:
+        f_handle.seek(BLOCK_SIZE)
+        assert f_handle.read(4) == b'NEW!'
+
+
+def test_view_after_evicting_dirty_block(workdir):
+    make_file('a.dat', 4)
+    make_file('b.dat', 2)
+    buf = BufferManager(frame_num=2)
+    assert bytes(buf.view_block('a.dat', 1)[:4]) == bytes(4)  # maps the file
+    buf.write_block('a.dat', 1, b'NEW!')
+    buf.pin('b.dat', 0)
+    buf.pin('b.dat', 1)  # evicts block 1 of a.dat, nothing else touches its handle
+    assert (buf._path('a.dat'), 1) not in buf.page_table
+    assert bytes(buf.view_block('a.dat', 1)[:4]) == b'NEW!'
+    assert buf.mmap_reads == 2
+
+
+def test_view_of_cached_dirty_block(workdir):
+    make_file('a.dat', 2)
+    buf = BufferManager(frame_num=2)
+    buf.view_block('a.dat', 1)
+    buf.write_block('a.dat', 1, b'NEW!')
+    assert bytes(buf.view_block('a.dat', 1)[:4]) == b'NEW!'
+
+
+def test_view_of_block_beyond_the_file(workdir):
+    make_file('a.dat', 1)
+    buf = BufferManager(frame_num=2)
+    buf.write_block('a.dat', 3, b'END')
+    assert bytes(buf.view_block('a.dat', 3)[:3]) == b'END'
+    assert buf.block_num('a.dat') == 4
+    buf.flush_file('a.dat')
+    assert bytes(buf.view_block('a.dat', 0)[:3]) == bytes(3)
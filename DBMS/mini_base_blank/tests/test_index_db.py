@@ -0,0 +1,134 @@
+# ------------------------------------------------
+# test_index_db.py
+# ------------------------------------------------
+# indexes: extendible hash splits, composite keys and INCLUDE fields
+# ------------------------------------------------
+
+import index_db
+import query_plan_db
+
+
+def check_directory(index_obj):
+    # every bucket holds only the hashes of its directory slots, and is
+    # referenced by 2^(global depth - local depth) slots
+    directory = index_obj._read_directory()
+    global_depth = index_obj.num_of_levels
+    assert len(directory) == 1 << global_depth
+    for slot, first_page in enumerate(directory):
+        local_depth, entries, pages = index_obj._read_chain(first_page)
+        assert local_depth <= global_depth
+        mask = (1 << local_depth) - 1
+        assert all(h & mask == slot & mask for h, key, block_id, offset in entries)
+        assert directory.count(first_page) == 1 << (global_depth - local_depth)
+
+
+def test_extendible_hash_splits(make_table):
+    make_table('s', [('id', 2, 10), ('name', 0, 12)])
+    index_obj = index_db.Index('s', index_db.HASH_INDEX, debug=False)
+    assert index_obj.create_index('id')
+    start_depth = index_obj.num_of_levels
+    rids = {}
+    for value in range(4000):
+        rid = (1 + value // 100, value % 100)
+        assert index_obj.insert(index_obj.key_from_values([value]), rid)
+        rids[value] = [rid]
+    # the keys of one value outgrow a page and are chained on overflow pages
+    for i in range(600):
+        rid = (100 + i // 100, i % 100)
+        index_obj.insert(index_obj.key_from_values([7]), rid)
+        rids[7].append(rid)
+    index_obj.flush()
+    assert index_obj.num_of_levels > start_depth
+    check_directory(index_obj)
+    assert len(index_obj._read_chain(index_obj._bucket_of(index_db.hash_of(index_obj.key_from_values([7]))))[2]) > 1
+
+    for value in range(0, 4000, 2):
+        assert index_obj.delete(index_obj.key_from_values([value]), rids.pop(value)[0])
+    index_obj.flush()
+    check_directory(index_obj)
+
+    reopened = index_db.Index('s', index_db.HASH_INDEX, debug=False)
+    for value in range(-10, 4010):
+        assert reopened.lookup(reopened.key_from_values([value])) == sorted(rids.get(value, []))
+
+
+def test_composite_keys_sort_like_their_values():
+    values = [(a, s) for a in (-300, -1, 0, 1, 2 ** 40) for s in ('', 'a', 'a\x00', 'ab', 'b', 'a b')]
+    field_types = (2, 0)
+    keys = [index_db.make_composite_key([a, s], field_types) for a, s in values]
+    assert sorted(keys) == [index_db.make_composite_key([a, s], field_types) for a, s in sorted(values)]
+    # a key prefix covers the keys with the same leading values and no other
+    prefix = index_db.key_part(1, 2)
+    assert [key for key in keys if key.startswith(prefix)] == \
+        [index_db.make_composite_key([a, s], field_types) for a, s in values if a == 1]
+
+
+def test_composite_index_access(make_table):
+    rows = [(i % 7, 'n%02d' % (i % 13), i) for i in range(400)]
+    table = make_table('s', [('a', 2, 10), ('name', 0, 12), ('id', 2, 10)], rows)
+    assert index_db.Index('s', index_db.BTREE_INDEX, debug=False, index_name='s_a_name').create_index(['a', 'name'])
+    assert index_db.Index('s', index_db.HASH_INDEX, debug=False, index_name='s_a_id').create_index(['a', 'id'])
+    table.insert_many([['3', 'n05', '1000'], ['3', 'n99', '1001']])
+    rows += [(3, 'n05', 1000), (3, 'n99', 1001)]
+
+    def ids(records):
+        return sorted(record[2] for record in records)
+
+    scan, path = query_plan_db.access_table(table, [(0, 2, '=', 3), (1, 0, '>=', 'n05'), (1, 0, '<', 'n09')])
+    assert path == 'INDEX RANGE SCAN s.s_a_name.ind (a = 3, name)'
+    assert ids(scan) == sorted(i for a, name, i in rows if a == 3 and 'n05' <= name < 'n09')
+    scan, path = query_plan_db.access_table(table, [(0, 2, '=', 3), (1, 0, '=', 'n05')])
+    assert path == 'INDEX LOOKUP s.s_a_name.ind (a = 3, name = n05)'
+    assert ids(scan) == sorted(i for a, name, i in rows if a == 3 and name == 'n05')
+    scan, path = query_plan_db.access_table(table, [(0, 2, '=', 3), (2, 2, '=', 1000)])
+    assert path == 'INDEX LOOKUP s.s_a_id.hash (a = 3, id = 1000)'
+    assert ids(scan) == [1000]
+    # the hash index needs all its fields, the B-tree uses its leading field
+    scan, path = query_plan_db.access_table(table, [(0, 2, '=', 4)])
+    assert path == 'INDEX RANGE SCAN s.s_a_name.ind (a = 4)'
+    assert ids(scan) == sorted(i for a, name, i in rows if a == 4)
+
+
+def test_included_fields_answer_from_the_index(make_table):
+    rows = [(i, 'n%03d' % i, i % 3 == 0) for i in range(300)]
+    table = make_table('s', [('id', 2, 10), ('name', 0, 12), ('ok', 3, 5)], rows)
+    index_obj = index_db.Index('s', index_db.BTREE_INDEX, debug=False)
+    assert index_obj.create_index('id', include=('name',))
+    assert index_obj.covered_fields == {0, 1}
+    # INCLUDE is for B-trees only
+    assert not index_db.Index('s', index_db.HASH_INDEX, debug=False).create_index('id', include=('name',))
+
+    # the records of the table and of the index give the strings as bytes
+    def values(records, needed):
+        return sorted(tuple(record[i] for i in needed) for record in records)
+    rows = [(i, name.encode('utf-8'), ok) for i, name, ok in rows]
+
+    scan, path = query_plan_db.access_table(table, [(0, 2, '=', 42)], needed=[0, 1])
+    assert path.startswith('INDEX ONLY LOOKUP ')
+    assert values(scan, [0, 1]) == [(42, b'n042')]
+    conditions = [(0, 2, '>=', 100), (0, 2, '<', 150)]
+    scan, path = query_plan_db.access_table(table, conditions, needed=[1])
+    assert path.startswith('INDEX ONLY SCAN ')
+    assert values(scan, [0, 1]) == [(i, name) for i, name, ok in rows if 100 <= i < 150]
+    # a field outside the index needs the records
+    scan, path = query_plan_db.access_table(table, conditions, needed=[0, 2])
+    assert path.startswith('INDEX RANGE SCAN ')
+    assert values(scan, [0, 1, 2]) == [row for row in rows if 100 <= row[0] < 150]
+
+
+def test_included_fields_follow_updates(sql):
+    sql("CREATE TABLE s(id INTEGER, name CHAR(10), k INTEGER)")
+    sql("INSERT INTO s VALUES " + ", ".join("(%d, 'n%d', %d)" % (i, i, i % 5) for i in range(50)))
+    sql("CREATE INDEX s_id ON s(id) INCLUDE (name)")
+    # UPDATE changes the first matching record
+    for i in (2, 7, 22):
+        sql("UPDATE s SET name = 'changed' WHERE id = %d" % i)
+    sql("DELETE FROM s WHERE id = 3")
+    sql("INSERT INTO s VALUES (100, 'new', 0)")
+    expected = {i: 'changed' if i in (2, 7, 22) else 'n%d' % i for i in range(50) if i != 3}
+    expected[100] = 'new'
+    for i in (2, 3, 7, 8, 100):
+        assert sql("SELECT name FROM s WHERE id = %d" % i) == ([[expected[i]]] if i in expected else [])
+    got = sql("SELECT id, name FROM s WHERE id >= 5 AND id < 20")
+    assert sorted((int(i), name) for i, name in got) == sorted(
+        (i, name) for i, name in expected.items() if 5 <= i < 20)
@@ -0,0 +1,222 @@
+# ------------------------------------------------
+# test_query_plan_db.py
+# ------------------------------------------------
+# query execution: compiled WHERE conditions, joins
+# ------------------------------------------------
+
+import itertools
+import random
+
+import pytest
+
+import extsort_db
+import index_db
+import query_plan_db
+
+# ------------------------------------------------
+# compiled conditions
+# ------------------------------------------------
+
+class Untouchable(object):
+    # a field value that must not be compared
+    def __eq__(self, other):
+        raise AssertionError('compared')
+    __ne__ = __lt__ = __le__ = __gt__ = __ge__ = __eq__
+
+
+def test_compiled_comparisons():
+    records = [(i, b'n%d' % (i % 3), i % 2 == 0) for i in range(12)]
+    for op in query_plan_db.COMPARE_OPS:
+        compare = query_plan_db.COMPARE_OPS[op]
+        matches = query_plan_db.compile_conditions(1, [(0, 0, 2, op, 5)])
+        assert [r for r in records if matches(r)] == [r for r in records if compare(r[0], 5)]
+    matches = query_plan_db.compile_conditions(1, [(0, 1, 0, '<>', 'n1'), (0, 2, 3, '=', True)])
+    assert [r[0] for r in records if matches(r)] == [0, 2, 6, 8]
+    assert query_plan_db.compile_conditions(1, [])((1,))
+
+
+def test_and_checks_selective_condition_first():
+    # = rejects the record before <> would compare the untouchable value
+    matches = query_plan_db.compile_conditions(1, [(0, 0, 2, '<>', 1), (0, 1, 2, '=', 1)])
+    assert not matches((Untouchable(), 2))
+
+
+def test_or_checks_likely_branch_first():
+    # <> accepts the record before = would compare the untouchable value
+    matches = query_plan_db.compile_conditions(1, [], [], [
+        [([(0, 0, 2, '=', 1)], [], []), ([(0, 1, 2, '<>', 1)], [], [])]])
+    assert matches((Untouchable(), 2))
+
+
+def test_string_constant_with_quotes():
+    matches = query_plan_db.compile_conditions(1, [(0, 0, 0, '=', "it's \\ \"x\"")])
+    assert matches(("it's \\ \"x\"".encode('utf-8'),))
+    assert not matches((b'its',))
+
+
+def test_column_conditions_of_rows():
+    rows = [[(a, b'x'), (b, 3)] for a in range(4) for b in range(4)]
+    matches = query_plan_db.compile_conditions(2, [(1, 1, 2, '=', 3)], [(0, 0, 2, '<', 1, 0)])
+    assert [(row[0][0], row[1][0]) for row in rows if matches(row)] == \
+        [(a, b) for a in range(4) for b in range(4) if a < b]
+    # a string field is compared with the text of the other field
+    mixed = query_plan_db.compile_conditions(2, [], [(0, 1, 0, '=', 1, 1)])
+    assert mixed([(0, b'3'), (0, 3)])
+    assert not mixed([(0, b'x'), (0, 3)])
+    # values that cannot be ordered never match
+    ordered = query_plan_db.compile_conditions(2, [], [(0, 1, 2, '<', 1, 1)])
+    assert not ordered([(0, 3), (0, b'x')])
+
+
+def test_random_predicates_against_python():
+    random.seed(7)
+    records = [(random.randint(0, 9), random.randint(0, 9), b'n%d' % random.randint(0, 3)) for _ in range(300)]
+    ops = list(query_plan_db.COMPARE_OPS)
+
+    def random_branch(depth):
+        conditions = [(0, fi, 2, random.choice(ops), random.randint(0, 9)) for fi in random.sample([0, 1], random.randint(0, 2))]
+        if random.random() < 0.5:
+            conditions.append((0, 2, 0, random.choice(['=', '<>']), 'n%d' % random.randint(0, 3)))
+        column_conditions = [(0, 0, 2, random.choice(ops), 0, 1)] if random.random() < 0.3 else []
+        or_conditions = []
+        if depth and random.random() < 0.6:
+            or_conditions.append([random_branch(depth - 1) for _ in range(random.randint(2, 3))])
+        return conditions, column_conditions, or_conditions
+
+    def evaluate(branch, r):
+        conditions, column_conditions, or_conditions = branch
+        compare = query_plan_db.COMPARE_OPS
+        value = lambda fi, param: param.encode('utf-8') if fi == 2 else param
+        return all(compare[op](r[fi], value(fi, param)) for _, fi, _, op, param in conditions) and \
+            all(compare[op](r[fi], r[other]) for _, fi, _, op, _, other in column_conditions) and \
+            all(any(evaluate(part, r) for part in branches) for branches in or_conditions)
+
+    for _ in range(200):
+        branch = random_branch(2)
+        matches = query_plan_db.compile_conditions(1, *branch)
+        assert [r for r in records if matches(r)] == [r for r in records if evaluate(branch, r)], branch
+
+# ------------------------------------------------
+# access paths
+# ------------------------------------------------
+
+def test_access_path_is_chosen_without_reading_indexes(make_table, monkeypatch):
+    table = make_table('s', [('id', 2, 10), ('name', 0, 12)], [(i, 'n%d' % (i % 10)) for i in range(500)])
+    assert index_db.Index('s', index_db.HASH_INDEX, debug=False, index_name='s_id').create_index('id')
+    assert index_db.Index('s', index_db.BTREE_INDEX, debug=False, index_name='s_name').create_index('name')
+    opened = []
+    real_init = index_db.Index.__init__
+
+    def counting_init(self, *args, **kwargs):
+        opened.append(kwargs.get('index_name'))
+        real_init(self, *args, **kwargs)
+    monkeypatch.setattr(index_db.Index, '__init__', counting_init)
+
+    scan, path = query_plan_db.access_table(table, [(0, 2, '=', 42)])
+    assert path == 'INDEX LOOKUP s.s_id.hash (id = 42)'
+    ranged, range_path = query_plan_db.access_table(table, [(1, 0, '>=', 'n8')], needed={1})
+    assert range_path == 'INDEX ONLY SCAN s.s_name.ind (name)'
+    full, full_path = query_plan_db.access_table(table, [(0, 2, '<', 3)])
+    assert full_path == 'TABLE SCAN s (zone map)'
+    assert opened == []
+    assert list(scan) == [(42, b'n2')]
+    assert opened == ['s_id']
+    assert sorted(set(record[1] for record in ranged)) == [b'n8', b'n9']
+    assert opened == ['s_id', 's_name']
+
+# ------------------------------------------------
+# WHERE with OR, <> and parentheses
+# ------------------------------------------------
+
+def test_where_or_and_not_equal(sql):
+    sql("CREATE TABLE s(id INTEGER, name CHAR(10), k INTEGER)")
+    rows = [(i, 'n%d' % (i % 4), i % 7) for i in range(40)]
+    sql("INSERT INTO s VALUES " + ", ".join("(%d, '%s', %d)" % row for row in rows))
+    cases = [
+        ("id < 5 OR k = 3", lambda i, n, k: i < 5 or k == 3),
+        ("(id < 10 OR k = 3) AND name <> 'n1'", lambda i, n, k: (i < 10 or k == 3) and n != 'n1'),
+        ("id != 5 AND id < 8", lambda i, n, k: i != 5 and i < 8),
+        ("id < 20 AND (k = 1 OR (k = 2 AND name = 'n2') OR name = 'n0')",
+         lambda i, n, k: i < 20 and (k == 1 or (k == 2 and n == 'n2') or n == 'n0')),
+        ("id > k OR k >= 5", lambda i, n, k: i > k or k >= 5),
+    ]
+    for where, expected in cases:
+        got = sorted(int(row[0]) for row in sql("SELECT id FROM s WHERE " + where))
+        assert got == [i for i, n, k in rows if expected(i, n, k)], where
+
+
+def test_names_starting_with_keywords(sql):
+    sql("CREATE TABLE s(vacuumed INTEGER, betweener INTEGER)")
+    sql("INSERT INTO s VALUES " + ", ".join("(%d, %d)" % (i, i * 10) for i in range(10)))
+    got = sql("SELECT vacuumed, betweener FROM s WHERE vacuumed BETWEEN 3 AND 5")
+    assert sorted(map(tuple, got)) == [('3', '30'), ('4', '40'), ('5', '50')]
+
+# ------------------------------------------------
+# joins
+# ------------------------------------------------
+
+def brute_force_join(tables, column_conditions):
+    rows = (list(row) for row in itertools.product(*tables))
+    return sorted(map(repr, query_plan_db.filter_records(rows, len(tables), [], column_conditions)))
+
+
+@pytest.mark.parametrize('hash_join_rows', [100000, 3])
+def test_join_tables_against_cross_product(workdir, monkeypatch, hash_join_rows):
+    # with few rows allowed in a hash table, the joins are sorted and merged
+    monkeypatch.setattr(query_plan_db, 'HASH_JOIN_ROWS', hash_join_rows)
+    monkeypatch.setattr(query_plan_db, 'SORT_BATCH', 2)
+    monkeypatch.setattr(extsort_db, 'SORT_MEMORY', 300)
+    random.seed(1)
+    fields = [[('a', 2), ('b', 0), ('c', 2)]] * 3
+    for _ in range(150):
+        tables = [[[random.randint(0, 4), b'x%d  ' % random.randint(0, 3), random.randint(0, 9)]
+                   for _ in range(random.randint(0, 12))] for _ in range(3)]
+        conditions = []
+        for _ in range(random.randint(0, 4)):
+            ti, other = random.randrange(3), random.randrange(3)
+            fi, other_fi = random.choice([(0, 0), (0, 2), (2, 0), (2, 2), (1, 1)])
+            conditions.append((ti, fi, fields[ti][fi][1], random.choice(['=', '=', '<']), other, other_fi))
+        for table_num in (2, 3):
+            used = [c for c in conditions if c[0] < table_num and c[4] < table_num]
+            rows, remaining, joins = query_plan_db.join_tables(
+                [iter(table) for table in tables[:table_num]], used, ['r', 's', 't'][:table_num], fields[:table_num])
+            got = sorted(map(repr, query_plan_db.filter_records(rows, table_num, [], remaining)))
+            assert got == brute_force_join(tables[:table_num], used), (used, joins)
+
+
+def test_merge_join_matches_hash_join(make_table):
+    fields = [('id', 2, 10), ('k', 2, 10)]
+    r_rows = [(i, (i * 7) % 23) for i in range(200)]
+    s_rows = [(i, i % 31) for i in range(150)] + [(-1, 5)] * 3
+    tables = [make_table('r', fields, r_rows), make_table('s', fields, s_rows)]
+    for name in ('r', 's'):
+        assert index_db.Index(name, index_db.BTREE_INDEX, debug=False).create_index('k')
+    field_lists = [table.getFieldList() for table in tables]
+    conditions = [(0, 1, 2, '=', 1, 1), (0, 0, 2, '<', 1, 0)]
+
+    def join(ordered_scan):
+        rows, remaining, joins = query_plan_db.join_tables(
+            [query_plan_db.Scan(table) for table in tables], conditions, ['r', 's'], field_lists, ordered_scan)
+        return sorted(map(repr, query_plan_db.filter_records(rows, 2, [], remaining))), joins
+
+    merged, joins = join(lambda ti, fi: query_plan_db.ordered_access(tables[ti], fi, []))
+    assert joins == ['MERGE JOIN r.k = s.k']
+    hashed, joins = join(None)
+    assert joins == ['HASH JOIN r.k = s.k']
+    expected = brute_force_join([list(tables[0].scan()), list(tables[1].scan())], conditions)
+    assert merged == hashed == expected
+    assert len(expected) > 100
+
+
+def test_join_statements(sql):
+    sql("CREATE TABLE s(id INTEGER, name CHAR(10))")
+    sql("CREATE TABLE t(sid INTEGER, v INTEGER)")
+    sql("INSERT INTO s VALUES " + ", ".join("(%d, 'n%d')" % (i, i) for i in range(60)))
+    sql("INSERT INTO t VALUES " + ", ".join("(%d, %d)" % (i % 80, i) for i in range(200)))
+    expected = sorted(('n%d' % (v % 80), str(v)) for v in range(200) if v % 80 < 60 and v > 20)
+    statement = "SELECT s.name, t.v FROM s, t WHERE s.id = t.sid AND t.v > 20"
+    assert sorted(map(tuple, sql(statement))) == expected
+    # the same rows from a merge join over the B-trees
+    sql("CREATE INDEX s_id ON s(id)")
+    sql("CREATE INDEX t_sid ON t(sid) INCLUDE (v)")
+    assert sorted(map(tuple, sql(statement))) == expected
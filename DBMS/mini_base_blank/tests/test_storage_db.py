@@ -0,0 +1,203 @@
+# ------------------------------------------------
+# test_storage_db.py
+# ------------------------------------------------
+# table files: block 0 of wide tables, format upgrade, and the indexes kept in step with the data
+# ------------------------------------------------
+
+import os
+
+import pytest
+
+import codec_db
+import index_db
+import query_plan_db
+import storage_db
+
+FIELDS = [('id', 2, 10), ('name', 0, 12), ('ok', 3, 5)]
+
+
+def live_rids(storage_obj):
+    # {(block_id, offset): record} of the records of a table
+    rids = {}
+    for block_id in range(1, storage_obj.data_block_num + 1):
+        buf = storage_obj.buffer_manager.read_block(storage_obj.file_name, block_id)
+        for slot, record in storage_obj.codec.decode_block(buf):
+            offset = codec_db.SLOT.unpack_from(buf, codec_db.BLOCK_HEAD.size + slot * codec_db.SLOT.size)[0]
+            rids[(block_id, offset)] = record
+    return rids
+
+
+
+
+def test_get_record_returns_a_list(make_table):
+    table = make_table('s', FIELDS, [(i, 'n%d' % i, True) for i in range(5)])
+    records = table.getRecord()
+    assert isinstance(records, list) and len(records) == 5
+    assert records[2] == (2, b'n2', True)
+
+@pytest.mark.parametrize('field_num, row_num', [(16, 200), (storage_db.MAX_FIELD_NUM, 16)])
+def test_wide_table(make_table, field_num, row_num):
+    # the field entries, the free space map and the format version share block 0
+    fields = [('f%d' % i, 2 if i % 2 else 0, 6) for i in range(field_num)]
+    rows = [['r%d' % n if i % 2 == 0 else n * i for i in range(field_num)] for n in range(row_num)]
+    table = make_table('w', fields, rows)
+    table.buffer_manager.flush_file(table.file_name)
+    reopened = storage_db.Storage(b'w')
+    assert [(name.decode('utf-8').strip(), field_type, length)
+            for name, field_type, length in reopened.getFieldList()] == fields
+    assert reopened.format_version == codec_db.CURRENT_FORMAT
+    block_num = reopened.data_block_num
+    assert 1 < block_num <= reopened.fsm_capacity
+    freed = 0
+    for position, record in list(reopened.scan(with_position=True)):
+        if record[1] % 3 == 0:
+            reopened._delete_at(position)
+            freed += 1
+    # the freed slots are found through the free space map
+    assert reopened.insert_many([[str(value) for value in row] for row in rows[:freed]])
+    assert reopened.data_block_num == block_num
+    assert sorted(record[1] for record in reopened.scan()) == \
+        sorted([n for n in range(row_num) if n % 3] + list(range(freed)))
+
+
+def test_too_many_fields(make_table):
+    with pytest.raises(ValueError):
+        make_table('w', [('f%d' % i, 2, 6) for i in range(storage_db.MAX_FIELD_NUM + 1)])
+    assert not os.path.exists('w.dat')
+
+def test_upgrade_v1_table(make_table, monkeypatch):
+    monkeypatch.setattr(storage_db, 'CURRENT_FORMAT', codec_db.FORMAT_V1)
+    old = make_table('s', FIELDS, [(i, 'n%d' % i, i % 2 == 0) for i in range(1500)])
+    assert old.format_version == codec_db.FORMAT_V1
+    for position, record in list(old.scan(with_position=True)):
+        if record[0] % 5 == 0:
+            old._delete_at(position)  # leave tombstones behind
+    old.buffer_manager.flush_file(old.file_name)
+    index_obj = index_db.Index('s', index_db.BTREE_INDEX, debug=False)
+    assert index_obj.create_index('id')
+    old_rids = live_rids(old)
+    monkeypatch.setattr(storage_db, 'CURRENT_FORMAT', codec_db.FORMAT_V2)
+
+    moves = old.upgrade_format()
+    assert old.format_version == codec_db.FORMAT_V2
+    assert not os.path.exists('s.dat.tmp')
+    new = storage_db.Storage(b's')
+    assert new.format_version == codec_db.FORMAT_V2
+    assert new.data_block_num == old.data_block_num
+    new_rids = live_rids(new)
+    assert sorted(moves) == sorted(old_rids)
+    assert {moves[rid]: record for rid, record in old_rids.items()} == new_rids
+    assert sorted(new_rids.values()) == sorted((i, b'n%d' % i, i % 2 == 0) for i in range(1500) if i % 5)
+    index_obj = index_db.Index('s', index_db.BTREE_INDEX, debug=False)
+    for rid, record in new_rids.items():
+        assert rid in index_obj.lookup(index_obj.key_of(record))
+    assert new.upgrade_format() is None
+
+
+def test_failed_upgrade_keeps_the_table(make_table, monkeypatch):
+    monkeypatch.setattr(storage_db, 'CURRENT_FORMAT', codec_db.FORMAT_V1)
+    old = make_table('s', FIELDS, [(i, 'n%d' % i, True) for i in range(100)])
+    monkeypatch.setattr(storage_db, 'CURRENT_FORMAT', codec_db.FORMAT_V2)
+
+    def fail(codec, record):
+        raise ValueError('encoding failed')
+    monkeypatch.setattr(codec_db.TableCodec, 'encode', fail)
+    with pytest.raises(ValueError):
+        old.upgrade_format()
+    assert old.format_version == codec_db.FORMAT_V1
+    assert not os.path.exists('s.dat.tmp')
+    assert len(list(storage_db.Storage(b's').scan())) == 100
+
+
+def check_indexes(storage_obj, values, ids):
+    # every maintained index of the table holds exactly the rids of the live records;
+    # values are all the ids ever written, so that removed keys are checked too,
+    # ids are those the table must hold
+    rids = live_rids(storage_obj)
+    assert sorted(record[0] for record in rids.values()) == sorted(ids)
+    index_objs = [index_obj for index_obj in index_db.open_table_indexes('s') if index_obj.maintained]
+    assert len(index_objs) == 2
+    for index_obj in index_objs:
+        expected = {}
+        for rid, record in rids.items():
+            expected.setdefault(index_obj.key_of(record), []).append(rid)
+        for value in values:
+            key = index_obj.key_from_values([value])
+            assert index_obj.lookup(key) == sorted(expected.get(key, [])), (index_obj.index_name, value)
+        if index_obj.index_type == index_db.BTREE_INDEX:
+            assert len(list(index_obj.range_search())) == len(rids)
+
+
+def test_indexes_follow_every_write(make_table, capsys):
+    table = make_table('s', FIELDS, [(i, 'n%d' % i, True) for i in range(0, 600, 2)])
+    for index_type, index_name in [(index_db.BTREE_INDEX, 's_id'), (index_db.HASH_INDEX, 's_id_hash')]:
+        assert index_db.Index('s', index_type, debug=False, index_name=index_name).create_index('id')
+    values = list(range(-5, 1300))
+    ids = list(range(0, 600, 2))
+    check_indexes(table, values, ids)
+
+    table.insert_record(['1', 'one', 'false'])
+    table.insert_many([[str(i), 'n%d' % i, 'true'] for i in range(601, 1200, 2)])
+    ids += [1] + list(range(601, 1200, 2))
+    check_indexes(table, values, ids)
+
+    for value in range(0, 1000, 3):
+        table.delete_record_by_field('id', str(value))
+    ids = [value for value in ids if value % 3 or value >= 1000]
+    check_indexes(table, values, ids)
+
+    for value in range(1, 300, 7):
+        table.update_record_by_field('id', str(value), 'id', str(value + 1000))
+    ids = [value + 1000 if value in range(1, 300, 7) else value for value in ids]
+    table.update_record_by_field('name', 'one', 'ok', 'true')  # another field, the keys stay
+    check_indexes(table, values, ids)
+
+    # records inserted after the deletes fill the freed slots
+    table.insert_many([[str(-i), 'neg', 'false'] for i in range(1, 6)])
+    ids += [-i for i in range(1, 6)]
+    check_indexes(table, values, ids)
+
+    stats = query_plan_db.vacuum_table('s')
+    assert stats['moved'] > 0 and stats['blocks_after'] < stats['blocks_before']
+    check_indexes(storage_db.Storage(b's'), values, ids)
+
+
+def test_vacuum_builds_old_index_files_again(make_table, capsys):
+    table = make_table('s', FIELDS, [(i, 'n%d' % i, True) for i in range(1200)])
+    index_obj = index_db.Index('s', index_db.BTREE_INDEX, debug=False)
+    assert index_obj.create_index('id')
+    index_obj.flush()
+    # make the file look like one written before version 4
+    header = bytearray(index_obj.buffer_manager.read_block(index_obj.index_file, 0))
+    fields = list(index_db.INDEX_HEAD.unpack_from(header, 0))
+    fields[5] = 3
+    index_db.INDEX_HEAD.pack_into(header, 0, *fields)
+    index_obj.buffer_manager.write_block(index_obj.index_file, 0, header)
+    index_obj.buffer_manager.flush_file(index_obj.index_file)
+    index_db._forget_nodes(index_obj.index_file)
+    assert not index_db.Index('s', index_db.BTREE_INDEX, debug=False).maintained
+    for position, record in list(table.scan(with_position=True)):
+        if record[0] < 900:
+            table._delete_at(position)
+    table.buffer_manager.flush_file(table.file_name)
+
+    stats = query_plan_db.vacuum_table('s')
+    assert stats['moved'] > 0
+    assert 'built again' in capsys.readouterr().out
+    rebuilt = index_db.Index('s', index_db.BTREE_INDEX, debug=False)
+    assert rebuilt.maintained
+    rids = {record[0]: rid for rid, record in live_rids(storage_db.Storage(b's')).items()}
+    assert len(rids) == 300
+    for value in (0, 899, 900, 1000, 1199):
+        assert rebuilt.lookup(rebuilt.key_from_values([value])) == ([rids[value]] if value in rids else [])
+
+
+def test_integer_out_of_range(make_table, capsys):
+    table = make_table('s', FIELDS)
+    for value in (2 ** 63, -2 ** 63 - 1, 10 ** 20):
+        assert not table.insert_record([str(value), 'x', 'true'])
+        assert not table.insert_many([['1', 'y', 'true'], [str(value), 'x', 'true']])
+    assert 'out of range' in capsys.readouterr().out
+    assert table.insert_many([[str(2 ** 63 - 1), 'max', 'true'], [str(-2 ** 63), 'min', 'false']])
+    assert not table.update_record_by_field('name', 'max', 'id', str(2 ** 63))
+    assert sorted(record[0] for record in table.scan()) == [-2 ** 63, 2 ** 63 - 1]
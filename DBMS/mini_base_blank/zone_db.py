@@ -0,0 +1,211 @@
+# ------------------------------------------------
+# zone_db.py
+# ------------------------------------------------
+# Zone map module
+# A zone map keeps, for every data block of a table, the minimum and the
+# maximum value of every field, so that scans with equality or range
+# predicates can skip the blocks that cannot hold a matching record
+# ------------------------------------------------
+# the zone map of table t is stored in the sidecar file t.zone
+# block 0: magic|number_of_fields|field types          # '!4si' + one byte per field
+# from BLOCK_SIZE on, one entry per data block (block_id 1, 2, ...):
+# state|min_0|max_0|min_1|max_1|...|min_n|max_n       # '!B' + 8 bytes per value
+# ------------------------------------------------
+# the values are kept as normalized 8 byte prefixes which compare with memcmp
+# in the same order as the values: integers are sign flipped big endian,
+# strings are their first 8 bytes. A prefix can only tell that a value is out
+# of range, so the comparisons never skip a block that could match
+# ------------------------------------------------
+# the ranges are widened when records are written and left as they are when
+# records are deleted, so they are always a superset of the block content
+# ------------------------------------------------
+
+import os
+import struct
+from common_db import BLOCK_SIZE
+from buffer_db import global_buffer_manager
+from codec_db import to_bool
+
+ZONE_MAGIC = b'ZON1'
+
+ZONE_UNKNOWN = 0  # no summary for the block, it must be read
+ZONE_VALID = 1    # the min/max of the block are known
+ZONE_EMPTY = 2    # the block holds no record
+
+# ------------------------------------------------
+# the normalized 8 byte prefix of a field value
+# Input:
+#       value: the decoded field value (int, bool, bytes or str)
+#       field_type: 0 -> str, 1 -> varstr, 2 -> int, 3 -> boolean
+# Output:
+#       bytes of length 8
+# ------------------------------------------------
+def normalize(value, field_type):
+    if field_type == 3 or isinstance(value, bool):
+        return struct.pack('!Q', 1 if to_bool(value) else 0)
+    if field_type == 2:
+        value = max(-2 ** 63, min(2 ** 63 - 1, int(value)))
+        return struct.pack('!Q', value + 2 ** 63)  # sign flipped
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return value.strip()[:8].ljust(8, b'\x00')
+
+# ------------------------------------------------
+# whether a value range can hold a value satisfying "value op constant"
+# Input:
+#       low, high: normalized prefixes of the minimum and the maximum
+#       op: one of '=', '<', '<=', '>', '>='
+#       key: normalized prefix of the constant
+# ------------------------------------------------
+def range_may_match(low, high, op, key):
+    if op == '=':
+        return low <= key <= high
+    if op == '<' or op == '<=':
+        return low <= key
+    if op == '>' or op == '>=':
+        return high >= key
+    return True  # unknown operator, the block is read
+
+# ------------------------------------------------
+# Zone map class
+# Functionality:
+#   - build the zone map of a table
+#   - widen or reset the summary of a block when it is modified
+#   - tell whether a block may hold records matching a list of conditions
+# ------------------------------------------------
+class ZoneMap(object):
+
+    # ------------------------------------------------
+    # Constructor
+    # Input:
+    #       tablename: name of the table (str)
+    #       field_list: list of (field_name, field_type, field_length)
+    # ------------------------------------------------
+    def __init__(self, tablename, field_list):
+        self.file_name = tablename.strip() + '.zone'
+        self.field_types = [field[1] for field in field_list]
+        self.entry_size = 1 + 16 * len(self.field_types)
+        self.buffer_manager = global_buffer_manager
+        self.header = struct.pack('!4si', ZONE_MAGIC, len(self.field_types)) + bytes(self.field_types)
+        self.available = False
+        if os.path.exists(self.file_name):
+            self.available = self.buffer_manager.read_bytes(self.file_name, 0, len(self.header)) == self.header
+
+    def _entry_pos(self, block_id):
+        return BLOCK_SIZE + (block_id - 1) * self.entry_size
+
+    # ------------------------------------------------
+    # read the summary of a block
+    # Output:
+    #       (state, list of (low, high) per field)
+    # ------------------------------------------------
+    def read_entry(self, block_id):
+        data = self.buffer_manager.read_bytes(self.file_name, self._entry_pos(block_id), self.entry_size)
+        ranges = [(data[1 + 16 * i:9 + 16 * i], data[9 + 16 * i:17 + 16 * i]) for i in range(len(self.field_types))]
+        return data[0], ranges
+
+    def _write_entry(self, block_id, state, ranges):
+        data = bytearray([state])
+        for low, high in ranges:
+            data += low + high
+        self.buffer_manager.write_bytes(self.file_name, self._entry_pos(block_id), data)
+
+    # ------------------------------------------------
+    # start an empty zone map, the summaries of all the blocks are unknown
+    # ------------------------------------------------
+    def clear(self):
+        self.buffer_manager.truncate_file(self.file_name, 0)
+        self.buffer_manager.write_bytes(self.file_name, 0, self.header)
+        self.available = True
+
+    # ------------------------------------------------
+    # build the zone map from the data blocks of a table
+    # Input:
+    #       storage_obj: the Storage object of the table
+    # ------------------------------------------------
+    def build(self, storage_obj):
+        self.clear()
+        for block_id in range(1, storage_obj.data_block_num + 1):
+            buf = storage_obj.buffer_manager.view_block(storage_obj.file_name, block_id)
+            try:
+                records = [record for _, record in storage_obj.codec.decode_block(buf)]
+            finally:
+                buf.release()
+            self.summarize(block_id, records)
+        self.flush()
+
+    # ------------------------------------------------
+    # set the exact summary of a block
+    # Input:
+    #       block_id: the data block
+    #       records: all the records of the block
+    # ------------------------------------------------
+    def summarize(self, block_id, records):
+        if not self.available:
+            return
+        self._write_entry(block_id, ZONE_EMPTY, [(b'\x00' * 8, b'\x00' * 8)] * len(self.field_types))
+        self.widen(block_id, records)
+
+    # ------------------------------------------------
+    # mark a block that holds no record yet, used when a block is allocated or emptied
+    # ------------------------------------------------
+    def reset(self, block_id):
+        self.summarize(block_id, [])
+
+    # ------------------------------------------------
+    # widen the summary of a block with records written into it
+    # a block whose summary is unknown stays unknown
+    # ------------------------------------------------
+    def widen(self, block_id, records):
+        if not self.available or not records:
+            return
+        state, ranges = self.read_entry(block_id)
+        if state == ZONE_UNKNOWN:
+            return
+        for record in records:
+            keys = [normalize(value, field_type) for value, field_type in zip(record, self.field_types)]
+            if state == ZONE_EMPTY:
+                ranges = [(key, key) for key in keys]
+                state = ZONE_VALID
+            else:
+                ranges = [(min(low, key), max(high, key)) for (low, high), key in zip(ranges, keys)]
+        self._write_entry(block_id, state, ranges)
+
+    # ------------------------------------------------
+    # whether a block may hold records matching all the conditions
+    # Input:
+    #       block_id: the data block
+    #       conditions: list of (field_index, op, value)
+    # Output:
+    #       False only if no record of the block can match
+    # ------------------------------------------------
+    def may_match(self, block_id, conditions):
+        if not self.available:
+            return True
+        state, ranges = self.read_entry(block_id)
+        if state == ZONE_EMPTY:
+            return False
+        if state != ZONE_VALID:
+            return True
+        for field_index, op, value in conditions:
+            low, high = ranges[field_index]
+            try:
+                key = normalize(value, self.field_types[field_index])
+            except (TypeError, ValueError):
+                continue  # not comparable with the field, no decision
+            if not range_may_match(low, high, op, key):
+                return False
+        return True
+
+    def flush(self):
+        if self.available:
+            self.buffer_manager.flush_file(self.file_name)
+
+    # ------------------------------------------------
+    # remove the zone map file, used when the table is dropped or recreated
+    # ------------------------------------------------
+    def drop(self):
+        self.buffer_manager.drop_file(self.file_name)
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+        self.available = False